@@ -6,10 +6,17 @@ import os
 DB_ERROR = False
 try:
     import liatris_db
+    liatris_db.get_engine()
 except:
     DB_ERROR = True
 
 import liatris_version
+import liatris_autosave
+import liatris_backup
+import liatris_worker
+import liatris_store
+import liatris_profile
+import liatris_changes
 from models.liatris_model_settings import LiatrisSetting
 from models.liatris_model_tasks import LiatrisTask
 from models.liatris_model_items import LiatrisItem
@@ -17,12 +24,14 @@ from models.liatris_model_itemnotes import LiatrisItemNote
 
 from datetime import timedelta
 from datetime import date
+from datetime import datetime
 from copy import copy as copy
 
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 from gi.repository import Gdk
+from gi.repository import GLib
 
 import warnings
 
@@ -47,9 +56,28 @@ class DbSettingsDefaults:
         enable_monospace.Key = "ENABLEMONOSPACE"
         enable_monospace.Value = "0"
 
+        # Takes effect on the next start, see liatris_db.STORAGE_PROFILES
+        storage_profile = LiatrisSetting()
+        storage_profile.Key = "STORAGEPROFILE"
+        storage_profile.Value = liatris_db.DEFAULT_STORAGE_PROFILE
+
+        # Completed items are moved to the archive database after this many days, 0 keeps them, see
+        # liatris_db.LiatrisSQLCore.Archive
+        archive_after_days = LiatrisSetting()
+        archive_after_days.Key = "ARCHIVEAFTERDAYS"
+        archive_after_days.Value = "30"
+
+        # Number of daily snapshots kept by the automatic backups, 0 turns them off, see liatris_backup
+        backup_keep = LiatrisSetting()
+        backup_keep.Key = "BACKUPKEEP"
+        backup_keep.Value = str(liatris_backup.BACKUP_KEEP)
+
         self.DEFAULTSETTINGS.append(upcoming_th)
         self.DEFAULTSETTINGS.append(enable_nums)
         self.DEFAULTSETTINGS.append(enable_monospace)
+        self.DEFAULTSETTINGS.append(storage_profile)
+        self.DEFAULTSETTINGS.append(archive_after_days)
+        self.DEFAULTSETTINGS.append(backup_keep)
         self.check_presence(self.DEFAULTSETTINGS)
 
     def check_presence(self, default_settings):
@@ -81,14 +109,37 @@ class Main:
 
             exit(1)
 
+        # Only records statements when LIATRIS_SQL_PROFILE is set
+        liatris_profile.install()
+
         DbSettingsDefaults()
 
+        # Tasks and item states are kept in memory, changes go through the store which announces what changed
+        store = liatris_store.LiatrisStore(
+            liatris_db.LiatrisSQLCore.Settings.get_setting_by_key("UPCOMINGTHRESHOLD").Value)
+
+        # Slow reads run on worker threads, their results are handed back to the GTK main loop
+        db_worker = liatris_worker.LiatrisDbWorker(GLib.idle_add)
+
+        # Note edits are written to the database in batches, write what a previous session left unsaved
+        note_autosave = liatris_autosave.LiatrisNoteAutosave()
+        note_autosave.recover()
+
         self.builder = Gtk.Builder()
 
         self.builder.add_from_file("liatris.glade")
 
         main_window = self.builder.get_object("MainWindow")
-        main_window.connect("delete-event", Gtk.main_quit)
+
+        def quit_trigger(*args):
+            flush_item_notes()
+            change_monitor.stop()
+            db_worker.shutdown()
+            if liatris_profile.ENABLED:
+                liatris_profile.write_report()
+            Gtk.main_quit()
+
+        main_window.connect("delete-event", quit_trigger)
         main_window.set_title("Liatris")
         main_window.show_all()
 
@@ -114,20 +165,19 @@ class Main:
 
         task_close_button = self.builder.get_object("OnlyTaskCloseButton")
 
+        @liatris_profile.action
         def task_rename_ok_button_trigger(self):
             task = copy(task_view_header_bar.current_task)
             if task is not None:
                 task.TaskName = task_rename_entry.get_text().strip()
 
                 if task_rename_ok_button.get_sensitive():
-                    liatris_db.LiatrisSQLCore.Tasks.update_task(task)
+                    store.rename_task(task)
                 else:
                     call_ok_e_diag("Could not rename project.", "Error", "The provided project name was not valid.")
 
                 rename_project_cancel_trigger(self)
                 populate_project(task.TaskId)
-                projects_search_bar.set_text("")
-                load_tasks()
 
         def task_rename_entry_trigger(self):
             text = task_rename_entry.get_text()
@@ -162,6 +212,7 @@ class Main:
 
         task_rename_button.connect("clicked", rename_project_trigger)
 
+        @liatris_profile.action
         def mark_item_trigger(self):
             item = copy(self.item)
             if self.get_active():
@@ -169,19 +220,11 @@ class Main:
             else:
                 item.ItemIsDone = False
 
-            if hasattr(self, 'TaskItem'):
-                relevant_item = list(filter(lambda x: (x.ItemId == item.ItemId), self.TaskItem.Items))
-                if len(relevant_item) != 0:
-                    relevant_item = relevant_item[0]
-                    relevant_item.ItemIsDone = item.ItemIsDone
-
-                load_project_status_label(self.TaskItem)
-
-            liatris_db.LiatrisSQLCore.Items.update_item(item)
-            projects_search_bar.set_text("")
-            load_tasks()
+            # The store updates the counters of the sidebar and the project header
+            store.update_item(item)
 
         def load_blank_page():
+            cancel_task_tree_load()
             main_notebook.hide()
 
         def task_close_trigger(self):
@@ -192,12 +235,14 @@ class Main:
         def unload_blank_page():
             main_notebook.show()
 
+        @liatris_profile.action
         def populate_project_trigger(self, row):
             unload_blank_page()
             rename_project_cancel_trigger(self)
             main_notebook.set_current_page(0)
             populate_project(row.Id)
 
+        @liatris_profile.action
         def delete_project_trigger(self):
             e_diag = Gtk.MessageDialog(message_type=Gtk.MessageType.INFO, buttons=Gtk.ButtonsType.YES_NO,
                                        text="Do you wish to delete this project?")
@@ -205,16 +250,15 @@ class Main:
             e_diag.format_secondary_text("Once deleted, the project and all tasks within cannot be recovered.")
             if e_diag.run() == Gtk.ResponseType.YES:
                 e_diag.destroy()
-                liatris_db.LiatrisSQLCore.Tasks.delete_task(self.Id)
+                store.delete_task(self.Id)
                 load_blank_page()
-                projects_search_bar.set_text("")
-                load_tasks()
             else:
                 e_diag.destroy()
 
         only_task_header_delete_button = self.builder.get_object("OnlyTaskHeaderDeleteButton")
         only_task_header_delete_button.connect("clicked", delete_project_trigger)
 
+        @liatris_profile.action
         def delete_item_trigger(self):
             e_diag = Gtk.MessageDialog(message_type=Gtk.MessageType.INFO, buttons=Gtk.ButtonsType.YES_NO,
                                        text="Do you wish to delete this task?")
@@ -222,24 +266,17 @@ class Main:
             e_diag.format_secondary_text("Once deleted, the task cannot be recovered.")
             if e_diag.run() == Gtk.ResponseType.YES:
                 e_diag.destroy()
-                liatris_db.LiatrisSQLCore.Items.delete_item(self.Id)
+                store.delete_item(self.Id)
                 unload_blank_page()
                 rename_project_cancel_trigger(self)
                 main_notebook.set_current_page(0)
                 populate_project(self.PrjId)
-
-                # Remember to reload
-                projects_search_bar.set_text("")
-                load_tasks()
             else:
                 e_diag.destroy()
 
         project_status_label = self.builder.get_object("OnlyTaskHeaderStatusLabel")
 
-        def load_project_status_label(task_item):
-            total_items = len(task_item.ITEMS)
-            total_finished_items = len(list(filter(lambda x: x.ItemIsDone is True, task_item.ITEMS)))
-
+        def load_project_status_label(total_finished_items, total_items):
             if total_finished_items == total_items and total_finished_items != 0 and total_items != 0:
                 project_status_label.override_color(Gtk.StateFlags.NORMAL, Gdk.RGBA(0.20, 0.90, 0.20, 1.0))
             else:
@@ -248,72 +285,86 @@ class Main:
 
             project_status_label.set_text(str(total_finished_items) + "/" + str(total_items))
 
+        @liatris_profile.action
         def populate_project(TaskId):
+            cancel_task_tree_load()
             task_item = liatris_db.LiatrisSQLCore.Tasks.produce_task_item_by_task_id(TaskId)
             task_view_header_bar.TaskItem = task_item
             task_view_header_bar.current_task = task_item.TASK
             only_task_header_delete_button.Id = task_item.TASK.TaskId
             task_name_label.set_text(task_view_header_bar.current_task.TaskName)
-            load_project_status_label(task_item)
+            load_project_status_label(len(list(filter(lambda x: x.ItemIsDone is True, task_item.ITEMS))),
+                                      len(task_item.ITEMS))
 
             for child in task_main_list_box.get_children():
                 child.destroy()
 
             task_item.ITEMS = sorted(task_item.ITEMS, key=lambda x: (x.ItemDate is None, x.ItemDate))
             task_item.ITEMS.reverse()
+            note_lengths = get_note_lengths([task_item])
 
             for item in task_item.ITEMS:
                 if item.ItemIsDone:
                     continue
 
-                row = Gtk.ListBoxRow()
-                hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=100)
-                hbox.set_margin_top(10)
-                hbox.set_margin_bottom(10)
-                row.add(hbox)
-                row.Id = item.ItemId
-                label = Gtk.Label()
-                label.set_text(str(item.ItemTitle))
-
-                check_button = Gtk.CheckButton()
-                check_button.item = item
-                check_button.task_item = task_item
-
-                check_button.connect("toggled", mark_item_trigger)
-
-                delete_button = Gtk.Button()
-                delete_button.Id = item.ItemId
-                delete_button.PrjId = TaskId
-                trash_icon = Gtk.Image()
-                trash_icon = trash_icon.new_from_icon_name("user-trash-symbolic", Gtk.IconSize.MENU)
-                delete_button.set_image(trash_icon)
-                delete_button.set_tooltip_text("Delete Task")
-                delete_button.set_always_show_image(True)
-                delete_button.set_relief(Gtk.ReliefStyle.NONE)
-                delete_button.connect("clicked", delete_item_trigger)
-                hbox.pack_start(check_button, False, False, 10)
-                hbox.pack_start(label, False, False, 10)
-                hbox.pack_end(delete_button, False, False, 10)
+                task_main_list_box.insert(build_project_item_row(item, task_item, note_lengths), 0)
+                task_main_list_box.show_all()
 
-                if item.ItemDate is not None:
-                    deadline_label = Gtk.Label()
-                    if item.ItemDate.date() < date.today():
-                        deadline_label.override_color(Gtk.StateFlags.NORMAL, Gdk.RGBA(0.85, 0.08, 0.25, 1.0))
-                        deadline_label.set_text(str(item.ItemDate.date()))
-                    else:
-                        deadline_label.set_text(str(item.ItemDate.date()))
-                    hbox.pack_end(deadline_label, False, False, 10)
+        # Returns the row of an open item in the project view
+        def build_project_item_row(item, task_item, note_lengths):
+            row = Gtk.ListBoxRow()
+            hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=100)
+            hbox.set_margin_top(10)
+            hbox.set_margin_bottom(10)
+            row.add(hbox)
+            row.Id = item.ItemId
+            label = build_item_title(item, note_lengths)
+
+            check_button = Gtk.CheckButton()
+            check_button.item = item
+            check_button.task_item = task_item
+
+            check_button.connect("toggled", mark_item_trigger)
+
+            delete_button = Gtk.Button()
+            delete_button.Id = item.ItemId
+            delete_button.PrjId = task_item.TASK.TaskId
+            trash_icon = Gtk.Image()
+            trash_icon = trash_icon.new_from_icon_name("user-trash-symbolic", Gtk.IconSize.MENU)
+            delete_button.set_image(trash_icon)
+            delete_button.set_tooltip_text("Delete Task")
+            delete_button.set_always_show_image(True)
+            delete_button.set_relief(Gtk.ReliefStyle.NONE)
+            delete_button.connect("clicked", delete_item_trigger)
+            hbox.pack_start(check_button, False, False, 10)
+            hbox.pack_start(label, False, False, 10)
+            hbox.pack_end(delete_button, False, False, 10)
+
+            if item.ItemDate is not None:
+                deadline_label = Gtk.Label()
+                if item.ItemDate.date() < date.today():
+                    deadline_label.override_color(Gtk.StateFlags.NORMAL, Gdk.RGBA(0.85, 0.08, 0.25, 1.0))
+                    deadline_label.set_text(str(item.ItemDate.date()))
+                else:
+                    deadline_label.set_text(str(item.ItemDate.date()))
+                hbox.pack_end(deadline_label, False, False, 10)
 
-                task_main_list_box.insert(row, 0)
-                task_main_list_box.show_all()
+            set_row_item(row, check_button, item, note_lengths)
+            return row
 
-            task_main_list_box.connect("row-activated", load_item_view)
+        # Remembers what a row shows of its item, changes written by other processes replace the rows that differ
+        def set_row_item(row, check_button, item, note_lengths):
+            row.CheckButton = check_button
+            row.ItemValues = (item.ItemTitle, item.ItemDate, item.ItemId in note_lengths)
+            # Rows of the project view are ordered by deadline, items without one come last
+            row.SortKey = (item.ItemDate is None, item.ItemDate if item.ItemDate is not None else datetime.min)
 
         # View in Logbook
 
+        @liatris_profile.action
         def only_task_logbook_button_trigger(self):
-            populate_task_items([task_view_header_bar.TaskItem],
-                                'Logbook for Project "' + str(task_view_header_bar.TaskItem.TASK.TaskName) + '"')
+            populate_logbook('Logbook for Project "' + str(task_view_header_bar.TaskItem.TASK.TaskName) + '"',
+                             task_view_header_bar.TaskItem.TASK.TaskId)
 
         only_task_logbook_button = self.builder.get_object("OnlyTaskLogbookButton")
         only_task_logbook_button.connect("clicked", only_task_logbook_button_trigger)
@@ -322,55 +373,60 @@ class Main:
 
         projects_list_box = self.builder.get_object("ProjectsSidebarListBox")
 
-        def filter_tasks(tasks):
-            real_tasks = []
-            for task in tasks:
-                if task.TaskName is not None and task.TaskId is not None:
-                    real_tasks.append(task)
-            return real_tasks
-
+        @liatris_profile.action
         def task_search_trigger(self):
             load_tasks(str(self.get_text()))
 
-        def load_tasks(search=None):
-            tasks = None
-            if search is None or search.strip() == "":
+        # Sidebar rows by TaskId, the store events update them one by one
+        sidebar_rows = {}
 
-                tasks = liatris_db.LiatrisSQLCore.Tasks.get_all_tasks()
+        def load_stats_label(stats_label, total_finished_items, total_items):
+            if total_finished_items == total_items and total_finished_items != 0 and total_items != 0:
+                stats_label.override_color(Gtk.StateFlags.NORMAL, Gdk.RGBA(0.20, 0.90, 0.20, 1.0))
             else:
-                tasks = liatris_db.LiatrisSQLCore.Tasks.search_tasks(search)
-            tasks = filter_tasks(tasks)
+                stats_label.override_color(Gtk.StateFlags.NORMAL, Gdk.RGBA(0.85, 0.08, 0.25, 1.0))
+
+            stats_label.set_text(str(total_finished_items) + "/" + str(total_items))
+
+        def add_sidebar_row(task):
+            total_finished_items, total_items = store.get_counters(task.TaskId)
+
+            row = Gtk.ListBoxRow()
+            hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+            hbox.set_margin_top(5)
+            hbox.set_margin_bottom(5)
+            row.add(hbox)
+            row.Id = task.TaskId
+            row.set_tooltip_text(str(task.TaskName))
+            label = Gtk.Label()
+            label.set_text(str(task.TaskName))
+
+            stats_label = Gtk.Label()
+            load_stats_label(stats_label, total_finished_items, total_items)
+
+            hbox.pack_start(label, False, False, 5)
+            hbox.pack_end(stats_label, False, False, 5)
+            row.NameLabel = label
+            row.StatsLabel = stats_label
+            sidebar_rows[task.TaskId] = row
+            projects_list_box.insert(row, 0)
+            projects_list_box.show_all()
+
+        @liatris_profile.action
+        def load_tasks(search=None):
+            tasks = store.get_tasks()
+            if search is not None and search.strip() != "":
+                found_tasks = liatris_db.LiatrisSQLCore.Tasks.search_tasks(search)
+                # A search that failed lists no projects, like a failed search of the tasks
+                found_task_ids = set(task.TaskId for task in found_tasks) if found_tasks else set()
+                tasks = [task for task in tasks if task.TaskId in found_task_ids]
 
             for child in projects_list_box.get_children():
                 child.destroy()
+            sidebar_rows.clear()
 
             for task in tasks:
-                items = liatris_db.LiatrisSQLCore.Tasks.produce_task_item_by_task_id(task.TaskId).ITEMS
-
-                total_items = len(items)
-                total_finished_items = len(list(filter(lambda x: x.ItemIsDone is True, items)))
-
-                row = Gtk.ListBoxRow()
-                hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
-                hbox.set_margin_top(5)
-                hbox.set_margin_bottom(5)
-                row.add(hbox)
-                row.Id = task.TaskId
-                row.set_tooltip_text(str(task.TaskName))
-                label = Gtk.Label()
-                label.set_text(str(task.TaskName))
-
-                stats_label = Gtk.Label()
-                if total_finished_items == total_items and total_finished_items != 0 and total_items != 0:
-                    stats_label.override_color(Gtk.StateFlags.NORMAL, Gdk.RGBA(0.20, 0.90, 0.20, 1.0))
-                else:
-                    stats_label.override_color(Gtk.StateFlags.NORMAL, Gdk.RGBA(0.85, 0.08, 0.25, 1.0))
-
-                stats_label.set_text(str(total_finished_items) + "/" + str(total_items))
-                hbox.pack_start(label, False, False, 5)
-                hbox.pack_end(stats_label, False, False, 5)
-                projects_list_box.insert(row, 0)
-                projects_list_box.show_all()
+                add_sidebar_row(task)
 
             if len(tasks) == 1 and search != None:
                 row = projects_list_box.get_row_at_index(0)
@@ -380,6 +436,38 @@ class Main:
             load_upcoming_nums()
             load_today_nums()
 
+        def sidebar_task_added_trigger(task):
+            search = projects_search_bar.get_text()
+            if search.strip() == "":
+                add_sidebar_row(task)
+            else:
+                load_tasks(search)
+
+        def sidebar_task_renamed_trigger(task):
+            if task.TaskId in sidebar_rows:
+                sidebar_rows[task.TaskId].NameLabel.set_text(str(task.TaskName))
+                sidebar_rows[task.TaskId].set_tooltip_text(str(task.TaskName))
+
+        def sidebar_task_deleted_trigger(task_id):
+            if task_id in sidebar_rows:
+                sidebar_rows.pop(task_id).destroy()
+
+        def counters_changed_trigger(task_id, total_finished_items, total_items):
+            if task_id in sidebar_rows:
+                load_stats_label(sidebar_rows[task_id].StatsLabel, total_finished_items, total_items)
+            if task_view_header_bar.current_task is not None and task_view_header_bar.current_task.TaskId == task_id:
+                load_project_status_label(total_finished_items, total_items)
+
+        def badges_changed_trigger(today_count, upcoming_count):
+            load_upcoming_nums()
+            load_today_nums()
+
+        store.subscribe(liatris_store.TASK_ADDED, sidebar_task_added_trigger)
+        store.subscribe(liatris_store.TASK_RENAMED, sidebar_task_renamed_trigger)
+        store.subscribe(liatris_store.TASK_DELETED, sidebar_task_deleted_trigger)
+        store.subscribe(liatris_store.COUNTERS_CHANGED, counters_changed_trigger)
+        store.subscribe(liatris_store.BADGES_CHANGED, badges_changed_trigger)
+
         projects_list_box.connect("row-activated", populate_project_trigger)
 
         projects_search_bar = self.builder.get_object("ProjectsSearchEntry")
@@ -422,6 +510,7 @@ class Main:
             add_project_popover_add_text_entry.set_text("")
             add_project_popover.popdown()
 
+        @liatris_profile.action
         def add_project_trigger(self):
             project_name = add_project_popover_add_text_entry.get_text()
             if project_name is not None:
@@ -430,13 +519,9 @@ class Main:
                     popover_cancel_trigger(self)
                     return
 
-            new_task = LiatrisTask()
-            new_task.TaskName = project_name.strip()
-            liatris_db.LiatrisSQLCore.insert(new_task)
-
-            # Reset Search Field and Load Tasks anew.
+            # Reset the search field first, so the store event adds the new project to the full list
             projects_search_bar.set_text("")
-            load_tasks()
+            store.add_task(project_name.strip())
             popover_cancel_trigger(self)
 
         add_project_popover_cancel_button.connect("clicked", popover_cancel_trigger)
@@ -451,6 +536,8 @@ class Main:
         add_task_popover_add_text_entry = self.builder.get_object("AddTaskPopoverTaskNameTextEntry")
 
         add_task_popover_add_button.set_sensitive(False)
+        # Keep all lines of pasted text
+        add_task_popover_add_text_entry.set_property("truncate-multiline", False)
 
         def add_task_name_entry_trigger(self):
             text = add_task_popover_add_text_entry.get_text()
@@ -469,6 +556,7 @@ class Main:
         def reload_current_project():
             populate_project(task_view_header_bar.current_task.TaskId)
 
+        @liatris_profile.action
         def add_task_trigger(self):
             task_name = add_task_popover_add_text_entry.get_text()
             if task_name is not None:
@@ -477,16 +565,12 @@ class Main:
                     popover_cancel_trigger(self)
                     return
 
-            new_task = LiatrisItem()
-            new_task.ItemIsDone = False
-            new_task.ItemDate = None
-            new_task.ItemTitle = task_name
-            new_task.TaskId = task_view_header_bar.current_task.TaskId
-            liatris_db.LiatrisSQLCore.insert(new_task)
-
-            # Reset Search Field and Load Items anew.
-            projects_search_bar.set_text("")
-            load_tasks()
+            # Pasted text with many lines adds a task for every line
+            task_names = [line.strip() for line in task_name.splitlines() if line.strip() != ""]
+            if len(task_names) > 1:
+                store.add_items(task_view_header_bar.current_task.TaskId, task_names)
+            else:
+                store.add_item(task_view_header_bar.current_task.TaskId, task_name)
             reload_current_project()
             add_task_popover_cancel_trigger(self)
 
@@ -515,9 +599,263 @@ class Main:
                 self.LISTBOX.show()
 
         def load_item_view(self, row):
+            # Rows that are added to a selection with Ctrl or Shift are not opened
+            if len(self.get_selected_rows()) > 1:
+                return
             populate_item_detail_view(row.Id)
 
+        task_main_list_box.connect("row-activated", load_item_view)
+
+        # Selection of many items, a right click on the selection opens a menu of operations that are applied to all
+        # selected items in one transaction
+
+        def add_menu_item(menu, label, callback, *args):
+            menu_item = Gtk.MenuItem(label=label)
+            if callback is not None:
+                menu_item.connect("activate", lambda menu_item: callback(*args))
+            menu.append(menu_item)
+            return menu_item
+
+        @liatris_profile.action
+        def delete_items_trigger(item_ids, reload):
+            e_diag = Gtk.MessageDialog(message_type=Gtk.MessageType.INFO, buttons=Gtk.ButtonsType.YES_NO,
+                                       text="Do you wish to delete " + str(len(item_ids)) + " tasks?")
+            e_diag.set_title("Really delete?")
+            e_diag.format_secondary_text("Once deleted, the tasks cannot be recovered.")
+            if e_diag.run() == Gtk.ResponseType.YES:
+                e_diag.destroy()
+                store.delete_items(item_ids)
+                reload()
+            else:
+                e_diag.destroy()
+
+        def show_items_menu(event, item_ids, reload):
+            @liatris_profile.action
+            def apply_to_selection(function, *args):
+                function(item_ids, *args)
+                reload()
+
+            menu = Gtk.Menu()
+            add_menu_item(menu, "Mark as Done", apply_to_selection, store.mark_items, True)
+            add_menu_item(menu, "Mark as Not Done", apply_to_selection, store.mark_items, False)
+
+            deadline_menu = Gtk.Menu()
+            today = date.today()
+            add_menu_item(deadline_menu, "Today", apply_to_selection, store.set_items_date, today)
+            add_menu_item(deadline_menu, "Tomorrow", apply_to_selection, store.set_items_date,
+                          today + timedelta(days=1))
+            add_menu_item(deadline_menu, "Next Week", apply_to_selection, store.set_items_date,
+                          today + timedelta(days=7))
+            add_menu_item(deadline_menu, "No Deadline", apply_to_selection, store.set_items_date, None)
+            add_menu_item(menu, "Deadline", None).set_submenu(deadline_menu)
+
+            move_menu = Gtk.Menu()
+            for task in sorted(store.get_tasks(), key=lambda x: str(x.TaskName).lower()):
+                add_menu_item(move_menu, str(task.TaskName), apply_to_selection, store.move_items, task.TaskId)
+            add_menu_item(menu, "Move to", None).set_submenu(move_menu)
+
+            menu.append(Gtk.SeparatorMenuItem())
+            add_menu_item(menu, "Delete", delete_items_trigger, item_ids, reload)
+
+            menu.show_all()
+            menu.popup_at_pointer(event)
+
+        # get_list_boxes returns all list boxes that take part in the selection, reload shows the changes afterwards
+        def item_list_box_button_press_trigger(self, event, get_list_boxes, reload):
+            row = self.get_row_at_y(int(event.y))
+            if row is None:
+                return False
+
+            if event.button == Gdk.BUTTON_SECONDARY:
+                if not row.is_selected():
+                    for list_box in get_list_boxes():
+                        list_box.unselect_all()
+                    self.select_row(row)
+                item_ids = [selected_row.Id for list_box in get_list_boxes()
+                            for selected_row in list_box.get_selected_rows()]
+                show_items_menu(event, item_ids, reload)
+                return True
+
+            # A plain click starts a new selection
+            if not event.state & (Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.SHIFT_MASK):
+                for list_box in get_list_boxes():
+                    if list_box is not self:
+                        list_box.unselect_all()
+            return False
+
+        def connect_item_selection(list_box, get_list_boxes, reload):
+            list_box.set_selection_mode(Gtk.SelectionMode.MULTIPLE)
+            list_box.connect("button-press-event", item_list_box_button_press_trigger, get_list_boxes, reload)
+
+        def get_task_tree_list_boxes():
+            return [row.ItemListBox for row in task_item_list_view.get_children() if hasattr(row, "ItemListBox")]
+
+        def reload_task_tree():
+            load_task_tree(*task_item_list_view.LastLoad)
+
+        connect_item_selection(task_main_list_box, lambda: [task_main_list_box], reload_current_project)
+
+        # Turns a search snippet into Pango markup with the matched words in bold
+        def snippet_to_markup(snippet):
+            markup = []
+            for index, part in enumerate(snippet.split(liatris_db.SNIPPET_START)):
+                if index == 0:
+                    markup.append(GLib.markup_escape_text(part))
+                    continue
+                match, _, rest = part.partition(liatris_db.SNIPPET_END)
+                markup.append("<b>" + GLib.markup_escape_text(match) + "</b>" + GLib.markup_escape_text(rest))
+            return "".join(markup)
+
+        # Results of the worker are only shown if no other view was opened in the meantime
+        task_tree_channel = "TaskTree"
+
+        def cancel_task_tree_load():
+            db_worker.cancel(task_tree_channel)
+
+        # Shows a placeholder in the task tree view right away and fills it in once function(*args) returned on a
+        # worker thread
+        def load_task_tree(title, function, args, callback):
+            task_item_list_view.LastLoad = (title, function, args, callback)
+            reset_logbook_pages()
+            unload_blank_page()
+            main_notebook.set_current_page(1)
+            task_item_tree_label.set_text(str(title))
+
+            for child in task_item_list_view.get_children():
+                child.destroy()
+
+            insert_task_tree_message("Loading…", 0)
+
+            # The call failed if it returned False, the error is on stderr and the placeholder replaces the view
+            def load_task_tree_callback(result):
+                if result is False:
+                    for child in task_item_list_view.get_children():
+                        child.destroy()
+                    insert_task_tree_message("Could not load " + str(title), 0)
+                    return
+                callback(result if result else [])
+
+            db_worker.submit(function, args, load_task_tree_callback, task_tree_channel)
+
+        # Shows a row with a message in the task tree view at the position
+        def insert_task_tree_message(text, position):
+            row = Gtk.ListBoxRow()
+            label = Gtk.Label()
+            label.set_text(text)
+            label.set_margin_top(10)
+            label.set_margin_bottom(10)
+            row.add(label)
+            task_item_list_view.insert(row, position)
+            task_item_list_view.show_all()
+
+        # Returns an ItemId -> note length dictionary of the items of the task items that have a note
+        def get_note_lengths(task_items):
+            note_lengths = liatris_db.LiatrisSQLCore.ItemNotes.get_note_lengths(
+                [item.ItemId for task_item in task_items for item in task_item.ITEMS])
+            if not note_lengths:
+                return {}
+            return note_lengths
+
+        # Returns the title of an item followed by an icon if the item has a note
+        def build_item_title(item, note_lengths):
+            title_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+            label = Gtk.Label()
+            label.set_text(str(item.ItemTitle))
+            title_box.pack_start(label, False, False, 0)
+
+            if item.ItemId in note_lengths:
+                note_image = Gtk.Image()
+                note_image = note_image.new_from_icon_name("text-x-generic-symbolic", Gtk.IconSize.MENU)
+                note_image.set_tooltip_text("Notes (" + str(note_lengths[item.ItemId]) + " characters)")
+                title_box.pack_start(note_image, False, False, 0)
+
+            return title_box
+
+        # Returns the row of an item in the task tree view
+        def build_task_item_row(item, task_item, note_lengths):
+            trow = Gtk.ListBoxRow()
+            th_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+            th_box.set_margin_top(10)
+            th_box.set_margin_bottom(10)
+            trow.add(th_box)
+            trow.Id = item.ItemId
+            t_label = build_item_title(item, note_lengths)
+
+            if item.ItemId in task_item.SNIPPETS:
+                trow.set_tooltip_markup(snippet_to_markup(task_item.SNIPPETS[item.ItemId]))
+
+            t_check_button = Gtk.CheckButton()
+            t_check_button.item = item
+
+            if item.ItemIsDone:
+                t_check_button.set_active(True)
+
+            t_check_button.connect("toggled", mark_item_trigger)
+
+            th_box.pack_start(t_check_button, False, False, 10)
+            th_box.pack_start(t_label, False, False, 10)
+
+            if item.ItemDate is not None:
+                t_deadline_label = Gtk.Label()
+                if item.ItemDate.date() < date.today():
+                    t_deadline_label.override_color(Gtk.StateFlags.NORMAL, Gdk.RGBA(0.85, 0.08, 0.25, 1.0))
+                    t_deadline_label.set_text(str(item.ItemDate.date()))
+                else:
+                    t_deadline_label.set_text(str(item.ItemDate.date()))
+
+                th_box.pack_end(t_deadline_label, False, False, 10)
+
+            set_row_item(trow, t_check_button, item, note_lengths)
+            return trow
+
+        # Adds the parent row of a task at the position and returns the list box of its items
+        def add_task_item_group(task_item, position):
+            row = Gtk.ListBoxRow()
+            hbox = Gtk.Grid()
+            hbox.set_margin_top(10)
+            hbox.set_margin_bottom(10)
+            row.add(hbox)
+            row.Id = task_item.TASK.TaskId
+            label = Gtk.Label()
+            label.set_text(str(task_item.TASK.TaskName))
+            label.set_margin_start(5)
+
+            children_list_box = Gtk.ListBox()
+            children_list_box.set_margin_start(90)
+            children_list_box.set_margin_top(10)
+            children_list_box.set_margin_end(10)
+            children_list_box.set_hexpand(True)
+            children_list_box.connect("row-activated", load_item_view)
+            connect_item_selection(children_list_box, get_task_tree_list_boxes, reload_task_tree)
+
+            expand_button = Gtk.Button()
+            expand_image = Gtk.Image()
+            expand_image = expand_image.new_from_icon_name("go-down-symbolic", Gtk.IconSize.MENU)
+            expand_button.set_image(expand_image)
+            expand_button.set_tooltip_text("Expand Project")
+            expand_button.set_always_show_image(True)
+            expand_button.set_relief(Gtk.ReliefStyle.NONE)
+            expand_button.LISTBOX = children_list_box
+            expand_button.connect("clicked", display_children_list_box_trigger)
+
+            box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
+            if len(task_item.ITEMS) != 0:
+                box.pack_start(expand_button, False, False, 5)
+
+            box.pack_start(label, False, False, 5)
+            hbox.attach(box, 0, 0, 1, 1)
+
+            # Attach ListBox only if it is populated
+            if len(task_item.ITEMS) != 0:
+                hbox.attach(children_list_box, 0, 1, 1, 1)
+
+            row.ItemListBox = children_list_box
+            task_item_list_view.insert(row, position)
+            row.show_all()
+            return children_list_box
+
         def populate_task_items(task_items, title):
+            reset_logbook_pages()
             unload_blank_page()
             main_notebook.set_current_page(1)
             # Set title
@@ -526,36 +864,12 @@ class Main:
             for child in task_item_list_view.get_children():
                 child.destroy()
 
+            note_lengths = get_note_lengths(task_items)
             for task_item in task_items:
                 if task_item.TASK.TaskName is None:
                     continue
                 # Add Task Parent
-                row = Gtk.ListBoxRow()
-                hbox = Gtk.Grid()
-                hbox.set_margin_top(10)
-                hbox.set_margin_bottom(10)
-                row.add(hbox)
-                row.Id = task_item.TASK.TaskId
-                label = Gtk.Label()
-                label.set_text(str(task_item.TASK.TaskName))
-                label.set_margin_start(5)
-
-                children_list_box = Gtk.ListBox()
-                children_list_box.set_margin_start(90)
-                children_list_box.set_margin_top(10)
-                children_list_box.set_margin_end(10)
-                children_list_box.set_hexpand(True)
-                children_list_box.connect("row-activated", load_item_view)
-
-                expand_button = Gtk.Button()
-                expand_image = Gtk.Image()
-                expand_image = expand_image.new_from_icon_name("go-down-symbolic", Gtk.IconSize.MENU)
-                expand_button.set_image(expand_image)
-                expand_button.set_tooltip_text("Expand Project")
-                expand_button.set_always_show_image(True)
-                expand_button.set_relief(Gtk.ReliefStyle.NONE)
-                expand_button.LISTBOX = children_list_box
-                expand_button.connect("clicked", display_children_list_box_trigger)
+                children_list_box = add_task_item_group(task_item, 0)
 
                 # Add Children
                 if len(task_item.ITEMS) != 0:
@@ -564,60 +878,94 @@ class Main:
                     task_item.ITEMS.reverse()
 
                     for item in task_item.ITEMS:
-                        trow = Gtk.ListBoxRow()
-                        th_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
-                        th_box.set_margin_top(10)
-                        th_box.set_margin_bottom(10)
-                        trow.add(th_box)
-                        trow.Id = item.ItemId
-                        t_label = Gtk.Label()
-                        t_label.set_text(str(item.ItemTitle))
+                        children_list_box.insert(build_task_item_row(item, task_item, note_lengths), 0)
+                        children_list_box.show_all()
 
-                        t_check_button = Gtk.CheckButton()
-                        t_check_button.item = item
+        # Logbook pages, completed items are loaded page by page while scrolling towards the end of the list
 
-                        if item.ItemIsDone:
-                            t_check_button.set_active(True)
+        task_item_tree_scrolled_window = self.builder.get_object("ProjectTaskTreeListBoxScrolledWindow")
 
-                        t_check_button.connect("toggled", mark_item_trigger)
+        def reset_logbook_pages():
+            task_item_list_view.LogbookTaskId = None
+            task_item_list_view.LogbookNextKey = None
+            task_item_list_view.LogbookLoading = False
+            # The item list boxes of the tasks shown so far, by TaskId
+            task_item_list_view.LogbookGroups = {}
 
-                        th_box.pack_start(t_check_button, False, False, 10)
-                        th_box.pack_start(t_label, False, False, 10)
+        reset_logbook_pages()
 
-                        if item.ItemDate is not None:
-                            t_deadline_label = Gtk.Label()
-                            if item.ItemDate.date() < date.today():
-                                t_deadline_label.override_color(Gtk.StateFlags.NORMAL, Gdk.RGBA(0.85, 0.08, 0.25, 1.0))
-                                t_deadline_label.set_text(str(item.ItemDate.date()))
-                            else:
-                                t_deadline_label.set_text(str(item.ItemDate.date()))
+        # Shows the first page of completed items, of all tasks or of the task with the given id
+        def populate_logbook(title, task_id=None):
+            def populate_first_logbook_page(page):
+                populate_task_items([], title)
+                if page:
+                    task_item_list_view.LogbookTaskId = task_id
+                    append_logbook_page(page)
 
-                            th_box.pack_end(t_deadline_label, False, False, 10)
+            load_task_tree(title, liatris_db.LiatrisSQLCore.SmartLists.produce_logbook_page, (None, task_id),
+                           populate_first_logbook_page)
 
-                        children_list_box.insert(trow, 0)
-                        children_list_box.show_all()
+        # Appends a page below the items shown so far, items of tasks that are already shown join their group
+        def append_logbook_page(page):
+            task_items, next_key = page
+            note_lengths = get_note_lengths(task_items)
+            for task_item in task_items:
+                task_id = task_item.TASK.TaskId
+                if task_id not in task_item_list_view.LogbookGroups:
+                    task_item_list_view.LogbookGroups[task_id] = add_task_item_group(task_item, -1)
 
-                box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
-                if len(task_item.ITEMS) != 0:
-                    box.pack_start(expand_button, False, False, 5)
+                for item in task_item.ITEMS:
+                    trow = build_task_item_row(item, task_item, note_lengths)
+                    task_item_list_view.LogbookGroups[task_id].insert(trow, -1)
+                    trow.show_all()
 
-                box.pack_start(label, False, False, 5)
-                hbox.attach(box, 0, 0, 1, 1)
+            task_item_list_view.LogbookNextKey = next_key
+            task_item_list_view.LogbookLoading = False
 
-                # Attach ListBox only if it is populated
-                if len(task_item.ITEMS) != 0:
-                    hbox.attach(children_list_box, 0, 1, 1, 1)
+        @liatris_profile.action
+        def load_next_logbook_page():
+            if task_item_list_view.LogbookNextKey is None or task_item_list_view.LogbookLoading:
+                return
+            task_item_list_view.LogbookLoading = True
+
+            def append_next_logbook_page(page):
+                if page is False:
+                    # Scrolling on would fail again, the placeholder ends the list instead
+                    task_item_list_view.LogbookNextKey = None
+                    task_item_list_view.LogbookLoading = False
+                    insert_task_tree_message("Could not load more completed tasks", -1)
+                    return
+                if not page:
+                    task_item_list_view.LogbookLoading = False
+                    return
+                append_logbook_page(page)
+
+            db_worker.submit(liatris_db.LiatrisSQLCore.SmartLists.produce_logbook_page,
+                             (task_item_list_view.LogbookNextKey, task_item_list_view.LogbookTaskId),
+                             append_next_logbook_page, task_tree_channel)
+
+        # Loads the next page once less than a screen is left below the visible part, this also fills up a first page
+        # that does not cover the whole window
+        def task_item_tree_scrolled_trigger(adjustment):
+            if adjustment.get_value() + 2 * adjustment.get_page_size() >= adjustment.get_upper():
+                load_next_logbook_page()
 
-                task_item_list_view.insert(row, 0)
-                task_item_list_view.show_all()
+        task_item_tree_scrolled_window.get_vadjustment().connect("value-changed", task_item_tree_scrolled_trigger)
+        task_item_tree_scrolled_window.get_vadjustment().connect("changed", task_item_tree_scrolled_trigger)
 
         # Search
 
+        @liatris_profile.action
         def search_entry_trigger(self):
             search_text = search_entry.get_text().strip()
             if search_text != "":
-                result_task_items = liatris_db.LiatrisSQLCore.Tasks.search_task_items(search_text)
-                populate_task_items(result_task_items, 'Search "' + search_text + '"')
+                def populate_search(result_task_items):
+                    # Rows are inserted at the top, reverse the ranking so the best match ends up first
+                    result_task_items.reverse()
+                    populate_task_items(result_task_items, 'Search "' + search_text + '"')
+
+                load_task_tree('Search "' + search_text + '"', liatris_db.LiatrisSQLCore.Tasks.search_task_items,
+                               (search_text,), populate_search)
             else:
                 load_blank_page()
 
@@ -635,26 +983,9 @@ class Main:
 
         logbook_button = self.builder.get_object("LogbookButton")
 
+        @liatris_profile.action
         def populate_logbook_trigger(self):
-            all_task_items = liatris_db.LiatrisSQLCore.Tasks.produce_all_task_items()
-
-            new_task_items = []
-
-            for task_item in all_task_items:
-                if task_item.TASK.TaskName is None:
-                    continue
-
-                new_items = []
-                for item in task_item.ITEMS:
-                    if item.ItemIsDone:
-                        new_items.append(item)
-
-                task_item.ITEMS = new_items
-
-                if len(new_items) != 0:
-                    new_task_items.append(task_item)
-
-            populate_task_items(new_task_items, "Logbook")
+            populate_logbook("Logbook")
 
         logbook_button.connect("clicked", populate_logbook_trigger)
 
@@ -662,56 +993,26 @@ class Main:
 
         upcoming_button = self.builder.get_object("UpcomingButton")
 
+        def get_upcoming_threshold():
+            return int(liatris_db.LiatrisSQLCore.Settings.get_setting_by_key("UPCOMINGTHRESHOLD").Value)
+
         def load_upcoming_nums():
             is_enabled = liatris_db.LiatrisSQLCore.Settings.get_setting_by_key("ENABLENUMS")
             if is_enabled:
                 if is_enabled.Value == "1":
-                    all_task_items = liatris_db.LiatrisSQLCore.Tasks.produce_all_task_items()
-
-                    counter = 0
-
-                    for task_item in all_task_items:
-                        if task_item.TASK.TaskName is None:
-                            continue
+                    counter = store.get_badges()[1]
 
-                        for item in task_item.ITEMS:
-                            if item.ItemDate is None or item.ItemIsDone is True:
-                                continue
-                            if date.today() < item.ItemDate.date() < date.today() + timedelta(
-                                    days=int(liatris_db.LiatrisSQLCore.Settings.get_setting_by_key(
-                                        "UPCOMINGTHRESHOLD").Value)):
-                                counter += 1
-
-                    if counter != 0:
+                    if counter:
                         upcoming_button.set_label("Upcoming • (" + str(counter) + ")")
                     else:
                         upcoming_button.set_label("Upcoming")
                 else:
                     upcoming_button.set_label("Upcoming")
 
+        @liatris_profile.action
         def populate_upcoming_trigger(self):
-            all_task_items = liatris_db.LiatrisSQLCore.Tasks.produce_all_task_items()
-
-            new_task_items = []
-
-            for task_item in all_task_items:
-                if task_item.TASK.TaskName is None:
-                    continue
-
-                new_items = []
-                for item in task_item.ITEMS:
-                    if item.ItemDate is None or item.ItemIsDone is True:
-                        continue
-                    if date.today() < item.ItemDate.date() < date.today() + timedelta(
-                            days=int(liatris_db.LiatrisSQLCore.Settings.get_setting_by_key("UPCOMINGTHRESHOLD").Value)):
-                        new_items.append(item)
-
-                task_item.ITEMS = new_items
-
-                if len(new_items) != 0:
-                    new_task_items.append(task_item)
-
-            populate_task_items(new_task_items, "Upcoming")
+            load_task_tree("Upcoming", liatris_db.LiatrisSQLCore.SmartLists.produce_upcoming,
+                           (get_upcoming_threshold(),), lambda task_items: populate_task_items(task_items, "Upcoming"))
 
         upcoming_button.connect("clicked", populate_upcoming_trigger)
 
@@ -723,21 +1024,9 @@ class Main:
             is_enabled = liatris_db.LiatrisSQLCore.Settings.get_setting_by_key("ENABLENUMS")
             if is_enabled:
                 if is_enabled.Value == "1":
-                    all_task_items = liatris_db.LiatrisSQLCore.Tasks.produce_all_task_items()
-
-                    counter = 0
+                    counter = store.get_badges()[0]
 
-                    for task_item in all_task_items:
-                        if task_item.TASK.TaskName is None:
-                            continue
-
-                        for item in task_item.ITEMS:
-                            if item.ItemDate is None or item.ItemIsDone is True:
-                                continue
-                            if item.ItemDate.date() == date.today() or item.ItemDate.date() < date.today():
-                                counter += 1
-
-                    if counter != 0:
+                    if counter:
                         today_button.set_label("Today • (" + str(counter) + ")")
                         main_header_bar_label.set_text("Liatris (" + str(counter) + ")")
                         main_window.set_title("Liatris (" + str(counter) + ")")
@@ -750,28 +1039,10 @@ class Main:
                     main_header_bar_label.set_text("Liatris")
                     main_window.set_title("Liatris")
 
+        @liatris_profile.action
         def populate_today_trigger(self):
-            all_task_items = liatris_db.LiatrisSQLCore.Tasks.produce_all_task_items()
-
-            new_task_items = []
-
-            for task_item in all_task_items:
-                if task_item.TASK.TaskName is None:
-                    continue
-
-                new_items = []
-                for item in task_item.ITEMS:
-                    if item.ItemDate is None or item.ItemIsDone is True:
-                        continue
-                    if item.ItemDate.date() == date.today() or item.ItemDate.date() < date.today():
-                        new_items.append(item)
-
-                task_item.ITEMS = new_items
-
-                if len(new_items) != 0:
-                    new_task_items.append(task_item)
-
-            populate_task_items(new_task_items, "Today")
+            load_task_tree("Today", liatris_db.LiatrisSQLCore.SmartLists.produce_today, (),
+                           lambda task_items: populate_task_items(task_items, "Today"))
 
         today_button.connect("clicked", populate_today_trigger)
 
@@ -779,28 +1050,10 @@ class Main:
 
         someday_button = self.builder.get_object("SomedayButton")
 
+        @liatris_profile.action
         def populate_someday_trigger(self):
-            all_task_items = liatris_db.LiatrisSQLCore.Tasks.produce_all_task_items()
-
-            new_task_items = []
-
-            for task_item in all_task_items:
-                if task_item.TASK.TaskName is None:
-                    continue
-
-                new_items = []
-                for item in task_item.ITEMS:
-                    if item.ItemIsDone:
-                        continue
-                    if item.ItemDate is None:
-                        new_items.append(item)
-
-                task_item.ITEMS = new_items
-
-                if len(new_items) != 0:
-                    new_task_items.append(task_item)
-
-            populate_task_items(new_task_items, "Someday")
+            load_task_tree("Someday", liatris_db.LiatrisSQLCore.SmartLists.produce_someday, (),
+                           lambda task_items: populate_task_items(task_items, "Someday"))
 
         someday_button.connect("clicked", populate_someday_trigger)
 
@@ -849,6 +1102,7 @@ class Main:
             new_date = task_detail_deadline_date_picker_calendar.get_date()
             return date(new_date.year, new_date.month + 1, new_date.day)
 
+        @liatris_profile.action
         def calendar_ok_button_trigger(self):
             if not task_detail_item_deadline_toggle.get_active():
                 return
@@ -856,10 +1110,9 @@ class Main:
             s_date = get_calendar_date()
 
             item_detail_header_bar.ItemToEdit.ItemDate = s_date
-            liatris_db.LiatrisSQLCore.Items.update_item(item_detail_header_bar.ItemToEdit)
+            store.update_item(item_detail_header_bar.ItemToEdit)
             item_detail_reload_item(item_detail_header_bar.ItemToEdit.ItemId)
             set_calendar_date(s_date)
-            load_tasks()
             reload_calendar_button_label()
             task_detail_deadline_date_picker_popover.popdown()
 
@@ -877,15 +1130,15 @@ class Main:
         def set_select_date_button_label():
             task_detail_deadline_menu_button_label.set_text("Select date...")
 
+        @liatris_profile.action
         def disable_deadline_toggle_trigger(self):
             item_detail_header_bar.ItemToEdit.ItemDate = None
-            liatris_db.LiatrisSQLCore.Items.update_item(item_detail_header_bar.ItemToEdit)
+            store.update_item(item_detail_header_bar.ItemToEdit)
             set_select_date_button_label()
             task_edit_toggle_deadline(False)
             set_calendar_date(date.today())
             task_detail_deadline_date_picker_popover.popdown()
             item_detail_reload_item(item_detail_header_bar.ItemToEdit.ItemId)
-            load_tasks()
 
         task_detail_deadline_date_picker_deadline_button.connect("clicked", disable_deadline_toggle_trigger)
 
@@ -923,11 +1176,11 @@ class Main:
             item_note = liatris_db.LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(
                 item_detail_header_bar.CurrentItem.ItemId)
 
+            # Notes are only stored once something was written into them
             if not item_note:
                 item_note = LiatrisItemNote()
                 item_note.ItemId = item_detail_header_bar.CurrentItem.ItemId
                 item_note.NoteContent = ""
-                liatris_db.LiatrisSQLCore.insert(item_note)
 
             buffer = Gtk.TextBuffer()
 
@@ -944,6 +1197,30 @@ class Main:
 
             return item_note
 
+        # Note edits are staged and written once typing pauses, the text view loses focus or the app quits. While typing
+        # goes on they are written to the journal at most every JOURNAL_INTERVAL_MS.
+        task_detail_item_text_view.FlushSourceId = None
+        task_detail_item_text_view.JournalSourceId = None
+
+        @liatris_profile.action
+        def flush_item_notes(*args):
+            if task_detail_item_text_view.FlushSourceId is not None:
+                GLib.source_remove(task_detail_item_text_view.FlushSourceId)
+                task_detail_item_text_view.FlushSourceId = None
+            note_autosave.flush()
+            return False
+
+        @liatris_profile.action
+        def item_note_flush_timeout():
+            task_detail_item_text_view.FlushSourceId = None
+            note_autosave.flush()
+            return False
+
+        def item_note_journal_timeout():
+            task_detail_item_text_view.JournalSourceId = None
+            note_autosave.write_journal()
+            return False
+
         def item_note_text_trigger(self_a, self_b):
             buffer = task_detail_item_text_view.get_buffer()
             buffer_text = str(buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False))
@@ -951,13 +1228,23 @@ class Main:
                 return
 
             item_detail_header_bar.CurrentItemNote.NoteContent = buffer_text
+            note_autosave.stage(item_detail_header_bar.CurrentItemNote.ItemId, buffer_text)
+            if task_detail_item_text_view.JournalSourceId is None:
+                task_detail_item_text_view.JournalSourceId = GLib.timeout_add(liatris_autosave.JOURNAL_INTERVAL_MS,
+                                                                              item_note_journal_timeout)
 
-            liatris_db.LiatrisSQLCore.ItemNotes.update_item_note(item_detail_header_bar.CurrentItemNote)
-            item_detail_reload_item(item_detail_header_bar.ItemToEdit.ItemId)
+            if task_detail_item_text_view.FlushSourceId is not None:
+                GLib.source_remove(task_detail_item_text_view.FlushSourceId)
+            task_detail_item_text_view.FlushSourceId = GLib.timeout_add(liatris_autosave.AUTOSAVE_IDLE_MS,
+                                                                        item_note_flush_timeout)
 
         task_detail_item_text_view.connect("key-release-event", item_note_text_trigger)
+        task_detail_item_text_view.connect("focus-out-event", flush_item_notes)
 
+        @liatris_profile.action
         def populate_item_detail_view(item_id):
+            cancel_task_tree_load()
+            flush_item_notes()
             rename_item_cancel_trigger(self)
             item = item_detail_reload_item(item_id)
             if item is not None:
@@ -966,6 +1253,8 @@ class Main:
                 main_notebook.set_current_page(2)
 
                 item_name_label.set_text(item.ItemTitle)
+                # Compared with the item when another process changed it
+                item_detail_header_bar.ItemValues = (item.ItemTitle, item.ItemDate)
 
                 task_detail_item_is_done_toggle.item = item
 
@@ -995,20 +1284,19 @@ class Main:
 
         task_detail_item_deadline_toggle.connect("toggled", task_detail_item_deadline_toggle_trigger)
 
+        @liatris_profile.action
         def item_rename_ok_button_trigger(self):
             item = copy(item_detail_header_bar.CurrentItem)
             if item is not None:
                 item.ItemTitle = item_rename_entry.get_text().strip()
 
                 if item_rename_ok_button.get_sensitive():
-                    liatris_db.LiatrisSQLCore.Items.update_item(item)
+                    store.update_item(item)
                 else:
                     call_ok_e_diag("Could not rename task.", "Error", "The provided task name was not valid.")
 
                 rename_project_cancel_trigger(self)
                 populate_item_detail_view(item.ItemId)
-                projects_search_bar.set_text("")
-                load_tasks()
 
         def item_rename_entry_trigger(self):
             text = item_rename_entry.get_text()
@@ -1069,6 +1357,7 @@ class Main:
 
             self.set_text(''.join(new_text))
 
+        @liatris_profile.action
         def main_settings_upcoming_entry_trigger(self):
             main_settings_upcoming_entry_trigger_replace_nums(self)
             if self.NoTrigger == True or self.get_text().strip() == "":
@@ -1082,7 +1371,7 @@ class Main:
             upcoming_setting.Value = str(upcoming_threshold_integrity(self.get_text()))
 
             liatris_db.LiatrisSQLCore.Settings.update_setting(upcoming_setting)
-            load_tasks()
+            store.set_upcoming_threshold(upcoming_setting.Value)
             return True
 
         main_settings_upcoming_entry.connect("changed", main_settings_upcoming_entry_trigger)
@@ -1098,7 +1387,8 @@ class Main:
                 warnings_setting.Value = "0"
 
             liatris_db.LiatrisSQLCore.Settings.update_setting(warnings_setting)
-            load_tasks()
+            load_upcoming_nums()
+            load_today_nums()
             return True
 
         main_settings_warnings_toggle.connect("toggled", MAINSETTINGSWARNINGSTOGGLETRIGGER)
@@ -1157,6 +1447,53 @@ class Main:
 
         main_settings_back_button.connect("clicked", close_settings)
 
+        # SQL Profile, a hidden panel that lists the statements every action sent to the database when profiling is
+        # enabled, see liatris_profile
+
+        sql_profile_window = Gtk.Window()
+        sql_profile_window.set_transient_for(main_window)
+        sql_profile_window.set_default_size(900, 600)
+        sql_profile_header_bar = Gtk.HeaderBar(title="SQL Profile", show_close_button=True)
+        sql_profile_window.set_titlebar(sql_profile_header_bar)
+
+        sql_profile_text_view = Gtk.TextView(editable=False, cursor_visible=False, monospace=True)
+        sql_profile_scrolled_window = Gtk.ScrolledWindow()
+        sql_profile_scrolled_window.add(sql_profile_text_view)
+        sql_profile_window.add(sql_profile_scrolled_window)
+
+        def load_sql_profile(*args):
+            sql_profile_text_view.get_buffer().set_text(liatris_profile.get_report())
+
+        def reset_sql_profile(*args):
+            liatris_profile.reset()
+            load_sql_profile()
+
+        def save_sql_profile(*args):
+            if liatris_profile.write_report():
+                sql_profile_header_bar.set_subtitle("Saved to " + liatris_profile.LOG_FILE)
+            else:
+                call_ok_e_diag("Could not save the profile.", "Error",
+                               "Please make sure that '" + liatris_profile.LOG_FILE + "' is writable.")
+
+        def show_sql_profile():
+            if not liatris_profile.ENABLED:
+                return
+            sql_profile_header_bar.set_subtitle(None)
+            load_sql_profile()
+            sql_profile_window.show_all()
+            sql_profile_window.present()
+
+        def hide_sql_profile(window, event):
+            sql_profile_window.hide()
+            return True
+
+        for label, callback in (("Refresh", load_sql_profile), ("Reset", reset_sql_profile),
+                                ("Save", save_sql_profile)):
+            sql_profile_button = Gtk.Button(label=label)
+            sql_profile_button.connect("clicked", callback)
+            sql_profile_header_bar.pack_start(sql_profile_button)
+        sql_profile_window.connect("delete-event", hide_sql_profile)
+
         # Keyboard Shortcuts
 
         def key_press_handler(window, event):
@@ -1164,7 +1501,7 @@ class Main:
 
             if Gdk.ModifierType.CONTROL_MASK == event.state:
                 if keyname == "q":
-                    Gtk.main_quit()
+                    quit_trigger()
                 if keyname == "w":
                     load_blank_page()
                 if keyname == "p":
@@ -1182,6 +1519,10 @@ class Main:
                 if keyname == "l":
                     populate_logbook_trigger(self)
 
+            if Gdk.ModifierType.CONTROL_MASK | Gdk.ModifierType.SHIFT_MASK == event.state:
+                if keyname == "D":
+                    show_sql_profile()
+
         main_window.connect("key-press-event", key_press_handler)
 
         # About
@@ -1206,11 +1547,160 @@ class Main:
         settings_link = self.builder.get_object("SettingsLink")
         settings_link.connect("clicked", open_settings)
 
+        # Changes written by other processes, like liatris_cli or a second window. The store announces the changed
+        # projects, counters and badges, the rows of the changed items that are shown are replaced one by one.
+        change_monitor = liatris_changes.LiatrisChangeMonitor()
+
+        # Returns the item rows of the list boxes by ItemId
+        def get_shown_item_rows(list_boxes):
+            return {row.Id: row for list_box in list_boxes for row in list_box.get_children()
+                    if hasattr(row, "ItemValues")}
+
+        def is_row_current(row, item, note_lengths):
+            return row.ItemValues == (item.ItemTitle, item.ItemDate, item.ItemId in note_lengths) and \
+                row.CheckButton.get_active() == (item.ItemIsDone is True)
+
+        def replace_row(row, new_row):
+            row.get_parent().insert(new_row, row.get_index())
+            row.destroy()
+            new_row.show_all()
+
+        def refresh_project_items(item_ids, item_rows, note_lengths):
+            task_id = task_view_header_bar.current_task.TaskId
+            shown_rows = get_shown_item_rows([task_main_list_box])
+            for item_id in item_ids:
+                row = shown_rows.get(item_id)
+                task, item = item_rows.get(item_id, (None, None))
+                if row is not None:
+                    # Items marked as done here keep their row until the project is opened again
+                    if item is None or item.TaskId != task_id or (item.ItemIsDone and not row.CheckButton.get_active()):
+                        row.destroy()
+                    elif not item.ItemIsDone and not is_row_current(row, item, note_lengths):
+                        replace_row(row, build_project_item_row(item, task_view_header_bar.TaskItem, note_lengths))
+                elif item is not None and item.TaskId == task_id and not item.ItemIsDone:
+                    new_row = build_project_item_row(item, task_view_header_bar.TaskItem, note_lengths)
+                    position = -1
+                    for shown_row in task_main_list_box.get_children():
+                        if hasattr(shown_row, "SortKey") and shown_row.SortKey > new_row.SortKey:
+                            position = shown_row.get_index()
+                            break
+                    task_main_list_box.insert(new_row, position)
+                    new_row.show_all()
+
+        def refresh_task_tree_items(item_ids, item_rows, note_lengths):
+            shown_rows = get_shown_item_rows(get_task_tree_list_boxes())
+            # Whether an item joined the list depends on the query of the list, it is run again
+            if any(item_id not in shown_rows and item_id in item_rows for item_id in item_ids):
+                reload_task_tree()
+                return
+            for item_id in item_ids:
+                if item_id not in shown_rows:
+                    continue
+                task, item = item_rows.get(item_id, (None, None))
+                if item is None:
+                    shown_rows[item_id].destroy()
+                elif not is_row_current(shown_rows[item_id], item, note_lengths):
+                    replace_row(shown_rows[item_id],
+                                build_task_item_row(item, liatris_db.LiatrisTaskItem(task, [item]), note_lengths))
+
+        # The open item is only shown again while nothing of it is being edited
+        def refresh_item_detail(item_ids, item_rows):
+            item_id = task_detail_edit_delete_button.Id
+            if item_id not in item_ids:
+                return
+            task, item = item_rows.get(item_id, (None, None))
+            if item is None:
+                load_blank_page()
+                return
+            if note_autosave.has_pending() or item_rename_entry.props.visible:
+                return
+
+            item_note = liatris_db.LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(item_id)
+            buffer = task_detail_item_text_view.get_buffer()
+            if item_detail_header_bar.ItemValues != (item.ItemTitle, item.ItemDate) or \
+                    task_detail_item_is_done_toggle.get_active() != (item.ItemIsDone is True) or \
+                    buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False) != \
+                    (item_note.NoteContent if item_note else ""):
+                populate_item_detail_view(item_id)
+
+        @liatris_profile.action
+        def refresh_changed_rows(change_set):
+            if change_set.settings_changed:
+                liatris_db.LiatrisSQLCore.Settings.invalidate_cache()
+                store.set_upcoming_threshold(get_upcoming_threshold())
+
+            if change_set.reload:
+                store.load()
+                load_tasks(projects_search_bar.get_text())
+                load_blank_page()
+                return
+            store.apply_changes(change_set)
+
+            current_task = task_view_header_bar.current_task
+            if current_task is not None and current_task.TaskId in change_set.task_ids:
+                if current_task.TaskId not in store.tasks:
+                    load_blank_page()
+                    task_view_header_bar.current_task = None
+                else:
+                    current_task.TaskName = store.tasks[current_task.TaskId].TaskName
+                    task_name_label.set_text(current_task.TaskName)
+
+            item_ids = change_set.item_ids | change_set.note_item_ids
+            if len(item_ids) == 0 or not main_notebook.props.visible:
+                return
+            item_rows = liatris_db.LiatrisSQLCore.Items.get_item_rows(item_ids)
+            note_lengths = liatris_db.LiatrisSQLCore.ItemNotes.get_note_lengths(item_ids)
+            if item_rows is False or note_lengths is False:
+                return
+
+            page = main_notebook.get_current_page()
+            if page == 0 and task_view_header_bar.current_task is not None:
+                refresh_project_items(item_ids, item_rows, note_lengths)
+            elif page == 1 and hasattr(task_item_list_view, "LastLoad"):
+                refresh_task_tree_items(item_ids, item_rows, note_lengths)
+            elif page == 2:
+                refresh_item_detail(item_ids, item_rows)
+
+        # Polls the change monitor, most polls find nothing and do not touch any table
+        def change_monitor_timeout():
+            change_set = change_monitor.poll()
+            if change_set is not None:
+                refresh_changed_rows(change_set)
+            return True
+
+        # Moves old completed items to the archive in the background, the store then forgets their states
+        @liatris_profile.action
+        def archive_completed_items():
+            archive_setting = liatris_db.LiatrisSQLCore.Settings.get_setting_by_key("ARCHIVEAFTERDAYS")
+            if not archive_setting or not archive_setting.Value.isdigit() or int(archive_setting.Value) == 0:
+                return
+
+            def archive_completed_items_callback(count):
+                if count:
+                    store.load()
+
+            db_worker.submit(liatris_db.LiatrisSQLCore.Archive.archive_completed, (int(archive_setting.Value),),
+                             archive_completed_items_callback)
+
+        # Takes the daily snapshot on a worker thread, the database is copied in small steps while the app keeps
+        # writing to it
+        def backup_if_due():
+            backup_setting = liatris_db.LiatrisSQLCore.Settings.get_setting_by_key("BACKUPKEEP")
+            if not backup_setting or not backup_setting.Value.isdigit() or int(backup_setting.Value) == 0:
+                return
+            if liatris_backup.is_backup_due():
+                db_worker.submit(liatris_backup.create_snapshot, (int(backup_setting.Value),))
+
+        @liatris_profile.action
         def init_window():
             load_blank_page()
+            # Started before the store loads, changes written in between are applied again
+            change_monitor.start()
+            store.load()
             load_tasks()
-            load_upcoming_nums()
-            load_today_nums()
+            GLib.timeout_add(liatris_changes.POLL_INTERVAL_MS, change_monitor_timeout)
+            archive_completed_items()
+            backup_if_due()
 
         init_window()
 
@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import os
+import json
+
+import liatris_db
+
+NOTE_JOURNAL_FILE = liatris_db.DB_DIR + "/liatrisnotes.journal"
+
+# Milliseconds without typing after which the staged note edits are written to the database
+AUTOSAVE_IDLE_MS = 1000
+# Milliseconds after an edit after which the staged note edits are written to the journal, also while typing goes on
+JOURNAL_INTERVAL_MS = 1000
+
+
+# Makes a rename in a directory survive a crash of the system
+def sync_directory(directory):
+    directory_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
+
+
+# Collects note edits and writes them to the database in one transaction per flush, later edits of the same note
+# replace earlier ones. Staging only keeps the edit in memory. The journal file holds the latest staged content of
+# every note and is synced to disk when write_journal() runs, at most every JOURNAL_INTERVAL_MS while typing, and when
+# a flush fails. Edits that reached the journal survive a crash and are written on the next start by recover().
+class LiatrisNoteAutosave:
+    def __init__(self, journal_file=NOTE_JOURNAL_FILE):
+        self.journal_file = journal_file
+        # ItemId -> NoteContent of all edits that have not been written yet
+        self.pending = {}
+        # Whether pending holds edits the journal does not have yet
+        self.journal_outdated = False
+
+    # Stages the new content of the note of an item
+    def stage(self, item_id, note_content):
+        self.pending[item_id] = note_content
+        self.journal_outdated = True
+
+    # Replaces the journal with the staged edits, one line per note. It only ever holds the notes being edited since
+    # the last flush. The new journal is synced to disk before it takes the place of the old one, so a crash leaves
+    # one of them complete. Does nothing if the journal already holds every staged edit.
+    def write_journal(self):
+        if not self.journal_outdated:
+            return
+        temporary_file = self.journal_file + ".tmp"
+        with open(temporary_file, "w", encoding="utf-8") as journal:
+            for item_id, note_content in self.pending.items():
+                journal.write(json.dumps({"ItemId": item_id, "NoteContent": note_content}) + "\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temporary_file, self.journal_file)
+        sync_directory(os.path.dirname(os.path.abspath(self.journal_file)))
+        self.journal_outdated = False
+
+    def has_pending(self):
+        return len(self.pending) != 0
+
+    # Writes all staged edits to the database and clears the journal
+    def flush(self):
+        if len(self.pending) == 0:
+            return True
+
+        if not liatris_db.LiatrisSQLCore.ItemNotes.update_item_notes(self.pending):
+            # The edits stay staged for the next flush and are kept in the journal until then
+            self.write_journal()
+            return False
+
+        self.pending = {}
+        self.journal_outdated = False
+        self.clear_journal()
+        return True
+
+    def clear_journal(self):
+        for file in (self.journal_file, self.journal_file + ".tmp"):
+            if os.path.exists(file):
+                os.remove(file)
+
+    # Writes the edits of a journal left behind by a crash to the database. Journals of older versions list every edit,
+    # the last one of a note wins.
+    def recover(self):
+        if not os.path.exists(self.journal_file):
+            # A crash before the first journal took its place leaves only the new one, which may be incomplete
+            self.clear_journal()
+            return True
+
+        with open(self.journal_file, "r", encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Journals of older versions were appended to, their last line may have been cut off by the crash
+                    continue
+                self.pending[entry["ItemId"]] = entry["NoteContent"]
+
+        if len(self.pending) == 0:
+            self.clear_journal()
+            return True
+        return self.flush()
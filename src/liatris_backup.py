@@ -0,0 +1,226 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import liatris_db
+
+BACKUP_DIR = liatris_db.DB_DIR + "/backups"
+# Databases copied into every snapshot, one after the other
+BACKUP_FILES = [liatris_db.DB_FILE, liatris_db.ARCHIVE_FILE]
+# Number of snapshots kept, older ones are deleted after every backup
+BACKUP_KEEP = 7
+# Automatic backups are made when the latest snapshot is older than this
+BACKUP_INTERVAL = timedelta(days=1)
+# Pages copied per step of the backup API. With a rollback journal other connections can only write between two
+# steps, 256 pages of 4 KiB take about a millisecond.
+BACKUP_STEP_PAGES = 256
+# Number of times a copy may start over because of changes before it keeps other connections from writing
+BACKUP_MAX_RESTARTS = 3
+# Seconds to wait before a step is tried again while the database is locked
+BACKUP_RETRY_SLEEP = 0.05
+SNAPSHOT_NAME_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class BackupRestartedError(Exception):
+    pass
+
+
+# Copies a database with SQLite's online backup API while other connections keep using it. A step that sees a change
+# made by another connection starts the copy over, so with a write-ahead log the copy is taken from one read
+# transaction instead: it sees none of the later changes and does not block writers either. A rollback journal makes
+# writers wait for readers, there the lock is only held for one step at a time, unless changes made the copy start
+# over more than BACKUP_MAX_RESTARTS times. progress is called with the number of copied and total pages after every
+# step. Returns a timing report of the copy.
+def copy_database(source_file, target_file, step_pages=BACKUP_STEP_PAGES, progress=None):
+    report = {"File": os.path.basename(target_file), "Pages": 0, "Steps": 0, "Restarts": 0, "Bytes": 0,
+              "Seconds": 0.0}
+    remaining_pages = [None]
+
+    def step(status, remaining, total):
+        if remaining_pages[0] is not None and remaining > remaining_pages[0]:
+            report["Restarts"] += 1
+            if report["Restarts"] > BACKUP_MAX_RESTARTS and not source.in_transaction:
+                raise BackupRestartedError()
+        remaining_pages[0] = remaining
+        report["Steps"] += 1
+        report["Pages"] = total
+        if progress is not None:
+            progress(total - remaining, total)
+
+    source = sqlite3.connect(source_file)
+    target = sqlite3.connect(target_file)
+    start = time.perf_counter()
+    try:
+        hold_lock = source.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        while True:
+            if hold_lock:
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            try:
+                source.backup(target, pages=step_pages, progress=step, sleep=BACKUP_RETRY_SLEEP)
+                break
+            except BackupRestartedError:
+                hold_lock = True
+                remaining_pages[0] = None
+    finally:
+        target.close()
+        source.close()
+    report["Seconds"] = time.perf_counter() - start
+    report["Bytes"] = os.path.getsize(target_file)
+    return report
+
+
+# Lists the names of all snapshots, newest first
+def list_snapshots():
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    snapshots = []
+    for name in os.listdir(BACKUP_DIR):
+        try:
+            datetime.strptime(name, SNAPSHOT_NAME_FORMAT)
+        except ValueError:
+            # Snapshots that are still being written and everything else
+            continue
+        snapshots.append(name)
+    return sorted(snapshots, reverse=True)
+
+
+def get_snapshot_dir(snapshot_name):
+    return BACKUP_DIR + "/" + snapshot_name
+
+
+# Deletes all but the newest keep snapshots
+def rotate_snapshots(keep=BACKUP_KEEP):
+    for snapshot_name in list_snapshots()[keep:]:
+        shutil.rmtree(get_snapshot_dir(snapshot_name))
+
+
+# Returns True if the latest snapshot is older than BACKUP_INTERVAL or there is none
+def is_backup_due():
+    snapshots = list_snapshots()
+    if len(snapshots) == 0:
+        return True
+    return datetime.now() - datetime.strptime(snapshots[0], SNAPSHOT_NAME_FORMAT) >= BACKUP_INTERVAL
+
+
+# Copies the databases into a new snapshot and deletes the snapshots beyond keep, None keeps all of them. The snapshot
+# is written under a temporary name, so an interrupted backup never shows up as a snapshot. progress is called with the
+# file name and the number of copied and total pages. Returns the name of the snapshot and the timing reports.
+def create_snapshot(keep=BACKUP_KEEP, step_pages=BACKUP_STEP_PAGES, progress=None):
+    snapshot_name = datetime.now().strftime(SNAPSHOT_NAME_FORMAT)
+    partial_dir = get_snapshot_dir(snapshot_name + ".partial")
+    if os.path.exists(partial_dir):
+        shutil.rmtree(partial_dir)
+    os.makedirs(partial_dir)
+
+    reports = []
+    for source_file in BACKUP_FILES:
+        if not os.path.exists(source_file):
+            continue
+        file_progress = None
+        if progress is not None:
+            file_progress = lambda copied, total, file_name=os.path.basename(source_file): \
+                progress(file_name, copied, total)
+        reports.append(copy_database(source_file, partial_dir + "/" + os.path.basename(source_file), step_pages,
+                                     file_progress))
+
+    # Fails rather than replacing a snapshot made within the same second
+    os.rename(partial_dir, get_snapshot_dir(snapshot_name))
+    if keep is not None:
+        rotate_snapshots(keep)
+    return snapshot_name, reports
+
+
+# Writes the databases of a snapshot back. Liatris has to be closed, it would keep working with what it loaded
+# before. The current databases are saved as a snapshot first, which is not counted against the kept snapshots until
+# the next backup. Returns the name of that snapshot and the timing reports of the restore.
+def restore_snapshot(snapshot_name, step_pages=BACKUP_STEP_PAGES, progress=None):
+    snapshot_dir = get_snapshot_dir(snapshot_name)
+    if not os.path.exists(snapshot_dir + "/" + os.path.basename(liatris_db.DB_FILE)):
+        raise ValueError("There is no snapshot " + repr(snapshot_name))
+
+    saved_snapshot_name, _ = create_snapshot(keep=None, step_pages=step_pages)
+    reports = []
+    for target_file in BACKUP_FILES:
+        source_file = snapshot_dir + "/" + os.path.basename(target_file)
+        if not os.path.exists(source_file):
+            # Snapshots made before there was an archive
+            continue
+        file_progress = None
+        if progress is not None:
+            file_progress = lambda copied, total, file_name=os.path.basename(target_file): \
+                progress(file_name, copied, total)
+        report = copy_database(source_file, target_file, step_pages, file_progress)
+        report["File"] = os.path.basename(target_file)
+        reports.append(report)
+    return saved_snapshot_name, reports
+
+
+def format_report(report):
+    megabytes = report["Bytes"] / 1048576
+    throughput = megabytes / report["Seconds"] if report["Seconds"] > 0 else 0
+    return report["File"] + ": " + "{:.1f}".format(megabytes) + " MiB, " + str(report["Pages"]) + " pages in " + \
+        str(report["Steps"]) + " steps with " + str(report["Restarts"]) + " restarts, " + \
+        "{:.2f}".format(report["Seconds"]) + " seconds (" + "{:.1f}".format(throughput) + " MiB/s)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backs up and restores the databases of Liatris.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backup_parser = subparsers.add_parser("backup", help="copy the databases into a new snapshot")
+    backup_parser.add_argument("--keep", type=int, default=BACKUP_KEEP,
+                               help="number of snapshots to keep, defaults to " + str(BACKUP_KEEP))
+    subparsers.add_parser("list", help="list the snapshots, newest first")
+    restore_parser = subparsers.add_parser("restore", help="replace the databases with a snapshot, close Liatris first")
+    restore_parser.add_argument("snapshot", help="name of the snapshot or latest")
+    for command_parser in (backup_parser, restore_parser):
+        command_parser.add_argument("--pages", type=int, default=BACKUP_STEP_PAGES,
+                                    help="pages copied per step, defaults to " + str(BACKUP_STEP_PAGES))
+        command_parser.add_argument("--quiet", action="store_true", help="do not report progress and timings")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for snapshot_name in list_snapshots():
+            sys.stdout.write(snapshot_name + "\n")
+        return 0
+
+    def progress(file_name, copied, total):
+        if not args.quiet:
+            sys.stderr.write("\r" + file_name + ": " + str(copied) + " of " + str(total) + " pages")
+            sys.stderr.flush()
+
+    try:
+        if args.command == "backup":
+            snapshot_name, reports = create_snapshot(args.keep, args.pages, progress)
+            message = "Saved snapshot " + snapshot_name
+        else:
+            snapshot_name = args.snapshot
+            if snapshot_name == "latest":
+                snapshots = list_snapshots()
+                if len(snapshots) == 0:
+                    raise ValueError("There are no snapshots")
+                snapshot_name = snapshots[0]
+            saved_snapshot_name, reports = restore_snapshot(snapshot_name, args.pages, progress)
+            message = "Restored snapshot " + snapshot_name + ", the replaced databases were saved as snapshot " + \
+                saved_snapshot_name
+    except (OSError, ValueError, sqlite3.Error) as error:
+        sys.stderr.write("\nError: " + str(error) + "\n")
+        return 1
+
+    if not args.quiet:
+        sys.stderr.write("\n")
+        for report in reports:
+            sys.stderr.write(format_report(report) + "\n")
+    sys.stdout.write(message + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
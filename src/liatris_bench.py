@@ -0,0 +1,378 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from copy import copy
+from datetime import date, datetime, timedelta
+
+import liatris_version
+
+DEFAULT_SIZES = [10, 1000, 100000]
+DEFAULT_SEED = 1
+DEFAULT_REPEAT = 5
+# Differences below this many seconds are noise and never count as a regression
+COMPARE_MIN_SECONDS = 0.001
+# Names of liatris_db.STORAGE_PROFILES, liatris_db is only imported by the child processes
+STORAGE_PROFILE_NAMES = ["safe", "balanced", "fast"]
+# Benchmarks that write to the database, --profiles runs only these
+WRITE_BENCHMARKS = ["insert", "insert_many", "Settings.update_setting", "Tasks.update_task", "Items.update_item",
+                    "Items.mark_items", "Items.move_items", "Items.set_items_date", "ItemNotes.update_item_notes",
+                    "Items.delete_item", "Items.delete_items", "Tasks.delete_task"]
+
+WORDS = ["call", "email", "buy", "fix", "write", "read", "plan", "review", "book", "pay", "clean", "order", "meeting",
+         "report", "groceries", "invoice", "garden", "car", "doctor", "tickets", "budget", "draft", "backup", "notes"]
+
+
+# Yields the Task, Item and Note records of a generated database in the format of LiatrisSQLCore.Transfer. The same
+# seed always yields the same records, deadlines and completion dates are relative to today so that Today, Upcoming
+# and the Logbook hold comparable shares of the items on every day.
+def generate_records(projects, items, seed=DEFAULT_SEED, done_ratio=0.3, deadline_ratio=0.5, note_ratio=0.1,
+                     note_size=200):
+    rng = random.Random(seed)
+    today = datetime.combine(date.today(), datetime.min.time())
+
+    for task_id in range(1, projects + 1):
+        yield {"Type": "Task", "TaskId": task_id, "TaskName": "Project " + str(task_id)}
+
+    for item_id in range(1, items + 1):
+        item_is_done = rng.random() < done_ratio
+        item_date = None
+        if rng.random() < deadline_ratio:
+            item_date = today + timedelta(days=rng.randint(-30, 60))
+        item_done_date = None
+        if item_is_done:
+            item_done_date = today - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86399))
+        yield {"Type": "Item", "ItemId": item_id, "TaskId": rng.randint(1, projects), "ItemIsDone": item_is_done,
+               "ItemTitle": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))) + " " + str(item_id),
+               "ItemDate": item_date, "ItemDoneDate": item_done_date}
+
+        if rng.random() < note_ratio:
+            note_words = []
+            while sum(len(word) + 1 for word in note_words) < note_size:
+                note_words.append(rng.choice(WORDS))
+            yield {"Type": "Note", "ItemId": item_id, "NoteContent": " ".join(note_words)[:note_size]}
+
+
+# Runs function(*prepare()) repeat times, only the calls of function are timed. Returns the timings, the number of
+# statements of the last run and optionally the peak memory of one more run.
+def measure(function, prepare, repeat, queries, memory):
+    timings = []
+    for _ in range(repeat):
+        args = prepare()
+        queries[0] = 0
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+
+    result = {"Runs": repeat, "Min": min(timings), "Median": statistics.median(timings), "Max": max(timings),
+              "Queries": queries[0]}
+    if memory:
+        args = prepare()
+        tracemalloc.start()
+        function(*args)
+        result["PeakBytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+# Fills the database of this process and times every LiatrisSQLCore function and the data loads behind the views, or
+# only the ones that write. liatris_db has to be imported after LIATRIS_DB_DIR was set, so this runs in a child process
+# per size.
+def run_benchmarks(projects, items, seed, repeat, memory, note_size, writes_only=False):
+    import liatris_db
+    import liatris_store
+    from liatris_db import LiatrisSQLCore
+    from models.liatris_model_tasks import LiatrisTask
+    from models.liatris_model_items import LiatrisItem
+    from models.liatris_model_settings import LiatrisSetting
+
+    queries = [0]
+    liatris_db.db.event.listen(liatris_db.get_engine(), "before_cursor_execute",
+                               lambda *args: queries.__setitem__(0, queries[0] + 1))
+
+    start = time.perf_counter()
+    LiatrisSQLCore.Transfer.import_records(generate_records(projects, items, seed, note_size=note_size))
+    fill_seconds = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    setting = LiatrisSetting()
+    setting.Key = "BENCHMARK"
+    setting.Value = "0"
+    LiatrisSQLCore.insert(setting)
+    store = liatris_store.LiatrisStore()
+    store.load()
+    task_ids = [task.TaskId for task in LiatrisSQLCore.Tasks.get_all_tasks()]
+    item_ids = [item_id for item_id, _, _, _ in LiatrisSQLCore.Items.get_item_states()]
+
+    def random_item_ids(count=100):
+        return rng.sample(item_ids, min(count, len(item_ids)))
+
+    def random_task_id():
+        return rng.choice(task_ids)
+
+    def random_search_key():
+        return rng.choice(WORDS) + " " + rng.choice(WORDS)
+
+    def no_args():
+        return ()
+
+    # Adds a project with items, for the benchmarks that delete one
+    def add_task_with_items(count=1000):
+        task = LiatrisTask()
+        task.TaskName = "Deleted project"
+        LiatrisSQLCore.insert(task)
+        new_items = []
+        for index in range(count):
+            item = LiatrisItem()
+            item.TaskId = task.TaskId
+            item.ItemIsDone = False
+            item.ItemTitle = "Deleted item " + str(index)
+            new_items.append(item)
+        LiatrisSQLCore.insert_many(new_items)
+        return task.TaskId, [item.ItemId for item in new_items]
+
+    def prepare_new_item():
+        item = LiatrisItem()
+        item.TaskId = random_task_id()
+        item.ItemIsDone = False
+        item.ItemTitle = "New item"
+        return (item,)
+
+    # The views hand rows of the items they list to update_item
+    def prepare_changed_item():
+        item = LiatrisSQLCore.Items.get_item_by_id(rng.choice(item_ids))
+        return (liatris_db.LiatrisItemRow(item.ItemId, item.TaskId, not item.ItemIsDone, item.ItemTitle, item.ItemDate,
+                                          item.ItemDoneDate),)
+
+    def prepare_changed_setting():
+        changed_setting = LiatrisSetting()
+        changed_setting.Key = setting.Key
+        changed_setting.Value = str(rng.random())
+        return (changed_setting,)
+
+    def prepare_renamed_task():
+        task = copy(LiatrisSQLCore.Tasks.get_all_tasks()[0])
+        task.TaskName = "Renamed project " + str(rng.random())
+        return (task,)
+
+    # The views list rows with an icon for items that have a note
+    def load_view(task_items):
+        if task_items:
+            LiatrisSQLCore.ItemNotes.get_note_lengths([item.ItemId for task_item in task_items
+                                                       for item in task_item.ITEMS])
+
+    def consume(records):
+        for _ in records:
+            pass
+
+    # Name, function and argument preparation, in the order in which they run. Benchmarks that change items run after
+    # the ones that only read, the archive runs last since it moves most of the completed items.
+    benchmarks = [
+        ("Settings.get_setting_by_key", LiatrisSQLCore.Settings.get_setting_by_key, lambda: ("BENCHMARK",)),
+        ("Tasks.get_all_tasks", LiatrisSQLCore.Tasks.get_all_tasks, no_args),
+        ("Tasks.get_task_counters", LiatrisSQLCore.Tasks.get_task_counters, no_args),
+        ("Tasks.produce_all_task_items", LiatrisSQLCore.Tasks.produce_all_task_items, no_args),
+        ("Tasks.produce_task_item_by_task_id", LiatrisSQLCore.Tasks.produce_task_item_by_task_id,
+         lambda: (random_task_id(),)),
+        ("Tasks.search_tasks", LiatrisSQLCore.Tasks.search_tasks, lambda: ("project 1",)),
+        ("Tasks.search_task_items", LiatrisSQLCore.Tasks.search_task_items, lambda: (random_search_key(),)),
+        ("Tasks.search_task_items_without_index", LiatrisSQLCore.Tasks.search_task_items_without_index,
+         lambda: (random_search_key(),)),
+        ("SmartLists.produce_today", LiatrisSQLCore.SmartLists.produce_today, no_args),
+        ("SmartLists.count_today", LiatrisSQLCore.SmartLists.count_today, no_args),
+        ("SmartLists.produce_upcoming", LiatrisSQLCore.SmartLists.produce_upcoming, lambda: (7,)),
+        ("SmartLists.count_upcoming", LiatrisSQLCore.SmartLists.count_upcoming, lambda: (7,)),
+        ("SmartLists.produce_someday", LiatrisSQLCore.SmartLists.produce_someday, no_args),
+        ("SmartLists.produce_logbook", LiatrisSQLCore.SmartLists.produce_logbook, no_args),
+        ("SmartLists.produce_logbook_page", LiatrisSQLCore.SmartLists.produce_logbook_page, no_args),
+        ("Items.get_item_states", LiatrisSQLCore.Items.get_item_states, no_args),
+        ("Items.get_item_by_id", LiatrisSQLCore.Items.get_item_by_id, lambda: (rng.choice(item_ids),)),
+        ("ItemNotes.get_item_note_by_item_id", LiatrisSQLCore.ItemNotes.get_item_note_by_item_id,
+         lambda: (rng.choice(item_ids),)),
+        ("ItemNotes.get_note_lengths", LiatrisSQLCore.ItemNotes.get_note_lengths, lambda: (random_item_ids(1000),)),
+        ("Archive.count_archived_items", LiatrisSQLCore.Archive.count_archived_items, no_args),
+        ("Transfer.export_records", lambda: consume(LiatrisSQLCore.Transfer.export_records()), no_args),
+        ("Store.load", store.load, no_args),
+        ("View.project", lambda task_id: load_view([LiatrisSQLCore.Tasks.produce_task_item_by_task_id(task_id)]),
+         lambda: (random_task_id(),)),
+        ("View.today", lambda: load_view(LiatrisSQLCore.SmartLists.produce_today()), no_args),
+        ("View.someday", lambda: load_view(LiatrisSQLCore.SmartLists.produce_someday()), no_args),
+        ("View.logbook", lambda: load_view(LiatrisSQLCore.SmartLists.produce_logbook_page()[0]), no_args),
+        ("View.search", lambda search_key: load_view(LiatrisSQLCore.Tasks.search_task_items(search_key)),
+         lambda: (random_search_key(),)),
+        ("View.item", lambda item_id: (LiatrisSQLCore.Items.get_item_by_id(item_id),
+                                       LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(item_id)),
+         lambda: (rng.choice(item_ids),)),
+        ("insert", LiatrisSQLCore.insert, prepare_new_item),
+        ("insert_many", LiatrisSQLCore.insert_many, lambda: ([prepare_new_item()[0] for _ in range(100)],)),
+        ("Settings.update_setting", LiatrisSQLCore.Settings.update_setting, prepare_changed_setting),
+        ("Tasks.update_task", LiatrisSQLCore.Tasks.update_task, prepare_renamed_task),
+        ("Items.update_item", LiatrisSQLCore.Items.update_item, prepare_changed_item),
+        ("Items.mark_items", LiatrisSQLCore.Items.mark_items, lambda: (random_item_ids(), rng.random() < 0.5)),
+        ("Items.move_items", LiatrisSQLCore.Items.move_items, lambda: (random_item_ids(), random_task_id())),
+        ("Items.set_items_date", LiatrisSQLCore.Items.set_items_date, lambda: (random_item_ids(), datetime.now())),
+        ("ItemNotes.update_item_notes", LiatrisSQLCore.ItemNotes.update_item_notes,
+         lambda: ({item_id: "Changed note " + str(item_id) for item_id in random_item_ids(10)},)),
+        ("Items.delete_item", LiatrisSQLCore.Items.delete_item, lambda: (add_task_with_items(1)[1][0],)),
+        ("Items.delete_items", LiatrisSQLCore.Items.delete_items, lambda: (add_task_with_items(100)[1],)),
+        ("Tasks.delete_task", LiatrisSQLCore.Tasks.delete_task, lambda: (add_task_with_items()[0],)),
+        ("Archive.archive_completed", LiatrisSQLCore.Archive.archive_completed, lambda: (180,))
+    ]
+
+    results = {}
+    for name, function, prepare in benchmarks:
+        if writes_only and name not in WRITE_BENCHMARKS:
+            continue
+        # The first archive run moves the items, later ones would find nothing
+        runs = 1 if name == "Archive.archive_completed" else repeat
+        results[name] = measure(function, prepare, runs, queries, memory)
+    # The pragmas the storage profile actually set
+    with liatris_db.get_engine().connect() as connection:
+        pragmas = {pragma: connection.exec_driver_sql("PRAGMA " + pragma).scalar()
+                   for pragma in ("journal_mode", "synchronous")}
+    return {"Projects": projects, "Items": items, "FillSeconds": fill_seconds,
+            "FileBytes": os.path.getsize(liatris_db.DB_FILE), "Pragmas": pragmas, "Benchmarks": results}
+
+
+# Runs the benchmarks of one size in a child process with its own temporary database
+def run_size(items, args, profile=None, writes_only=False):
+    db_dir = tempfile.mkdtemp(prefix="liatris-bench-", dir=args.dir)
+    environment = dict(os.environ)
+    environment["LIATRIS_DB_DIR"] = db_dir
+    if profile is not None:
+        environment["LIATRIS_STORAGE_PROFILE"] = profile
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--items", str(items),
+               "--projects", str(min(args.projects, max(items, 1))), "--seed", str(args.seed),
+               "--repeat", str(args.repeat), "--note-size", str(args.note_size)]
+    if args.memory:
+        command.append("--memory")
+    if writes_only:
+        command.append("--writes")
+    try:
+        output = subprocess.run(command, env=environment, check=True, stdout=subprocess.PIPE,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+    return json.loads(output)
+
+
+# Prints the median of every benchmark next to the one of an earlier result file. Returns the number of benchmarks
+# that got slower by more than the threshold.
+def compare_results(old_results, new_results, threshold):
+    regressions = 0
+    for size, new_size in new_results["Sizes"].items():
+        old_size = old_results["Sizes"].get(size)
+        if old_size is None:
+            continue
+        sys.stdout.write("\n" + size + " items\n")
+        for name, new_benchmark in new_size["Benchmarks"].items():
+            old_benchmark = old_size["Benchmarks"].get(name)
+            if old_benchmark is None:
+                continue
+            old_seconds = old_benchmark["Median"]
+            new_seconds = new_benchmark["Median"]
+            change = (new_seconds - old_seconds) / old_seconds if old_seconds > 0 else 0
+            marker = ""
+            if change > threshold and new_seconds - old_seconds > COMPARE_MIN_SECONDS:
+                marker = "  slower"
+                regressions += 1
+            elif change < -threshold and old_seconds - new_seconds > COMPARE_MIN_SECONDS:
+                marker = "  faster"
+            sys.stdout.write("{:<42} {:>10.2f} ms {:>10.2f} ms {:>+8.1%} {:>5} {:>5} queries{}\n".format(
+                name, old_seconds * 1000, new_seconds * 1000, change, old_benchmark["Queries"],
+                new_benchmark["Queries"], marker))
+    return regressions
+
+
+# Prints the median of every write benchmark for each storage profile side by side
+def write_profile_table(profile_results):
+    profiles = list(profile_results.keys())
+    for size in profile_results[profiles[0]]["Sizes"].keys():
+        sys.stdout.write("\n{:<48}".format(size + " items") + "".join("{:>13}".format(profile) for profile in profiles))
+        sys.stdout.write("\n{:<48}".format("journal_mode, synchronous") + "".join(
+            "{:>13}".format(str(size_results["Pragmas"]["journal_mode"]) + ", " +
+                            str(size_results["Pragmas"]["synchronous"]))
+            for size_results in (profile_results[profile]["Sizes"][size] for profile in profiles)) + "\n")
+        for name in WRITE_BENCHMARKS:
+            sys.stdout.write("{:<48}".format(name) + "".join(
+                "{:>10.2f} ms".format(profile_results[profile]["Sizes"][size]["Benchmarks"][name]["Median"] * 1000)
+                for profile in profiles) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the database functions of Liatris on generated databases.")
+    parser.add_argument("--items", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="database sizes in items, defaults to " + " ".join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument("--projects", type=int, default=100, help="number of projects, defaults to 100")
+    parser.add_argument("--note-size", type=int, default=200, help="characters per note, defaults to 200")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed runs per benchmark")
+    parser.add_argument("--profile", choices=STORAGE_PROFILE_NAMES,
+                        help="storage profile, see liatris_db.STORAGE_PROFILES")
+    parser.add_argument("--profiles", choices=STORAGE_PROFILE_NAMES, nargs="+",
+                        help="only time the benchmarks that write, once with each of the storage profiles")
+    parser.add_argument("--dir", help="directory for the temporary databases, use one on the disk Liatris runs on to "
+                                      "time writes, temporary directories are often kept in memory")
+    parser.add_argument("--memory", action="store_true", help="also record the peak memory of every benchmark")
+    parser.add_argument("--output", help="file to write the results to as JSON")
+    parser.add_argument("--compare", help="results of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown reported as a regression, defaults to 0.2")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--writes", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.profiles is not None and (args.profile is not None or args.compare is not None):
+        parser.error("--profiles can not be combined with --profile or --compare")
+
+    if args.child:
+        json.dump(run_benchmarks(args.projects, args.items[0], args.seed, args.repeat, args.memory, args.note_size,
+                                 args.writes), sys.stdout)
+        return 0
+
+    results = {"Liatris": liatris_version.LIATRIS_VERSION, "Python": platform.python_version(),
+               "SQLite": sqlite3.sqlite_version, "Seed": args.seed, "Repeat": args.repeat,
+               "StorageProfile": args.profile, "Sizes": {}}
+    if args.profiles is not None:
+        results["StorageProfiles"] = {}
+        for profile in args.profiles:
+            results["StorageProfiles"][profile] = {"Sizes": {}}
+            for items in args.items:
+                sys.stderr.write("Benchmarking the writes of " + str(items) + " items with the " + profile +
+                                 " profile\n")
+                results["StorageProfiles"][profile]["Sizes"][str(items)] = run_size(items, args, profile, True)
+        write_profile_table(results["StorageProfiles"])
+        if args.output is not None:
+            with open(args.output, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+        return 0
+
+    for items in args.items:
+        sys.stderr.write("Benchmarking " + str(items) + " items\n")
+        results["Sizes"][str(items)] = run_size(items, args, args.profile)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            if compare_results(json.load(file), results, args.threshold) != 0:
+                return 1
+    elif args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import sqlite3
+
+import liatris_db
+
+# Milliseconds between two polls of the window and the daemon
+POLL_INTERVAL_MS = 1000
+
+
+# Rows changed since the last poll, see LiatrisChangeMonitor.poll
+class LiatrisChangeSet:
+    def __init__(self):
+        self.task_ids = set()
+        self.item_ids = set()
+        # ItemIds of the items whose note changed
+        self.note_item_ids = set()
+        self.settings_changed = False
+        # Set when every row may have changed, after an import or when entries the monitor did not read yet were
+        # pruned from the change log
+        self.reload = False
+
+    def add(self, table_name, row_id):
+        if table_name == "LiatrisSettings":
+            self.settings_changed = True
+        elif row_id is None:
+            self.reload = True
+        elif table_name == "LiatrisTasks":
+            self.task_ids.add(row_id)
+        elif table_name == "LiatrisItems":
+            self.item_ids.add(row_id)
+        elif table_name == "LiatrisItemNotes":
+            self.note_item_ids.add(row_id)
+
+    def is_empty(self):
+        return not self.reload and not self.settings_changed and len(self.task_ids) == 0 and \
+            len(self.item_ids) == 0 and len(self.note_item_ids) == 0
+
+
+# Notices changes written to the database by other processes. Changes committed by this process are skipped, see
+# liatris_db.OWN_CHANGE_IDS. PRAGMA data_version of a connection changes whenever another connection commits, the monitor keeps its own
+# connection that never writes and only reads the change log, see liatris_db.CHANGE_TRIGGERS, once the version moved.
+# Polls that find nothing cost one pragma and do not read any table.
+class LiatrisChangeMonitor:
+    def __init__(self):
+        self.connection = None
+        self.data_version = None
+        self.last_change_id = 0
+
+    # Starts watching, changes committed before are not reported
+    def start(self):
+        if liatris_db.OWN_CHANGE_IDS is None:
+            liatris_db.OWN_CHANGE_IDS = set()
+        self.connection = liatris_db.get_engine().raw_connection()
+        self.data_version = self.get_data_version()
+        self.last_change_id = self.connection.execute("SELECT coalesce(max(ChangeId), 0) FROM LiatrisChanges") \
+            .fetchone()[0]
+
+    def stop(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        liatris_db.OWN_CHANGE_IDS = None
+
+    def get_data_version(self):
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    # Returns a LiatrisChangeSet of the rows other processes changed since the last poll, None if nothing changed or the
+    # database could not be read, that poll is then repeated by the next one
+    def poll(self):
+        try:
+            data_version = self.get_data_version()
+            if data_version == self.data_version:
+                return None
+            changes = self.connection.execute("SELECT ChangeId, TableName, RowId FROM LiatrisChanges "
+                                              "WHERE ChangeId > ? ORDER BY ChangeId", (self.last_change_id,)).fetchall()
+        except sqlite3.Error:
+            return None
+
+        self.data_version = data_version
+        if len(changes) == 0:
+            return None
+        change_set = LiatrisChangeSet()
+        own_change_ids = liatris_db.OWN_CHANGE_IDS
+        # Change ids are handed out one after the other, a gap means the change log was pruned past the last poll
+        if changes[0][0] != self.last_change_id + 1:
+            change_set.reload = True
+            # Own entries that were pruned are never read
+            own_change_ids.difference_update([change_id for change_id in own_change_ids if change_id < changes[0][0]])
+        for change_id, table_name, row_id in changes:
+            if change_id in own_change_ids:
+                own_change_ids.discard(change_id)
+                continue
+            change_set.add(table_name, row_id)
+        self.last_change_id = changes[-1][0]
+        if change_set.is_empty():
+            return None
+        return change_set
@@ -0,0 +1,196 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import argparse
+import json
+import shlex
+import sys
+
+# The commands themselves are in liatris_commands, which is only imported when they run here. With --daemon they run
+# in liatris_daemon and this process never loads SQLAlchemy. Single commands that only read are answered by
+# liatris_reader without SQLAlchemy as well.
+
+# Options of the command line that are not parameters of the commands
+CLI_OPTIONS = ["command", "json", "batch", "daemon"]
+# Completion date of items completed before completion dates were recorded, liatris_db.LOGBOOK_EPOCH
+LOGBOOK_EPOCH_DAY = "1970-01-01"
+
+
+class CliError(Exception):
+    pass
+
+
+# Output, every command writes either lines of text or JSON Lines with --json
+
+def write_item_records(records):
+    task_id = None
+    for record in records:
+        if record["TaskId"] != task_id:
+            task_id = record["TaskId"]
+            sys.stdout.write(str(record["TaskName"]) + " (" + str(task_id) + ")\n")
+
+        line = str(record["ItemId"]).rjust(7) + "  [" + ("x" if record["ItemIsDone"] else " ") + "]  " + \
+            str(record["ItemTitle"])
+        if record.get("ItemDate") is not None:
+            line += "  (due " + record["ItemDate"][:10] + ")"
+        if record["ItemIsDone"] and record.get("ItemDoneDate") is not None and \
+                not record["ItemDoneDate"].startswith(LOGBOOK_EPOCH_DAY):
+            line += "  (done " + record["ItemDoneDate"][:10] + ")"
+        sys.stdout.write(line + "\n")
+
+
+def write_result(args, result):
+    if args.json:
+        for record in (result if isinstance(result, list) else [result]):
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    elif args.command == "done":
+        sys.stdout.write("Marked " + str(result["Count"]) + " tasks as " +
+                         ("done" if result["ItemIsDone"] else "not done") + "\n")
+    elif args.command == "stats":
+        for key, value in result.items():
+            sys.stdout.write(key.ljust(10) + str(value) + "\n")
+    elif args.command == "list" and args.project is None:
+        for record in result:
+            sys.stdout.write(str(record["TaskId"]).rjust(7) + "  " + record["TaskName"] + "  " +
+                             str(record["DoneItems"]) + "/" + str(record["TotalItems"]) + "\n")
+    else:
+        write_item_records(result)
+
+
+def get_command_params(args):
+    return {key: value for key, value in vars(args).items() if key not in CLI_OPTIONS}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Manages the projects and tasks of Liatris from the command line.")
+    parser.add_argument("--json", action="store_true", help="write JSON Lines instead of text")
+    parser.add_argument("--batch", action="store_true",
+                        help="read one command per line from standard input and run all of them in one transaction")
+    parser.add_argument("--daemon", action="store_true", help="send the commands to a running liatris_daemon")
+    subparsers = parser.add_subparsers(dest="command")
+
+    add_parser = subparsers.add_parser("add", help="add a task to a project")
+    add_parser.add_argument("project", help="name or id of the project")
+    add_parser.add_argument("title", nargs="+", help="title of the task")
+    add_parser.add_argument("--date", help="deadline as YYYY-MM-DD, today or tomorrow")
+    add_parser.add_argument("--note", help="note of the task")
+    add_parser.add_argument("--new", action="store_true", help="create the project if there is none with the name")
+
+    list_parser = subparsers.add_parser("list", help="list the projects, or the open tasks of a project")
+    list_parser.add_argument("project", nargs="?", help="name or id of the project")
+    list_parser.add_argument("--all", action="store_true", help="list completed tasks as well")
+
+    done_parser = subparsers.add_parser("done", help="mark tasks as done")
+    done_parser.add_argument("item_ids", metavar="id", type=int, nargs="+", help="id of a task")
+    done_parser.add_argument("--undo", action="store_true", help="mark the tasks as not done instead")
+
+    search_parser = subparsers.add_parser("search", help="search titles, deadlines and notes of all tasks")
+    search_parser.add_argument("words", nargs="+")
+    search_parser.add_argument("--limit", type=int, help="number of results")
+
+    subparsers.add_parser("today", help="list open tasks that are due today or overdue")
+    upcoming_parser = subparsers.add_parser("upcoming", help="list open tasks that are due in the next days")
+    upcoming_parser.add_argument("--days", type=int, help="defaults to the setting of Liatris")
+    subparsers.add_parser("someday", help="list open tasks without a deadline")
+    logbook_parser = subparsers.add_parser("logbook", help="list the most recently completed tasks")
+    logbook_parser.add_argument("project", nargs="?", help="name or id of a project to limit the logbook to")
+    logbook_parser.add_argument("--limit", type=int, help="number of tasks")
+
+    subparsers.add_parser("stats", help="count projects and tasks")
+    return parser
+
+
+# Parses the commands of a batch, one per line. Empty lines and lines starting with # are skipped. The --json option
+# of the command line applies to all of them.
+def parse_batch(parser, lines, json_output):
+    commands = []
+    for line_number, line in enumerate(lines, 1):
+        if line.strip() == "" or line.lstrip().startswith("#"):
+            continue
+        try:
+            command_args = parser.parse_args(shlex.split(line))
+        except ValueError as error:
+            raise CliError("line " + str(line_number) + ": " + str(error))
+        except SystemExit:
+            # argparse has reported the error already
+            raise CliError("line " + str(line_number) + " is not a valid command")
+        if command_args.command is None or command_args.batch or command_args.daemon:
+            raise CliError("line " + str(line_number) + " is not a valid command")
+        command_args.json = command_args.json or json_output
+        commands.append(command_args)
+    return commands
+
+
+# Runs a single command through liatris_reader and returns its result, None if it has to run through run_here
+def run_read_only(commands):
+    if len(commands) != 1:
+        return None
+    import liatris_reader
+
+    result = liatris_reader.run_command(commands[0].command, get_command_params(commands[0]))
+    if result is None:
+        return None
+    return [result]
+
+
+# Runs the commands in this process and returns their results, more than one are run in one transaction
+def run_here(commands):
+    import liatris_commands
+    import liatris_store
+
+    # The store is not loaded, it only writes through
+    store = liatris_store.LiatrisStore()
+    try:
+        if len(commands) == 1:
+            return [liatris_commands.run_command(commands[0].command, get_command_params(commands[0]), store)]
+        return liatris_commands.run_commands([(command_args.command, get_command_params(command_args))
+                                              for command_args in commands], store)
+    except liatris_commands.CommandError as error:
+        raise CliError(str(error))
+
+
+# Sends the commands to the daemon and returns their results, more than one are run in one transaction
+def run_in_daemon(commands):
+    import liatris_client
+
+    try:
+        with liatris_client.LiatrisClient() as client:
+            if len(commands) == 1:
+                return [client.call(commands[0].command, get_command_params(commands[0]))]
+            return client.call("batch", {"commands": [{"method": command_args.command,
+                                                       "params": get_command_params(command_args)}
+                                                      for command_args in commands]})
+    except liatris_client.LiatrisRpcError as error:
+        raise CliError(str(error))
+    except OSError as error:
+        raise CliError("the daemon does not answer (" + str(error) + "), start it with python3 liatris_daemon.py")
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if not args.batch and args.command is None:
+        parser.print_usage(sys.stderr)
+        return 2
+
+    try:
+        commands = parse_batch(parser, sys.stdin, args.json) if args.batch else [args]
+        # In a batch commands see the changes of the commands before them, nothing is written unless all of them
+        # succeed
+        if args.daemon:
+            results = run_in_daemon(commands)
+        else:
+            results = run_read_only(commands)
+            if results is None:
+                results = run_here(commands)
+    except CliError as error:
+        sys.stderr.write("Error: " + str(error) + "\n")
+        return 1
+
+    for command_args, result in zip(commands, results):
+        write_result(command_args, result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
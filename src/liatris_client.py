@@ -0,0 +1,82 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import json
+import socket
+
+import liatris_paths
+
+# Client of liatris_daemon. It only needs the standard library, so scripts that talk to the daemon start without
+# loading SQLAlchemy.
+
+
+# An error reported by the daemon, code is the JSON-RPC error code
+class LiatrisRpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+# Sends JSON-RPC 2.0 requests to the daemon over its Unix socket, one request and one response per line. The
+# connection is opened by the first call and kept for the following ones.
+class LiatrisClient:
+    def __init__(self, socket_file=liatris_paths.SOCKET_FILE, timeout=None):
+        self.socket_file = socket_file
+        self.timeout = timeout
+        self.connection = None
+        self.reader = None
+        self.request_id = 0
+
+    def connect(self):
+        if self.connection is None:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            try:
+                connection.connect(self.socket_file)
+            except OSError:
+                connection.close()
+                raise
+            self.connection = connection
+            self.reader = connection.makefile("rb")
+
+    def close(self):
+        if self.connection is not None:
+            self.reader.close()
+            self.connection.close()
+            self.connection = None
+            self.reader = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Calls a method of the daemon with a dictionary of parameters and returns its result. Raises LiatrisRpcError if
+    # the daemon reports an error and OSError if it can not be reached.
+    def call(self, method, params=None):
+        self.connect()
+        self.request_id += 1
+        request = {"jsonrpc": "2.0", "id": self.request_id, "method": method}
+        if params is not None:
+            request["params"] = params
+        self.connection.sendall(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+
+        line = self.reader.readline()
+        if not line:
+            self.close()
+            raise ConnectionResetError("the daemon closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise LiatrisRpcError(response["error"].get("code"), response["error"].get("message"))
+        return response.get("result")
+
+
+# Returns True if a daemon answers on the socket
+def is_daemon_running(socket_file=liatris_paths.SOCKET_FILE):
+    try:
+        with LiatrisClient(socket_file, timeout=1) as client:
+            client.call("ping")
+    except (OSError, ValueError, LiatrisRpcError):
+        return False
+    return True
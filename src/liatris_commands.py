@@ -0,0 +1,223 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+from datetime import date, datetime, timedelta
+
+import liatris_db
+import liatris_transfer
+from models.liatris_model_tasks import normalize_task_name
+
+LiatrisSQLCore = liatris_db.LiatrisSQLCore
+
+# Commands of liatris_cli and liatris_daemon. Every command takes a dictionary of parameters, with the names of the
+# command line options, and a LiatrisStore that writes go through. The daemon passes its loaded store, which also
+# answers the counts, the command line passes one that is not loaded. Results only hold plain values, so they can be
+# sent as JSON: tasks are listed as item records with the TaskId and TaskName of their project.
+
+DEFAULT_UPCOMING_THRESHOLD = 7
+DATE_WORDS = {"today": 0, "tomorrow": 1}
+
+
+# Errors of a command, reported without a traceback. In a batch they roll the whole batch back.
+class CommandError(Exception):
+    pass
+
+
+# Raises a CommandError if a LiatrisSQLCore function failed
+def check(result):
+    if result is False:
+        raise CommandError("the database refused the command")
+    return result
+
+
+# Parses a deadline given as YYYY-MM-DD, today or tomorrow
+def parse_date(value):
+    if value is None:
+        return None
+    if str(value).lower() in DATE_WORDS:
+        return date.today() + timedelta(days=DATE_WORDS[str(value).lower()])
+    try:
+        return date.fromisoformat(str(value))
+    except ValueError:
+        raise CommandError("not a date: " + repr(value) + ", use YYYY-MM-DD, today or tomorrow")
+
+
+# Joins words given as a list, like the command line passes them
+def join_words(words):
+    if isinstance(words, (list, tuple)):
+        return " ".join(str(word) for word in words).strip()
+    return str(words).strip()
+
+
+def get_upcoming_threshold():
+    setting = LiatrisSQLCore.Settings.get_setting_by_key("UPCOMINGTHRESHOLD")
+    if not setting or not setting.Value.isdigit():
+        return DEFAULT_UPCOMING_THRESHOLD
+    return int(setting.Value)
+
+
+# Finds a project by its id or by its name, case insensitive. create adds a project with the name if there is none.
+def find_project(name_or_id, store, create=False):
+    name_or_id = str(name_or_id).strip()
+    tasks = store.get_tasks() if store.loaded else check(LiatrisSQLCore.Tasks.get_all_tasks())
+    if name_or_id.isdigit():
+        for task in tasks:
+            if task.TaskId == int(name_or_id):
+                return task
+
+    name_key = normalize_task_name(name_or_id)
+    found_tasks = [task for task in tasks
+                   if task.TaskName is not None and normalize_task_name(task.TaskName) == name_key]
+    if len(found_tasks) == 1:
+        return found_tasks[0]
+    if len(found_tasks) > 1:
+        raise CommandError("there are several projects named " + repr(name_or_id) + ", use one of the ids " +
+                           ", ".join(str(task.TaskId) for task in found_tasks))
+    if not create:
+        raise CommandError("there is no project " + repr(name_or_id) + ", add --new to create it")
+    return check(store.add_task(name_or_id))
+
+
+def get_item_record(task, item):
+    return liatris_transfer.encode_record({"TaskId": task.TaskId, "TaskName": task.TaskName, "ItemId": item.ItemId,
+                                           "ItemIsDone": item.ItemIsDone is True, "ItemTitle": item.ItemTitle,
+                                           "ItemDate": item.ItemDate, "ItemDoneDate": item.ItemDoneDate})
+
+
+# Lists the items of LiatrisTaskItem objects as records, order takes an item and returns its sort key
+def get_item_records(task_items, order=None):
+    records = []
+    for task_item in task_items:
+        items = task_item.ITEMS if order is None else sorted(task_item.ITEMS, key=order)
+        records += [get_item_record(task_item.TASK, item) for item in items]
+    return records
+
+
+def deadline_order(item):
+    return item.ItemDate is None, item.ItemDate if item.ItemDate is not None else datetime.min, item.ItemId
+
+
+# Commands
+
+def add_command(params, store):
+    item_title = join_words(params["title"])
+    if item_title == "":
+        raise CommandError("the task needs a title")
+    task = find_project(params["project"], store, params["new"])
+    item = check(store.add_item(task.TaskId, item_title, parse_date(params["date"])))
+    if params["note"]:
+        check(LiatrisSQLCore.ItemNotes.update_item_notes({item.ItemId: params["note"]}))
+    return [get_item_record(task, item)]
+
+
+# Lists the projects with their counters, or the tasks of one project
+def list_command(params, store):
+    if params["project"] is None:
+        if store.loaded:
+            counters = [(task.TaskId, task.TaskName) + tuple(store.get_counters(task.TaskId))
+                        for task in sorted(store.get_tasks(), key=lambda task: task.TaskId)]
+        else:
+            counters = check(LiatrisSQLCore.Tasks.get_task_counters())
+            archived_counts = dict(check(LiatrisSQLCore.Archive.count_archived_items()))
+            counters = [(task_id, task_name, (done_items or 0) + archived_counts.get(task_id, 0),
+                         total_items + archived_counts.get(task_id, 0))
+                        for task_id, task_name, done_items, total_items in counters]
+        return [{"TaskId": task_id, "TaskName": task_name, "DoneItems": done_items, "TotalItems": total_items}
+                for task_id, task_name, done_items, total_items in counters if task_name is not None]
+
+    task = find_project(params["project"], store)
+    task_item = check(LiatrisSQLCore.Tasks.produce_task_item_by_task_id(task.TaskId))
+    if not params["all"]:
+        task_item.ITEMS = [item for item in task_item.ITEMS if not item.ItemIsDone]
+    return get_item_records([task_item], deadline_order)
+
+
+def done_command(params, store):
+    item_ids = [int(item_id) for item_id in params["item_ids"]]
+    for item_id in item_ids:
+        if item_id not in store.items and not check(LiatrisSQLCore.Items.get_item_by_id(item_id)):
+            raise CommandError("there is no task " + str(item_id))
+    item_is_done = not params["undo"]
+    check(store.mark_items(item_ids, item_is_done))
+    return {"Count": len(item_ids), "ItemIsDone": item_is_done}
+
+
+def search_command(params, store):
+    limit = params["limit"] if params["limit"] is not None else liatris_db.SEARCH_RESULT_LIMIT
+    # The ranking of the index decides the order of the projects and of the tasks in them
+    return get_item_records(check(LiatrisSQLCore.Tasks.search_task_items(join_words(params["words"]), limit)))
+
+
+def today_command(params, store):
+    return get_item_records(check(LiatrisSQLCore.SmartLists.produce_today()), deadline_order)
+
+
+def upcoming_command(params, store):
+    days = params["days"] if params["days"] is not None else get_upcoming_threshold()
+    return get_item_records(check(LiatrisSQLCore.SmartLists.produce_upcoming(days)), deadline_order)
+
+
+def someday_command(params, store):
+    return get_item_records(check(LiatrisSQLCore.SmartLists.produce_someday()), lambda item: item.ItemId)
+
+
+def logbook_command(params, store):
+    task_id = find_project(params["project"], store).TaskId if params["project"] is not None else None
+    limit = params["limit"] if params["limit"] is not None else liatris_db.LOGBOOK_PAGE_SIZE
+    task_items, _ = check(LiatrisSQLCore.SmartLists.produce_logbook_page(None, task_id, limit))
+    return get_item_records(task_items)
+
+
+def stats_command(params, store):
+    if store.loaded:
+        counters = [store.get_counters(task.TaskId) for task in store.get_tasks()]
+        project_count = len(counters)
+        today_count, upcoming_count = store.get_badges()
+    else:
+        counters = [counter[2:] for counter in check(LiatrisSQLCore.Tasks.get_task_counters())
+                    if counter[1] is not None]
+        project_count = len(counters)
+        # Archived items are all done
+        archived = sum(count for task_id, count in check(LiatrisSQLCore.Archive.count_archived_items()))
+        counters.append((archived, archived))
+        today_count = check(LiatrisSQLCore.SmartLists.count_today())
+        upcoming_count = check(LiatrisSQLCore.SmartLists.count_upcoming(get_upcoming_threshold()))
+    done_items = sum(done or 0 for done, total in counters)
+    total_items = sum(total for done, total in counters)
+    return {"Projects": project_count, "Tasks": total_items, "Done": done_items, "Open": total_items - done_items,
+            "Today": today_count, "Upcoming": upcoming_count}
+
+
+# Command name -> function, parameters that have to be given and defaults of the others
+COMMANDS = {
+    "add": (add_command, ["project", "title"], {"date": None, "note": None, "new": False}),
+    "list": (list_command, [], {"project": None, "all": False}),
+    "done": (done_command, ["item_ids"], {"undo": False}),
+    "search": (search_command, ["words"], {"limit": None}),
+    "today": (today_command, [], {}),
+    "upcoming": (upcoming_command, [], {"days": None}),
+    "someday": (someday_command, [], {}),
+    "logbook": (logbook_command, [], {"project": None, "limit": None}),
+    "stats": (stats_command, [], {})
+}
+# Commands that write, the daemon runs these in batches
+WRITE_COMMANDS = ["add", "done"]
+
+
+def run_command(command, params, store):
+    if command not in COMMANDS:
+        raise CommandError("there is no command " + repr(command))
+    function, required_params, default_params = COMMANDS[command]
+    for param in required_params:
+        if param not in params:
+            raise CommandError(command + " needs the parameter " + repr(param))
+    return function(dict(default_params, **params), store)
+
+
+# Runs (command, params) pairs in one transaction and returns their results. If one of them fails nothing is written.
+def run_commands(commands, store):
+    try:
+        with LiatrisSQLCore.batch():
+            return [run_command(command, params, store) for command, params in commands]
+    except liatris_db.LiatrisBatchError as error:
+        raise CommandError(str(error))
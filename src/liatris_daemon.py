@@ -0,0 +1,326 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import argparse
+import json
+import os
+import queue
+import signal
+import socketserver
+import sqlite3
+import sys
+import threading
+
+import liatris_changes
+import liatris_client
+import liatris_commands
+import liatris_db
+import liatris_paths
+import liatris_store
+import liatris_version
+
+LiatrisSQLCore = liatris_db.LiatrisSQLCore
+
+# Keeps the store loaded and answers the commands of liatris_commands over a Unix socket with JSON-RPC 2.0, one
+# request and one response per line, see liatris_client. The Today and Upcoming badges are answered from memory
+# without touching the database. All other methods are run one after the other by a single thread with one session,
+# writes that queue up while it is busy are written together in one transaction. Changes written by other processes
+# are applied to the store before every request and once per poll interval while the daemon is idle.
+
+# JSON-RPC error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+COMMAND_ERROR = -32000
+
+# Most writes committed in one transaction
+WRITE_BATCH_SIZE = 100
+# Seconds the dispatcher waits for a request before it looks for changes and counts the badges again, they also
+# change at midnight
+IDLE_INTERVAL = liatris_changes.POLL_INTERVAL_MS / 1000
+# Methods run by the dispatcher besides the commands
+DISPATCHED_METHODS = ["batch", "reload"]
+# Tells the dispatcher to stop
+STOP = object()
+
+
+class DaemonError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+# A request waiting for the dispatcher, the connection thread waits for done
+class DaemonRequest:
+    def __init__(self, method, params):
+        self.method = method
+        self.params = params
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+
+class LiatrisDaemon:
+    def __init__(self):
+        self.store = liatris_store.LiatrisStore()
+        self.change_monitor = liatris_changes.LiatrisChangeMonitor()
+        self.requests = queue.Queue()
+        # (Today, Upcoming), replaced by the dispatcher after every request so connections can read it without a lock
+        self.badges = (0, 0)
+        self.ready = threading.Event()
+        self.load_error = None
+        self.thread = threading.Thread(target=self.dispatch, name="liatris-dispatcher", daemon=True)
+
+    # Starts the dispatcher and waits until it has loaded the store, returns False if that failed
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+        return self.load_error is None
+
+    def stop(self):
+        self.requests.put(STOP)
+        self.thread.join()
+
+    # Dispatcher
+
+    def load(self):
+        self.store.upcoming_threshold = liatris_commands.get_upcoming_threshold()
+        if not self.store.load():
+            raise liatris_commands.CommandError("the database could not be read")
+        self.publish_badges()
+        return True
+
+    def publish_badges(self):
+        self.badges = self.store.get_badges()
+
+    # Applies the changes written by other processes since the last call
+    def apply_changes(self):
+        change_set = self.change_monitor.poll()
+        if change_set is None:
+            return
+        if change_set.settings_changed:
+            LiatrisSQLCore.Settings.invalidate_cache()
+            self.store.set_upcoming_threshold(liatris_commands.get_upcoming_threshold())
+        if not self.store.apply_changes(change_set):
+            self.resync()
+
+    def dispatch(self):
+        try:
+            # Started first, changes written while the store loads are applied again later
+            self.change_monitor.start()
+            self.load()
+        except (liatris_commands.CommandError, sqlite3.Error) as error:
+            self.load_error = error
+        self.ready.set()
+        if self.load_error is not None:
+            return
+
+        next_request = None
+        while True:
+            request = next_request
+            next_request = None
+            if request is None:
+                try:
+                    request = self.requests.get(timeout=IDLE_INTERVAL)
+                except queue.Empty:
+                    self.apply_changes()
+                    self.publish_badges()
+                    continue
+            if request is STOP:
+                break
+
+            self.apply_changes()
+
+            if request.method in liatris_commands.WRITE_COMMANDS:
+                write_requests = [request]
+                while len(write_requests) < WRITE_BATCH_SIZE:
+                    try:
+                        request = self.requests.get_nowait()
+                    except queue.Empty:
+                        break
+                    if request is STOP or request.method not in liatris_commands.WRITE_COMMANDS:
+                        next_request = request
+                        break
+                    write_requests.append(request)
+                self.write(write_requests)
+            else:
+                self.run(request)
+            self.publish_badges()
+        self.change_monitor.stop()
+        liatris_db.__SESSION__.remove()
+
+    # Writes the requests in one transaction. If one of them fails the others are written one by one, so only the
+    # failing one reports an error.
+    def write(self, write_requests):
+        if len(write_requests) > 1:
+            try:
+                results = liatris_commands.run_commands([(request.method, request.params)
+                                                         for request in write_requests], self.store)
+            except Exception:
+                # The store has taken the changes of the rolled back commands
+                self.resync()
+            else:
+                for request, result in zip(write_requests, results):
+                    request.finish(result)
+                return
+        for request in write_requests:
+            self.run(request)
+
+    def run(self, request):
+        try:
+            if request.method == "reload":
+                result = self.load()
+            elif request.method == "batch":
+                result = liatris_commands.run_commands(self.get_batch_commands(request.params), self.store)
+            elif request.method in liatris_commands.WRITE_COMMANDS:
+                # In its own transaction, a failing add does not leave an item without its note
+                result = liatris_commands.run_commands([(request.method, request.params)], self.store)[0]
+            else:
+                result = liatris_commands.run_command(request.method, request.params, self.store)
+        except DaemonError as error:
+            request.finish(error=error)
+        except liatris_commands.CommandError as error:
+            if request.method in liatris_commands.WRITE_COMMANDS or request.method == "batch":
+                self.resync()
+            request.finish(error=DaemonError(COMMAND_ERROR, str(error)))
+        except (KeyError, TypeError, ValueError, AttributeError) as error:
+            self.resync()
+            request.finish(error=DaemonError(INVALID_PARAMS, "invalid parameters: " + str(error)))
+        except Exception as error:
+            # Keeps the dispatcher running
+            sys.stderr.write("Error: " + request.method + " failed: " + repr(error) + "\n")
+            self.resync()
+            request.finish(error=DaemonError(COMMAND_ERROR, "the command failed"))
+        else:
+            request.finish(result)
+
+    def get_batch_commands(self, params):
+        commands = params.get("commands")
+        if not isinstance(commands, list):
+            raise DaemonError(INVALID_PARAMS, "batch needs a list of commands")
+        batch_commands = []
+        for command in commands:
+            if not isinstance(command, dict) or not isinstance(command.get("params", {}), dict):
+                raise DaemonError(INVALID_PARAMS, "every command of a batch needs a method and a dictionary of params")
+            batch_commands.append((command.get("method"), command.get("params", {})))
+        return batch_commands
+
+    # Reads the store again after a failed write
+    def resync(self):
+        liatris_db.__SESSION__.rollback()
+        try:
+            self.load()
+        except liatris_commands.CommandError as error:
+            sys.stderr.write("Error: " + str(error) + "\n")
+
+    # Connections
+
+    def call(self, method, params):
+        if method == "ping":
+            return {"Version": liatris_version.LIATRIS_VERSION}
+        if method == "badges":
+            today_count, upcoming_count = self.badges
+            return {"Today": today_count, "Upcoming": upcoming_count}
+        if method not in liatris_commands.COMMANDS and method not in DISPATCHED_METHODS:
+            raise DaemonError(METHOD_NOT_FOUND, "there is no method " + repr(method))
+
+        request = DaemonRequest(method, params)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    # Returns the response to a request, None for notifications
+    def answer(self, message):
+        request_id = message.get("id") if isinstance(message, dict) else None
+        try:
+            if not isinstance(message, dict) or message.get("jsonrpc") != "2.0" or \
+                    not isinstance(message.get("method"), str):
+                raise DaemonError(INVALID_REQUEST, "not a JSON-RPC 2.0 request")
+            params = message.get("params", {})
+            if not isinstance(params, dict):
+                raise DaemonError(INVALID_PARAMS, "params have to be given by name")
+            response = {"jsonrpc": "2.0", "id": request_id, "result": self.call(message["method"], params)}
+        except DaemonError as error:
+            response = {"jsonrpc": "2.0", "id": request_id, "error": {"code": error.code, "message": str(error)}}
+        if isinstance(message, dict) and "id" not in message:
+            return None
+        return response
+
+    def answer_line(self, line):
+        try:
+            message = json.loads(line)
+        except ValueError as error:
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": PARSE_ERROR, "message": str(error)}}
+        if isinstance(message, list):
+            responses = [response for response in map(self.answer, message) if response is not None]
+            return responses if len(responses) > 0 else None
+        return self.answer(message)
+
+
+class LiatrisRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip() == b"":
+                continue
+            response = self.server.liatris_daemon.answer_line(line)
+            if response is not None:
+                self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+class LiatrisServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves the commands of liatris_cli from memory over a Unix socket.")
+    parser.add_argument("--socket", default=liatris_paths.SOCKET_FILE, help="path of the socket")
+    args = parser.parse_args()
+
+    if liatris_client.is_daemon_running(args.socket):
+        sys.stderr.write("Error: a daemon is already running on " + args.socket + "\n")
+        return 1
+    if os.path.exists(args.socket):
+        # Left behind by a daemon that did not stop cleanly
+        os.unlink(args.socket)
+
+    try:
+        liatris_db.get_engine()
+    except Exception as error:
+        sys.stderr.write("Error: the database could not be opened: " + str(error) + "\n")
+        return 1
+    liatris_daemon = LiatrisDaemon()
+    if not liatris_daemon.start():
+        sys.stderr.write("Error: " + str(liatris_daemon.load_error) + "\n")
+        return 1
+
+    # Only the user may connect
+    umask = os.umask(0o077)
+    try:
+        server = LiatrisServer(args.socket, LiatrisRequestHandler)
+    finally:
+        os.umask(umask)
+    server.liatris_daemon = liatris_daemon
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+
+    sys.stderr.write("Listening on " + args.socket + "\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+        liatris_daemon.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,249 @@
 # SPDX-FileCopyrightText: Copyright © 2023 nixcapra
 # SPDX-License-Identifier: MIT
 
+import functools
 import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from time import sleep
 import sqlalchemy as db
-import sqlalchemy_utils as dbu
-from sqlalchemy.orm import sessionmaker
-from re import search as research
+from sqlalchemy.orm import Session, sessionmaker, scoped_session, undefer
 
+from liatris_paths import DB_DIR, DB_FILE, ARCHIVE_FILE
 from models.liatris_model_settings import LiatrisSetting
-from models.liatris_model_tasks import LiatrisTask
-from models.liatris_model_items import LiatrisItem
+from models.liatris_model_tasks import LiatrisTask, normalize_task_name
+from models.liatris_model_items import LiatrisItem, normalize_item_date
 from models.liatris_model_itemnotes import LiatrisItemNote
 
-DB_DIR = "/home/" + os.getlogin() + "/.liatris"
-DB_FILE = DB_DIR + "/liatrisdb"
+
+# SQLite storage profiles, the pragmas of the selected profile are applied to every new connection.
+# safe: rollback journal with a full fsync on every commit, like SQLite's defaults.
+# balanced: write-ahead log, commits only fsync at checkpoints, a larger page cache and memory mapped reads.
+# fast: like balanced but without fsyncs, the last commits may be lost on power failure.
+STORAGE_PROFILES = {
+    "safe": {"journal_mode": "DELETE", "synchronous": "FULL", "cache_size": -2000, "mmap_size": 0,
+             "temp_store": "DEFAULT"},
+    "balanced": {"journal_mode": "WAL", "synchronous": "NORMAL", "cache_size": -16000, "mmap_size": 67108864,
+                 "temp_store": "MEMORY"},
+    "fast": {"journal_mode": "WAL", "synchronous": "OFF", "cache_size": -64000, "mmap_size": 268435456,
+             "temp_store": "MEMORY"}
+}
+DEFAULT_STORAGE_PROFILE = "balanced"
+
+
+# Determines the storage profile of a connection. The LIATRIS_STORAGE_PROFILE environment variable takes precedence
+# over the STORAGEPROFILE setting.
+def get_storage_profile_name(dbapi_connection):
+    profile_name = os.environ.get("LIATRIS_STORAGE_PROFILE")
+    if profile_name is None:
+        try:
+            setting = dbapi_connection.execute(
+                "SELECT Value FROM LiatrisSettings WHERE Key = 'STORAGEPROFILE'").fetchone()
+            if setting is not None:
+                profile_name = setting[0]
+        except sqlite3.Error:
+            # The settings table does not exist yet on a new database
+            pass
+    if profile_name not in STORAGE_PROFILES:
+        return DEFAULT_STORAGE_PROFILE
+    return profile_name
+
+
+# Applies the storage profile to a new connection
+def apply_storage_profile(dbapi_connection, connection_record):
+    profile = STORAGE_PROFILES[get_storage_profile_name(dbapi_connection)]
+    cursor = dbapi_connection.cursor()
+    for pragma in ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store"):
+        cursor.execute("PRAGMA " + pragma + " = " + str(profile[pragma]))
+    cursor.close()
+
+
+# Attaches the archive database to a new connection, it is created on the first start. This has to happen before the
+# storage profile is applied, so the archive gets the same journal mode.
+def attach_archive(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_FILE,))
+    cursor.close()
+
+
+# SQLite only enforces foreign keys, and cascades deletes along them, on connections that enable them
+def enable_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys = ON")
+    cursor.close()
+
+
+# Seconds a connection waits for the lock of another connection before a statement fails with "database is locked"
+BUSY_TIMEOUT = 1
+# Number of times a write that failed on a lock is tried again, the wait before every retry is doubled
+WRITE_RETRIES = 3
+WRITE_RETRY_SLEEP = 0.05
+
+# Whether the last statement of a thread failed on a lock, and how deep it is in retry_when_locked functions
+WRITE_STATE = threading.local()
+
+
+def is_locked_error(error):
+    return isinstance(error, sqlite3.OperationalError) and "locked" in str(error)
+
+
+# Notes statements that failed on a lock, LiatrisSQLCore functions catch the error and only return False
+def note_locked_error(context):
+    if is_locked_error(context.original_exception):
+        WRITE_STATE.locked = True
+
+
+# Decorator for LiatrisSQLCore functions that write. Waiting on a lock is not always enough: a connection that waits
+# for the write lock while holding a read lock another writer waits for fails right away. The failed transaction is
+# rolled back, which releases the lock, and the function is run again. Calls made by other such functions and calls in
+# a batch are not retried on their own, the outermost call or the caller of the batch has to.
+def retry_when_locked(function):
+    @functools.wraps(function)
+    def run_write(*args, **kwargs):
+        depth = getattr(WRITE_STATE, "depth", 0)
+        if depth != 0 or __SESSION__().info.get("Batch"):
+            return function(*args, **kwargs)
+
+        retry_sleep = WRITE_RETRY_SLEEP
+        WRITE_STATE.depth = 1
+        try:
+            for retry in range(WRITE_RETRIES + 1):
+                WRITE_STATE.locked = False
+                result = function(*args, **kwargs)
+                if result is not False or not WRITE_STATE.locked or retry == WRITE_RETRIES:
+                    return result
+                sleep(retry_sleep)
+                retry_sleep *= 2
+        finally:
+            WRITE_STATE.depth = 0
+
+    return run_write
+
+
+# Number of one-time cleanups applied to a database, stored in PRAGMA user_version
+SCHEMA_VERSION = 1
+
+# Completion date given to items that were completed before completion dates were recorded, they are listed after
+# all other items in the Logbook
+LOGBOOK_EPOCH = datetime(1970, 1, 1)
+LOGBOOK_PAGE_SIZE = 100
+
+# Number of items moved to the archive per transaction, so other writers are never blocked for long
+ARCHIVE_BATCH_SIZE = 2000
+
+# Number of ids bound per statement by operations on many items, older SQLite versions allow at most 999 variables
+ID_CHUNK_SIZE = 500
+
+# Number of rows written per executemany and read per fetch by imports and exports
+TRANSFER_BATCH_SIZE = 5000
+
+
+# Formats a datetime the way SQLAlchemy stores DateTime columns in SQLite, for statements that bypass it
+def format_datetime(value):
+    if value is None:
+        return None
+    return value.isoformat(" ", "microseconds")
+
+
+# Adds a column to a table of a database created by an older version, returns True if the column was missing
+def add_missing_column(connection, table_name, column_name, column_type):
+    columns = [column[1] for column in connection.execute(db.text("PRAGMA table_info(" + table_name + ")"))]
+    if column_name in columns:
+        return False
+    connection.execute(db.text("ALTER TABLE " + table_name + " ADD COLUMN " + column_name + " " + column_type))
+    return True
+
+
+# Recreates a table of a database created by an older version if it lacks the foreign keys of its definition, SQLite
+# can not add constraints to existing tables. The rows are copied over, the triggers of the old table are dropped with
+# it. Returns True if the table was recreated.
+def add_missing_foreign_keys(connection, table):
+    if len(table.foreign_keys) == 0 or \
+            len(connection.execute(db.text("PRAGMA foreign_key_list(" + table.name + ")")).all()) != 0:
+        return False
+
+    old_table_name = table.name + "Old"
+    columns = ", ".join(column.name for column in table.columns)
+    connection.execute(db.text("ALTER TABLE " + table.name + " RENAME TO " + old_table_name))
+    for index in table.indexes:
+        connection.execute(db.text("DROP INDEX IF EXISTS " + index.name))
+    table.create(connection)
+    connection.execute(db.text("INSERT INTO " + table.name + " (" + columns + ") SELECT " + columns + " FROM " +
+                               old_table_name))
+    connection.execute(db.text("DROP TABLE " + old_table_name))
+    return True
+
+
+# Recreates a table of a database created by an older version if its definition asks for AUTOINCREMENT but the table
+# does not have it, without it SQLite hands out the ids of deleted rows again. Other tables may reference the table,
+# so it is copied following SQLite's procedure for schema changes: foreign keys are switched off, the copy is built
+# under a new name and renamed once the original is dropped. Returns True if the table was recreated.
+def add_missing_autoincrement(engine, table):
+    if not table.dialect_options["sqlite"]["autoincrement"]:
+        return False
+    with engine.connect() as connection:
+        table_sql = connection.execute(db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                       {"name": table.name}).scalar()
+    if "AUTOINCREMENT" in table_sql.upper():
+        return False
+
+    new_meta = db.MetaData()
+    for referred_table in table.metadata.tables.values():
+        if referred_table is not table:
+            referred_table.to_metadata(new_meta)
+    new_table_name = table.name + "New"
+    new_table = table.to_metadata(new_meta, name=new_table_name)
+    columns = ", ".join(column.name for column in table.columns)
+
+    dbapi_connection = engine.raw_connection()
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA foreign_keys = OFF")
+        cursor.execute("BEGIN")
+        cursor.execute(str(db.schema.CreateTable(new_table).compile(dialect=engine.dialect)))
+        # Inserting the ids also sets the AUTOINCREMENT counter past them
+        cursor.execute("INSERT INTO " + new_table_name + " (" + columns + ") SELECT " + columns + " FROM " +
+                       table.name)
+        cursor.execute("DROP TABLE " + table.name)
+        cursor.execute("ALTER TABLE " + new_table_name + " RENAME TO " + table.name)
+        for index in table.indexes:
+            cursor.execute(str(db.schema.CreateIndex(index).compile(dialect=engine.dialect)))
+        cursor.execute("COMMIT")
+    except sqlite3.Error:
+        dbapi_connection.rollback()
+        raise
+    finally:
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.close()
+        dbapi_connection.close()
+    return True
+
+
+# Tables of the archive database. Archived items keep their ItemId and TaskId, notes are stored by the ItemId of their
+# item. SQLite has no foreign keys across databases, deletes of projects and items remove archived rows explicitly.
+ARCHIVE_META = db.MetaData()
+
+ARCHIVED_ITEMS = db.Table(
+    "LiatrisArchivedItems", ARCHIVE_META,
+    db.Column("ItemId", db.Integer, primary_key=True, autoincrement=False),
+    db.Column("TaskId", db.Integer),
+    db.Column("ItemIsDone", db.Boolean),
+    db.Column("ItemTitle", db.String),
+    db.Column("ItemDate", db.DateTime),
+    db.Column("ItemDoneDate", db.DateTime),
+    db.Index("LiatrisArchivedItemsTaskIdIndex", "TaskId"),
+    db.Index("LiatrisArchivedItemsLogbookIndex", "ItemDoneDate"),
+    schema="archive"
+)
+
+ARCHIVED_ITEM_NOTES = db.Table(
+    "LiatrisArchivedItemNotes", ARCHIVE_META,
+    db.Column("ItemId", db.Integer, primary_key=True, autoincrement=False),
+    db.Column("NoteContent", db.Text),
+    schema="archive"
+)
 
 
 # Initializes the database
@@ -21,9 +251,16 @@ def init_db():
     if not os.path.exists(DB_DIR):
         os.makedirs(DB_DIR)
 
-    engine = db.create_engine("sqlite:///" + DB_FILE)
-    if not dbu.database_exists(engine.url):
-        dbu.create_database(engine.url)
+    # Connections are pooled so that the page cache of the storage profile survives between commits
+    engine = db.create_engine("sqlite:///" + DB_FILE, poolclass=db.pool.QueuePool,
+                              connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT})
+    db.event.listen(engine, "handle_error", note_locked_error)
+    db.event.listen(engine, "connect", attach_archive)
+    db.event.listen(engine, "connect", apply_storage_profile)
+    db.event.listen(engine, "connect", enable_foreign_keys)
+    db.event.listen(engine, "connect", collect_own_changes)
+    db.event.listen(engine, "commit", commit_own_changes)
+    db.event.listen(engine, "rollback", rollback_own_changes)
 
     meta = db.MetaData()
 
@@ -36,48 +273,451 @@ def init_db():
     liatris_tasks = db.Table(
         "LiatrisTasks", meta,
         db.Column("TaskId", db.Integer, primary_key=True),
-        db.Column("TaskName", db.String)
+        db.Column("TaskName", db.String),
+        db.Column("TaskNameKey", db.String),
+        # Prefix searches over the project names
+        db.Index("LiatrisTasksNameKeyIndex", "TaskNameKey")
     )
 
     liatris_items = db.Table(
         "LiatrisItems", meta,
         db.Column("ItemId", db.Integer, primary_key=True),
-        db.Column("TaskId", db.Integer),
+        db.Column("TaskId", db.Integer, db.ForeignKey("LiatrisTasks.TaskId", ondelete="CASCADE")),
         db.Column("ItemIsDone", db.Boolean),
         db.Column("ItemTitle", db.String),
-        db.Column("ItemDate", db.DateTime)
+        db.Column("ItemDate", db.DateTime),
+        db.Column("ItemDoneDate", db.DateTime),
+        # Lookups of the items of a project
+        db.Index("LiatrisItemsTaskIdIndex", "TaskId"),
+        # Logbook, Today, Upcoming and Someday filter on the done state and the deadline
+        db.Index("LiatrisItemsDoneDateIndex", "ItemIsDone", "ItemDate"),
+        # The Logbook is paged by completion date
+        db.Index("LiatrisItemsLogbookIndex", "ItemIsDone", "ItemDoneDate"),
+        # Ids of archived items must never be handed out again
+        sqlite_autoincrement=True
     )
 
     liatris_item_notes = db.Table(
         "LiatrisItemNotes", meta,
         db.Column("NoteId", db.Integer, primary_key=True),
-        db.Column("ItemId", db.Integer, unique=True),
+        db.Column("ItemId", db.Integer, db.ForeignKey("LiatrisItems.ItemId", ondelete="CASCADE"), unique=True),
         db.Column("NoteContent", db.Text)
     )
 
+    # Filled by CHANGE_TRIGGERS
+    db.Table(
+        "LiatrisChanges", meta,
+        db.Column("ChangeId", db.Integer, primary_key=True),
+        db.Column("TableName", db.String),
+        # Pruning only ever deletes the oldest entries, so ids keep growing without AUTOINCREMENT, which would write
+        # sqlite_sequence on every change
+        db.Column("RowId", db.Integer)
+    )
+
     meta.create_all(engine)
+    ARCHIVE_META.create_all(engine)
+
+    with engine.begin() as connection:
+        # Databases created by older versions have no normalized task names yet
+        if add_missing_column(connection, "LiatrisTasks", "TaskNameKey", "VARCHAR"):
+            tasks = connection.execute(db.select(liatris_tasks.c.TaskId, liatris_tasks.c.TaskName)).all()
+            if len(tasks) != 0:
+                connection.execute(
+                    liatris_tasks.update().where(liatris_tasks.c.TaskId == db.bindparam("Id"))
+                    .values(TaskNameKey=db.bindparam("Key")),
+                    [{"Id": task_id, "Key": normalize_task_name(task_name)} for task_id, task_name in tasks])
+
+        # Nor completion dates
+        if add_missing_column(connection, "LiatrisItems", "ItemDoneDate", "DATETIME"):
+            connection.execute(liatris_items.update().where(liatris_items.c.ItemIsDone == True)
+                               .values(ItemDoneDate=LOGBOOK_EPOCH))
+
+        # Older versions did not delete the notes of deleted projects, these have to go before the foreign keys are
+        # added
+        if len(connection.execute(db.text("PRAGMA foreign_key_list(LiatrisItemNotes)")).all()) == 0:
+            connection.execute(liatris_items.delete().where(
+                liatris_items.c.TaskId.not_in(db.select(liatris_tasks.c.TaskId))))
+            connection.execute(liatris_item_notes.delete().where(db.or_(
+                liatris_item_notes.c.ItemId.is_(None),
+                liatris_item_notes.c.ItemId.not_in(db.select(liatris_items.c.ItemId)))))
+        add_missing_foreign_keys(connection, liatris_items)
+        add_missing_foreign_keys(connection, liatris_item_notes)
+
+        # create_all only creates indexes together with new tables, databases created by older versions need them added
+        for index in list(liatris_tasks.indexes) + list(liatris_items.indexes):
+            index.create(connection, checkfirst=True)
+
+        user_version = connection.execute(db.text("PRAGMA user_version")).scalar()
+        if user_version < 1:
+            # Older versions created an empty note for every item that was ever opened
+            connection.execute(liatris_item_notes.delete().where(db.or_(
+                liatris_item_notes.c.NoteContent.is_(None), liatris_item_notes.c.NoteContent == "")))
+        if user_version < SCHEMA_VERSION:
+            connection.execute(db.text("PRAGMA user_version = " + str(SCHEMA_VERSION)))
+
+    # Tables recreated for their foreign keys above already have it
+    add_missing_autoincrement(engine, liatris_items)
+
+    # Recreating a table drops its triggers, so they are only created once the tables are final
+    with engine.begin() as connection:
+        create_change_triggers(connection)
+
     return engine
 
 
-ENGINE = init_db()
-SESSION = sessionmaker(bind=ENGINE)
-__SESSION__ = SESSION()
+# Change log, every row of LiatrisTasks, LiatrisItems and LiatrisItemNotes that is inserted, updated or deleted by any
+# connection adds its id, notes are logged by the ItemId of their item. A RowId of NULL stands for all rows of the
+# table, settings are only logged this way. See liatris_changes.
+CHANGE_LOG_TABLES = {"LiatrisTasks": "TaskId", "LiatrisItems": "ItemId", "LiatrisItemNotes": "ItemId",
+                     "LiatrisSettings": None}
+# Entries kept in the change log, every thousandth entry deletes the ones that are older
+CHANGE_LOG_SIZE = 10000
+
+
+# Builds the trigger that logs the rows of a table changed by an INSERT, UPDATE or DELETE
+def build_change_trigger(table_name, id_column, event):
+    row_id = "NULL" if id_column is None else ("old." if event == "DELETE" else "new.") + id_column
+    return "CREATE TRIGGER IF NOT EXISTS LiatrisChanges" + table_name[len("Liatris"):] + event.capitalize() + \
+        " AFTER " + event + " ON " + table_name + " BEGIN " + \
+        "INSERT INTO LiatrisChanges (TableName, RowId) VALUES ('" + table_name + "', " + row_id + "); END"
+
+
+CHANGE_TRIGGERS = [build_change_trigger(table_name, id_column, event)
+                   for table_name, id_column in CHANGE_LOG_TABLES.items()
+                   for event in ("INSERT", "UPDATE", "DELETE")] + [
+    """CREATE TRIGGER IF NOT EXISTS LiatrisChangesPrune AFTER INSERT ON LiatrisChanges WHEN new.ChangeId % 1000 = 0
+    BEGIN
+        DELETE FROM LiatrisChanges WHERE ChangeId <= new.ChangeId - """ + str(CHANGE_LOG_SIZE) + """;
+    END"""
+]
+# Triggers that are dropped during bulk imports, which log all tasks and items as changed instead
+CHANGE_INSERT_TRIGGERS = ["LiatrisChangesTasksInsert", "LiatrisChangesItemsInsert", "LiatrisChangesItemNotesInsert"]
+
+
+def create_change_triggers(connection):
+    for trigger in CHANGE_TRIGGERS:
+        connection.execute(db.text(trigger))
+    connection.execute(db.text(OWN_CHANGE_TRIGGER))
+
+
+# ChangeIds of the change log entries committed by this process, which LiatrisChangeMonitor skips: the store holds
+# what it wrote already. None while no monitor runs, nothing is collected then.
+OWN_CHANGE_IDS = None
+
+# Hands the ChangeIds of the entries a connection of this process adds to the change log to Python. TEMP triggers only
+# exist on the connection that created them, connections of other processes never call liatris_own_change.
+OWN_CHANGE_TRIGGER = """CREATE TEMP TRIGGER IF NOT EXISTS LiatrisOwnChanges AFTER INSERT ON main.LiatrisChanges BEGIN
+    SELECT liatris_own_change(new.ChangeId);
+END"""
+
+
+# Collects the ChangeIds a new connection adds to the change log until its transaction ends. A new database has no
+# change log yet, create_change_triggers adds the trigger to the connection that creates it.
+def collect_own_changes(dbapi_connection, connection_record):
+    change_ids = connection_record.info["OwnChangeIds"] = []
+    dbapi_connection.create_function("liatris_own_change", 1, change_ids.append)
+    try:
+        dbapi_connection.execute(OWN_CHANGE_TRIGGER)
+    except sqlite3.OperationalError:
+        pass
+
+
+# The commit event runs before the COMMIT itself, so the ids are known before any monitor can read their entries
+def commit_own_changes(connection):
+    change_ids = connection.connection.info.get("OwnChangeIds")
+    if not change_ids:
+        return
+    if OWN_CHANGE_IDS is not None:
+        OWN_CHANGE_IDS.update(change_ids)
+    change_ids.clear()
+
+
+# Entries that are rolled back never reach the change log, their ids are handed out again
+def rollback_own_changes(connection):
+    change_ids = connection.connection.info.get("OwnChangeIds")
+    if change_ids:
+        change_ids.clear()
+
+
+# Full text index over item titles, deadlines and notes. The rowid of an entry is the ItemId of its item, the triggers
+# keep the index in sync with LiatrisItems and LiatrisItemNotes.
+SEARCH_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS LiatrisSearchItemInsert AFTER INSERT ON LiatrisItems BEGIN
+        INSERT INTO LiatrisSearch(rowid, ItemTitle, ItemDay, NoteContent) VALUES (new.ItemId, new.ItemTitle,
+            substr(new.ItemDate, 1, 10), (SELECT NoteContent FROM LiatrisItemNotes WHERE ItemId = new.ItemId));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS LiatrisSearchItemUpdate AFTER UPDATE OF ItemTitle, ItemDate ON LiatrisItems
+    WHEN old.ItemTitle IS NOT new.ItemTitle OR old.ItemDate IS NOT new.ItemDate BEGIN
+        UPDATE LiatrisSearch SET ItemTitle = new.ItemTitle, ItemDay = substr(new.ItemDate, 1, 10)
+            WHERE rowid = new.ItemId;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS LiatrisSearchItemDelete AFTER DELETE ON LiatrisItems BEGIN
+        DELETE FROM LiatrisSearch WHERE rowid = old.ItemId;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS LiatrisSearchNoteInsert AFTER INSERT ON LiatrisItemNotes BEGIN
+        UPDATE LiatrisSearch SET NoteContent = new.NoteContent WHERE rowid = new.ItemId;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS LiatrisSearchNoteUpdate AFTER UPDATE OF NoteContent ON LiatrisItemNotes BEGIN
+        UPDATE LiatrisSearch SET NoteContent = new.NoteContent WHERE rowid = new.ItemId;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS LiatrisSearchNoteDelete AFTER DELETE ON LiatrisItemNotes BEGIN
+        UPDATE LiatrisSearch SET NoteContent = NULL WHERE rowid = old.ItemId;
+    END"""
+]
+
+# Adds the items with an ItemId above :after to the index, used for everything written while the triggers were off
+SEARCH_BACKFILL = """INSERT INTO LiatrisSearch(rowid, ItemTitle, ItemDay, NoteContent)
+    SELECT LiatrisItems.ItemId, LiatrisItems.ItemTitle, substr(LiatrisItems.ItemDate, 1, 10), LiatrisItemNotes.NoteContent
+    FROM LiatrisItems LEFT JOIN LiatrisItemNotes ON LiatrisItemNotes.ItemId = LiatrisItems.ItemId
+    WHERE LiatrisItems.ItemId > :after"""
+
+# Separate index of the archived items, kept in the archive database together with them. Items only enter and leave the
+# archive through LiatrisSQLCore.Archive, which updates this index itself.
+ARCHIVE_SEARCH_BACKFILL = """INSERT INTO archive.LiatrisArchiveSearch(rowid, ItemTitle, ItemDay, NoteContent)
+    SELECT LiatrisArchivedItems.ItemId, LiatrisArchivedItems.ItemTitle, substr(LiatrisArchivedItems.ItemDate, 1, 10),
+        LiatrisArchivedItemNotes.NoteContent
+    FROM archive.LiatrisArchivedItems LEFT JOIN archive.LiatrisArchivedItemNotes
+        ON LiatrisArchivedItemNotes.ItemId = LiatrisArchivedItems.ItemId"""
+
+# Triggers that are dropped during bulk imports, indexing rows one by one is much slower than SEARCH_BACKFILL
+SEARCH_INSERT_TRIGGERS = ["LiatrisSearchItemInsert", "LiatrisSearchNoteInsert"]
+
+# Markers that surround the matched words in search snippets
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+SEARCH_RESULT_LIMIT = 200
+
+
+# Creates the full text search index and its triggers, returns False if SQLite was built without FTS5
+def init_search(engine):
+    try:
+        with engine.begin() as connection:
+            exists = connection.execute(db.text(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'LiatrisSearch'")).first()
+            if exists is None:
+                connection.execute(db.text(
+                    "CREATE VIRTUAL TABLE LiatrisSearch USING fts5(ItemTitle, ItemDay, NoteContent)"))
+                # Index everything that was written before the index existed
+                connection.execute(db.text(SEARCH_BACKFILL), {"after": 0})
+            create_search_triggers(connection)
+
+            exists = connection.execute(db.text("SELECT name FROM archive.sqlite_master "
+                                                "WHERE type = 'table' AND name = 'LiatrisArchiveSearch'")).first()
+            if exists is None:
+                connection.execute(db.text(
+                    "CREATE VIRTUAL TABLE archive.LiatrisArchiveSearch USING fts5(ItemTitle, ItemDay, NoteContent)"))
+                connection.execute(db.text(ARCHIVE_SEARCH_BACKFILL))
+    except db.exc.OperationalError:
+        return False
+    return True
+
+
+def create_search_triggers(connection):
+    for trigger in SEARCH_TRIGGERS:
+        connection.execute(db.text(trigger))
+
+
+# Turns user input into an FTS5 query that matches any of the words as a prefix. Every word is quoted, so user input
+# can never be interpreted as query syntax.
+def build_search_query(search_key):
+    words = str(search_key).lower().split()
+    return " OR ".join('"' + word.replace('"', '""') + '"*' for word in words)
+
+
+# The engine is created and the database initialized on first use, not on import, so tools that only need the
+# constants of this module start quickly. See get_engine.
+ENGINE = None
+SEARCH_ENABLED = False
+ENGINE_LOCK = threading.Lock()
+
+
+# Raised at the end of a batch in which a LiatrisSQLCore function failed, nothing of the batch was written
+class LiatrisBatchError(Exception):
+    pass
+
+
+# Commits of LiatrisSQLCore functions only flush while a session runs a batch, a rollback marks the batch as failed.
+# See LiatrisSQLCore.batch.
+class LiatrisSession(Session):
+    def commit(self):
+        if self.info.get("Batch"):
+            self.flush()
+        else:
+            super().commit()
+
+    def rollback(self):
+        if self.info.get("Batch"):
+            self.info["BatchFailed"] = True
+        super().rollback()
+
+
+# Objects stay loaded after a commit instead of being fetched again one by one on their next access. Writes through
+# LiatrisSQLCore keep the loaded objects up to date: ORM updates and deletes synchronize the session, objects of rows
+# that are deleted by the foreign keys or rewritten with plain SQL are expunged. Updates only set plain values, the
+# session expires columns that are set by SQL expressions and reads them again per object. Changes made through other
+# connections only become visible after LiatrisSQLCore.invalidate().
+SESSION = sessionmaker(class_=LiatrisSession, expire_on_commit=False)
+
+
+# Returns the engine, it is created and the database is initialized by the first call
+def get_engine():
+    global ENGINE, SEARCH_ENABLED
+    with ENGINE_LOCK:
+        if ENGINE is None:
+            engine = init_db()
+            SEARCH_ENABLED = init_search(engine)
+            SESSION.configure(bind=engine)
+            ENGINE = engine
+    return ENGINE
+
+
+# Returns True if SQLite supports the full text index, see init_search
+def is_search_enabled():
+    get_engine()
+    return SEARCH_ENABLED
+
+
+def create_session():
+    get_engine()
+    return SESSION()
+
+
+# Every thread gets its own session, see liatris_worker
+__SESSION__ = scoped_session(create_session)
+
+
+# Splits a list of ids into lists of at most ID_CHUNK_SIZE ids
+def chunk_ids(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        yield ids[start:start + ID_CHUNK_SIZE]
 
 
 # A class containing a Task with its associated items
 class LiatrisTaskItem:
-    TASK = None
-    ITEMS = None
+    __slots__ = ("TASK", "ITEMS", "SNIPPETS")
+
+    def __init__(self, task, items, snippets=None):
+        self.TASK = task
+        self.ITEMS = items
+        # Search snippets of the items, keyed by ItemId
+        self.SNIPPETS = snippets if snippets is not None else {}
+
+
+# Plain rows of tasks and items with the columns the views read. The list views are built from these instead of ORM
+# objects, which are much larger and are tracked by the session.
+class LiatrisTaskRow:
+    __slots__ = ("TaskId", "TaskName")
+
+    def __init__(self, task_id, task_name):
+        self.TaskId = task_id
+        self.TaskName = task_name
+
+
+class LiatrisItemRow:
+    __slots__ = ("ItemId", "TaskId", "ItemIsDone", "ItemTitle", "ItemDate", "ItemDoneDate")
+
+    def __init__(self, item_id, task_id, item_is_done, item_title, item_date, item_done_date):
+        self.ItemId = item_id
+        self.TaskId = task_id
+        self.ItemIsDone = item_is_done
+        self.ItemTitle = item_title
+        self.ItemDate = item_date
+        self.ItemDoneDate = item_done_date
+
+
+TASK_ROW_COLUMNS = [LiatrisTask.TaskId, LiatrisTask.TaskName]
+ITEM_ROW_COLUMNS = [LiatrisItem.ItemId, LiatrisItem.TaskId, LiatrisItem.ItemIsDone, LiatrisItem.ItemTitle,
+                    LiatrisItem.ItemDate, LiatrisItem.ItemDoneDate]
+
+
+# Selects the task and item columns of tasks joined with their items, outer joined tasks keep the tasks without items
+def select_task_item_rows(outer=False):
+    if outer:
+        return db.select(*TASK_ROW_COLUMNS, *ITEM_ROW_COLUMNS) \
+            .outerjoin_from(LiatrisTask, LiatrisItem, LiatrisItem.TaskId == LiatrisTask.TaskId)
+    return db.select(*TASK_ROW_COLUMNS, *ITEM_ROW_COLUMNS) \
+        .join_from(LiatrisTask, LiatrisItem, LiatrisItem.TaskId == LiatrisTask.TaskId)
 
-    def __init__(self, task, items):
-        if isinstance(task, LiatrisTask) and isinstance(items, list):
-            self.TASK = task
-            self.ITEMS = items
+
+ARCHIVED_ITEM_ROW_COLUMNS = [ARCHIVED_ITEMS.c.ItemId, ARCHIVED_ITEMS.c.TaskId, ARCHIVED_ITEMS.c.ItemIsDone,
+                             ARCHIVED_ITEMS.c.ItemTitle, ARCHIVED_ITEMS.c.ItemDate, ARCHIVED_ITEMS.c.ItemDoneDate]
+
+
+# Selects the same columns as select_task_item_rows for archived items
+def select_archived_task_item_rows():
+    return db.select(*TASK_ROW_COLUMNS, *ARCHIVED_ITEM_ROW_COLUMNS) \
+        .join_from(LiatrisTask, ARCHIVED_ITEMS, ARCHIVED_ITEMS.c.TaskId == LiatrisTask.TaskId)
+
+
+# Runs a select_task_item_rows query and returns (task, item) row pairs, every task row is only built once
+def execute_task_item_rows(query):
+    tasks = {}
+    rows = []
+    for row in __SESSION__.connection().execute(query):
+        task = tasks.get(row[0])
+        if task is None:
+            task = tasks[row[0]] = LiatrisTaskRow(row[0], row[1])
+        rows.append((task, LiatrisItemRow(*row[2:]) if row[2] is not None else None))
+    return rows
+
+
+# Groups (task, item) rows into LiatrisTaskItem objects, in the order in which the tasks first appear. Rows of a task
+# without items carry None as their item.
+def group_task_items(rows):
+    task_items = {}
+    for task, item in rows:
+        if task.TaskId not in task_items:
+            task_items[task.TaskId] = LiatrisTaskItem(task, [])
+        if item is not None:
+            task_items[task.TaskId].ITEMS.append(item)
+    return list(task_items.values())
 
 
 class LiatrisSQLCore:
+    # Expires all objects loaded by the session of this thread, they are read again on their next access. Call this
+    # once the database was changed by another connection.
+    def invalidate():
+        __SESSION__.expire_all()
+
+    # Runs the LiatrisSQLCore calls made on this thread inside the with block in one transaction, which is committed
+    # when the block ends. If the block raises or one of the functions fails, everything is rolled back, the latter
+    # raises LiatrisBatchError.
+    @contextmanager
+    def batch():
+        session = __SESSION__()
+        session.info["Batch"] = True
+        session.info["BatchFailed"] = False
+        try:
+            yield
+            session.info["Batch"] = False
+            if session.info["BatchFailed"]:
+                raise LiatrisBatchError("A statement of the batch failed, the batch was rolled back")
+            session.commit()
+        except:
+            session.info["Batch"] = False
+            session.rollback()
+            raise
+
+    # Removes the loaded objects of a class whose loaded attributes match from the session of this thread. Objects
+    # that are expired are left alone, they are read again anyway. Returns the removed objects.
+    def expunge_loaded(cls, matches):
+        expunged = []
+        for obj in list(__SESSION__.identity_map.values()):
+            if isinstance(obj, cls) and matches(obj.__dict__):
+                __SESSION__.expunge(obj)
+                expunged.append(obj)
+        return expunged
+
+    # Removes the loaded items with the given ids and their notes after they were deleted
+    def expunge_items(item_ids):
+        item_ids = set(item_ids)
+        LiatrisSQLCore.expunge_loaded(LiatrisItem, lambda state: state.get("ItemId") in item_ids)
+        LiatrisSQLCore.expunge_loaded(LiatrisItemNote, lambda state: state.get("ItemId") in item_ids)
+
     # Adds one object entry to the database
     # Takes a object instance.
+    @retry_when_locked
     def insert(obj):
         try:
             __SESSION__.add(obj, _warn=False)
@@ -85,9 +725,12 @@ class LiatrisSQLCore:
         except db.exc.SQLAlchemyError:
             __SESSION__.rollback()
             return False
+        if isinstance(obj, LiatrisSetting):
+            LiatrisSQLCore.Settings.invalidate_cache()
         return True
 
     # Adds many object entries to the database
+    @retry_when_locked
     def insert_many(object_list):
         try:
             __SESSION__.add_all(object_list)
@@ -95,68 +738,111 @@ class LiatrisSQLCore:
         except db.exc.SQLAlchemyError:
             __SESSION__.rollback()
             return False
+        if any(isinstance(obj, LiatrisSetting) for obj in object_list):
+            LiatrisSQLCore.Settings.invalidate_cache()
         return True
 
     # Settings specific database functions
     class Settings:
+        # All settings as a Key -> Value dictionary. It is loaded on the first read and kept up to date by
+        # update_setting and insert, None means it has to be loaded again.
+        CACHE = None
 
-        # Retrieves a settings by the provided key from the database
+        # Loads all settings into the cache with a single query
+        def load_cache():
+            LiatrisSQLCore.Settings.CACHE = dict(__SESSION__.query(LiatrisSetting.Key, LiatrisSetting.Value).all())
+
+        # Drops the cache, use this when the settings may have been changed outside of LiatrisSQLCore
+        def invalidate_cache():
+            LiatrisSQLCore.Settings.CACHE = None
+
+        # Retrieves a settings by the provided key from the cache. The returned object is a detached copy, change it
+        # through update_setting.
         def get_setting_by_key(key):
-            setting = None
             try:
-                setting = __SESSION__.query(LiatrisSetting).filter(LiatrisSetting.Key == key).first()
+                if LiatrisSQLCore.Settings.CACHE is None:
+                    LiatrisSQLCore.Settings.load_cache()
             except db.exc.SQLAlchemyError:
                 return False
-            if setting is None:
+            if key not in LiatrisSQLCore.Settings.CACHE:
                 return False
+            setting = LiatrisSetting()
+            setting.Key = key
+            setting.Value = LiatrisSQLCore.Settings.CACHE[key]
             return setting
 
         # Updates a settings object in the database
+        @retry_when_locked
         def update_setting(setting):
             try:
                 stmt = db.update(LiatrisSetting).where(LiatrisSetting.Key == setting.Key).values(Value=setting.Value). \
                     execution_options(synchronize_session="fetch")
-                __SESSION__.execute(stmt)
+                result = __SESSION__.execute(stmt)
                 __SESSION__.commit()
             except:
                 __SESSION__.rollback()
                 return False
+            if LiatrisSQLCore.Settings.CACHE is not None and result.rowcount != 0:
+                LiatrisSQLCore.Settings.CACHE[setting.Key] = setting.Value
             return True
 
     class Tasks:
         # Deletes a task and all associated items of that task from the database
+        @retry_when_locked
         def delete_task(task_id):
             try:
+                # The items of the task and their notes are removed by the foreign keys
                 __SESSION__.query(LiatrisTask).filter(LiatrisTask.TaskId == task_id).delete()
-                # Remove all associated tasks from LiatrisItems and LiatrisItemNotes
-                as_items = __SESSION__.query(LiatrisItem).filter(LiatrisItem.TaskId == task_id).all()
-                item_ids = []
-                for item in as_items:
-                    item_ids.append(item.ItemId)
-
-                __SESSION__.query(LiatrisItemNote).filter(LiatrisItemNote.ItemId in item_ids).delete()
-                __SESSION__.query(LiatrisItem).filter(LiatrisItem.TaskId == task_id).delete()
+                LiatrisSQLCore.Archive.delete_task_items(task_id)
                 __SESSION__.commit()
             except db.exc.SQLAlchemyError:
                 __SESSION__.rollback()
                 return False
+            items = LiatrisSQLCore.expunge_loaded(LiatrisItem, lambda state: state.get("TaskId") == task_id)
+            LiatrisSQLCore.expunge_items([item.ItemId for item in items])
             return True
 
         @staticmethod
         def get_all_tasks():
-            task = None
             try:
-                task = __SESSION__.query(LiatrisTask)
+                tasks = [LiatrisTaskRow(*row) for row in __SESSION__.execute(db.select(*TASK_ROW_COLUMNS))]
+            except db.exc.SQLAlchemyError:
+                return False
+            return tasks
+
+        # Produces LiatrisTaskRow objects of the tasks with the given ids that exist
+        @staticmethod
+        def get_tasks_by_ids(task_ids):
+            tasks = []
+            try:
+                for chunk in chunk_ids(task_ids):
+                    tasks += [LiatrisTaskRow(*row) for row in __SESSION__.execute(
+                        db.select(*TASK_ROW_COLUMNS).where(LiatrisTask.TaskId.in_(chunk)))]
             except db.exc.SQLAlchemyError:
                 return False
-            if task is None:
+            return tasks
+
+        # Produces (TaskId, TaskName, DoneItems, TotalItems) rows for all tasks, counted by the database in a single
+        # GROUP BY pass instead of loading every item
+        @staticmethod
+        def get_task_counters():
+            try:
+                done_items = db.func.sum(db.case((LiatrisItem.ItemIsDone == True, 1), else_=0))
+                counters = __SESSION__.query(LiatrisTask.TaskId, LiatrisTask.TaskName,
+                                             done_items.label("DoneItems"),
+                                             db.func.count(LiatrisItem.ItemId).label("TotalItems")) \
+                    .outerjoin(LiatrisItem, LiatrisItem.TaskId == LiatrisTask.TaskId) \
+                    .group_by(LiatrisTask.TaskId).order_by(LiatrisTask.TaskId).all()
+            except db.exc.SQLAlchemyError:
                 return False
-            return task.all()
+            return counters
 
         # Updates a task in the database with a new name
+        @retry_when_locked
         def update_task(task):
             try:
-                stmt = db.update(LiatrisTask).where(LiatrisTask.TaskId == task.TaskId).values(TaskName=task.TaskName) \
+                stmt = db.update(LiatrisTask).where(LiatrisTask.TaskId == task.TaskId) \
+                    .values(TaskName=task.TaskName, TaskNameKey=normalize_task_name(task.TaskName)) \
                     .execution_options(synchronize_session="fetch")
                 __SESSION__.execute(stmt)
                 __SESSION__.commit()
@@ -166,125 +852,362 @@ class LiatrisSQLCore:
             return True
 
         # Produces a list of all tasks with their associated items
+        # Tasks and items are fetched with a single outer join, so the number of queries does not grow with the
+        # number of tasks.
         @staticmethod
         def produce_all_task_items():
-            task_items = []
             try:
-                tasks = __SESSION__.query(LiatrisTask).all()
-
-                for task in tasks:
-                    as_items = __SESSION__.query(LiatrisItem).filter(LiatrisItem.TaskId == task.TaskId).all()
-
-                    task_item = LiatrisTaskItem(task, as_items)
-                    task_items.append(task_item)
+                rows = execute_task_item_rows(select_task_item_rows(outer=True)
+                                              .order_by(LiatrisTask.TaskId, LiatrisItem.ItemId))
             except db.exc.SQLAlchemyError:
                 return False
-            return task_items
+            return group_task_items(rows)
 
         # Produces a list of a specific task, identified by id with its associated items
         def produce_task_item_by_task_id(task_id):
-            task_item = None
             try:
-                task = __SESSION__.query(LiatrisTask).filter(LiatrisTask.TaskId == task_id).first()
-                if task is None:
-                    return False
+                rows = execute_task_item_rows(select_task_item_rows(outer=True).where(LiatrisTask.TaskId == task_id))
+            except db.exc.SQLAlchemyError:
+                return False
+            if len(rows) == 0:
+                return False
+            return group_task_items(rows)[0]
+
+        # Searches all tasks by their title, case insensitive. Tasks whose title starts with the search key come first
+        # and are found through the TaskNameKey index, tasks that only contain it follow. An empty search key matches
+        # all tasks.
+        def search_tasks(search_key, limit=None):
+            search_key = normalize_task_name(search_key)
+            try:
+                if search_key == "":
+                    return __SESSION__.query(LiatrisTask).order_by(LiatrisTask.TaskId).limit(limit).all()
 
-                as_items = __SESSION__.query(LiatrisItem).filter(LiatrisItem.TaskId == task.TaskId).all()
+                tasks = __SESSION__.query(LiatrisTask) \
+                    .filter(LiatrisTask.TaskNameKey >= search_key,
+                            LiatrisTask.TaskNameKey < search_key + "\U0010ffff") \
+                    .order_by(LiatrisTask.TaskNameKey).limit(limit).all()
 
-                task_item = LiatrisTaskItem(task, as_items)
+                if limit is None or len(tasks) < limit:
+                    tasks += __SESSION__.query(LiatrisTask) \
+                        .filter(db.func.instr(LiatrisTask.TaskNameKey, search_key) > 1) \
+                        .order_by(LiatrisTask.TaskNameKey) \
+                        .limit(None if limit is None else limit - len(tasks)).all()
             except db.exc.SQLAlchemyError:
                 return False
-            if task_item is None:
+            return tasks
+
+        # This function searches items by title, deadline and note with the search key and joins back to the task to
+        # create TaskItem objects. Matches are ranked, the tasks are ordered by their best matching item.
+        def search_task_items(search_key, limit=SEARCH_RESULT_LIMIT):
+            search_query = build_search_query(search_key)
+            if search_query == "":
+                return []
+
+            if not is_search_enabled():
+                return LiatrisSQLCore.Tasks.search_task_items_without_index(search_key, limit)
+
+            try:
+                # Archived items have an index of their own, the best matches of both indexes are merged by their
+                # scores
+                matches = []
+                for schema, search_table in (("main", "LiatrisSearch"), ("archive", "LiatrisArchiveSearch")):
+                    matches += __SESSION__.execute(db.text(
+                        "SELECT bm25(" + search_table + ", 10.0, 5.0, 1.0) AS Score, rowid, snippet(" + search_table +
+                        ", -1, :start, :end, '…', 12), :archived FROM " + schema + "." + search_table + " WHERE " +
+                        search_table + " MATCH :query ORDER BY Score LIMIT :limit"),
+                        {"start": SNIPPET_START, "end": SNIPPET_END, "query": search_query, "limit": limit,
+                         "archived": schema == "archive"}).all()
+                matches.sort(key=lambda match: match[0])
+
+                ranks = {}
+                snippets = {}
+                item_ids = []
+                archived_item_ids = []
+                for score, item_id, snippet, archived in matches[:limit]:
+                    ranks[item_id] = len(ranks)
+                    snippets[item_id] = snippet
+                    (archived_item_ids if archived else item_ids).append(item_id)
+
+                rows = []
+                if len(item_ids) != 0:
+                    rows += execute_task_item_rows(select_task_item_rows().where(LiatrisItem.ItemId.in_(item_ids)))
+                if len(archived_item_ids) != 0:
+                    rows += execute_task_item_rows(select_archived_task_item_rows()
+                                                   .where(ARCHIVED_ITEMS.c.ItemId.in_(archived_item_ids)))
+            except db.exc.SQLAlchemyError:
                 return False
-            return task_item
 
-        # Searches all tasks by their title
-        def search_tasks(search_key):
-            tasks = []
-            search_key = str(search_key).lower()
+            rows.sort(key=lambda row: ranks[row[1].ItemId])
+            task_items = {}
+            for task, item in rows:
+                if task.TaskId not in task_items:
+                    task_items[task.TaskId] = LiatrisTaskItem(task, [])
+                task_items[task.TaskId].ITEMS.append(item)
+                task_items[task.TaskId].SNIPPETS[item.ItemId] = snippets[item.ItemId]
+            return list(task_items.values())
+
+        # Searches items with LIKE patterns, used when SQLite has no FTS5 support
+        def search_task_items_without_index(search_key, limit=SEARCH_RESULT_LIMIT):
+            # Takes the item and note columns, of LiatrisItems or of the archive
+            def build_condition(items, notes):
+                conditions = []
+                for word in str(search_key).lower().split():
+                    pattern = "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                    conditions.append(db.func.lower(items.ItemTitle).like(pattern, escape="\\"))
+                    conditions.append(db.func.substr(items.ItemDate, 1, 10).like(pattern, escape="\\"))
+                    conditions.append(db.func.lower(notes.NoteContent).like(pattern, escape="\\"))
+                return db.or_(*conditions)
+
             try:
-                all_tasks = __SESSION__.query(LiatrisTask).all()
+                rows = execute_task_item_rows(
+                    select_task_item_rows()
+                    .outerjoin(LiatrisItemNote, LiatrisItemNote.ItemId == LiatrisItem.ItemId)
+                    .where(build_condition(LiatrisItem, LiatrisItemNote))
+                    .order_by(LiatrisTask.TaskId, LiatrisItem.ItemId).limit(limit))
+                if len(rows) < limit:
+                    rows += execute_task_item_rows(
+                        select_archived_task_item_rows()
+                        .outerjoin(ARCHIVED_ITEM_NOTES, ARCHIVED_ITEM_NOTES.c.ItemId == ARCHIVED_ITEMS.c.ItemId)
+                        .where(build_condition(ARCHIVED_ITEMS.c, ARCHIVED_ITEM_NOTES.c))
+                        .order_by(LiatrisTask.TaskId, ARCHIVED_ITEMS.c.ItemId).limit(limit - len(rows)))
+            except db.exc.SQLAlchemyError:
+                return False
+            return group_task_items(rows)
+
+    # Today, Upcoming, Someday and Logbook. The date and done state predicates are evaluated by SQLite on the
+    # LiatrisItemsDoneDateIndex, only matching items are loaded.
+    class SmartLists:
+        # Open items with a deadline today or in the past
+        def today_condition():
+            tomorrow = datetime.combine(date.today() + timedelta(days=1), time())
+            return db.and_(LiatrisItem.ItemIsDone == False, LiatrisItem.ItemDate < tomorrow)
 
-                for task in all_tasks:
-                    if task.TaskName is not None and task.TaskId is not None:
-                        if research(search_key, str(task.TaskName.lower())) is not None:
-                            tasks.append(task)
+        # Open items with a deadline after today and less than upcoming_threshold days away
+        def upcoming_condition(upcoming_threshold):
+            tomorrow = datetime.combine(date.today() + timedelta(days=1), time())
+            threshold = datetime.combine(date.today() + timedelta(days=int(upcoming_threshold)), time())
+            return db.and_(LiatrisItem.ItemIsDone == False, LiatrisItem.ItemDate >= tomorrow,
+                           LiatrisItem.ItemDate < threshold)
 
+        # Open items without a deadline
+        def someday_condition():
+            return db.and_(LiatrisItem.ItemIsDone == False, LiatrisItem.ItemDate == None)
+
+        # Completed items
+        def logbook_condition():
+            return LiatrisItem.ItemIsDone == True
+
+        # Produces the items matching the condition grouped by their task. There is deliberately no ORDER BY, so
+        # SQLite drives the query from the item index instead of scanning the tasks in order.
+        def produce_task_items(condition):
+            try:
+                rows = execute_task_item_rows(select_task_item_rows().where(LiatrisTask.TaskName != None, condition))
             except db.exc.SQLAlchemyError:
                 return False
-            return tasks
+            return group_task_items(rows)
 
-        # This function searches items by name and date with the search key and joins back to the task to create
-        # TaskItem objects
-        def search_task_items(search_key):
-            task_items = []
-            search_key = str(search_key).lower()
-            search_key = search_key.split(" ")
+        # Counts the items matching the condition
+        def count_items(condition):
             try:
-                tasks = __SESSION__.query(LiatrisTask).all()
+                count = __SESSION__.query(db.func.count(LiatrisItem.ItemId)) \
+                    .join(LiatrisTask, LiatrisItem.TaskId == LiatrisTask.TaskId) \
+                    .filter(LiatrisTask.TaskName != None, condition).scalar()
+            except db.exc.SQLAlchemyError:
+                return False
+            return count
 
-                for task in tasks:
-                    as_items = __SESSION__.query(LiatrisItem).filter(LiatrisItem.TaskId == task.TaskId).all()
+        def produce_today():
+            return LiatrisSQLCore.SmartLists.produce_task_items(LiatrisSQLCore.SmartLists.today_condition())
 
-                    filtered_items = []
+        def count_today():
+            return LiatrisSQLCore.SmartLists.count_items(LiatrisSQLCore.SmartLists.today_condition())
 
-                    for key in search_key:
-                        for item in as_items:
-                            if (research(key, str(item.ItemTitle).lower()) is not None or
-                                    research(key, str(item.ItemDate).split(" ")[0]) is not None):
-                                filtered_items.append(item)
+        def produce_upcoming(upcoming_threshold):
+            return LiatrisSQLCore.SmartLists.produce_task_items(
+                LiatrisSQLCore.SmartLists.upcoming_condition(upcoming_threshold))
 
-                    seen = set()
-                    filtered_items = [x for x in filtered_items if x not in seen and not seen.add(x)]
+        def count_upcoming(upcoming_threshold):
+            return LiatrisSQLCore.SmartLists.count_items(
+                LiatrisSQLCore.SmartLists.upcoming_condition(upcoming_threshold))
 
-                    if len(filtered_items) != 0:
-                        task_item = LiatrisTaskItem(task, filtered_items)
-                        task_items.append(task_item)
+        def produce_someday():
+            return LiatrisSQLCore.SmartLists.produce_task_items(LiatrisSQLCore.SmartLists.someday_condition())
+
+        # Produces all completed items, archived ones included
+        def produce_logbook():
+            try:
+                rows = execute_task_item_rows(select_task_item_rows().where(
+                    LiatrisTask.TaskName != None, LiatrisSQLCore.SmartLists.logbook_condition()))
+                rows += execute_task_item_rows(select_archived_task_item_rows().where(LiatrisTask.TaskName != None))
             except db.exc.SQLAlchemyError:
                 return False
-            return task_items
+            return group_task_items(rows)
+
+        # Produces one page of completed items, most recently completed first, grouped by their task. Pages are
+        # addressed by the (ItemDoneDate, ItemId) key of the last item of the previous page, None for the first page.
+        # Returns the page and the key of the next page, which is None after the last page.
+        def produce_logbook_page(after=None, task_id=None, limit=LOGBOOK_PAGE_SIZE):
+            # Takes the select function and the item columns, of LiatrisItems or of the archive
+            def select_page(select_rows, items, conditions):
+                conditions = [LiatrisTask.TaskName != None] + conditions
+                if task_id is not None:
+                    conditions.append(items.TaskId == task_id)
+                if after is not None:
+                    conditions.append(db.tuple_(items.ItemDoneDate, items.ItemId) < db.tuple_(*after))
+                return select_rows().where(*conditions) \
+                    .order_by(items.ItemDoneDate.desc(), items.ItemId.desc()).limit(limit)
+
+            try:
+                rows = execute_task_item_rows(select_page(select_task_item_rows, LiatrisItem,
+                                                          [LiatrisSQLCore.SmartLists.logbook_condition()]))
+                # Archived items are all done, the page is the first items of both
+                rows += execute_task_item_rows(select_page(select_archived_task_item_rows, ARCHIVED_ITEMS.c, []))
+            except db.exc.SQLAlchemyError:
+                return False
+            rows.sort(key=lambda row: (row[1].ItemDoneDate, row[1].ItemId), reverse=True)
+            rows = rows[:limit]
+
+            next_key = None
+            if len(rows) == limit:
+                next_key = (rows[-1][1].ItemDoneDate, rows[-1][1].ItemId)
+            return group_task_items(rows), next_key
 
     class Items:
-        # Allows you to update items in the database (use this to mark items as completed)
+        # Allows you to update items in the database (use this to mark items as completed), archived items are restored
+        # first
+        @retry_when_locked
         def update_item(item):
+            values = {LiatrisItem.TaskId: item.TaskId, LiatrisItem.ItemIsDone: item.ItemIsDone,
+                      LiatrisItem.ItemTitle: item.ItemTitle, LiatrisItem.ItemDate: normalize_item_date(item.ItemDate)}
+            # The completion date is kept while the item stays done
+            initial_values = None
+            if item.ItemIsDone:
+                initial_values = {LiatrisItem.ItemDoneDate: datetime.now()}
+            else:
+                values[LiatrisItem.ItemDoneDate] = None
             try:
-                stmt = db.update(LiatrisItem).where(LiatrisItem.ItemId == item.ItemId) \
-                    .values(TaskId=item.TaskId, ItemIsDone=item.ItemIsDone, \
-                            ItemTitle=item.ItemTitle, ItemDate=item.ItemDate) \
-                    .execution_options(synchronize_session="fetch")
-                __SESSION__.execute(stmt)
+                LiatrisSQLCore.Items.write_items([item.ItemId], values, initial_values)
                 __SESSION__.commit()
             except:
                 __SESSION__.rollback()
                 return False
             return True
 
-        # Retrieves an item from the database by its itemid
+        # Sets the same values on many items in one transaction, takes a list of ItemIds and a Column -> value
+        # dictionary. Archived items are restored first. See write_items.
+        @retry_when_locked
+        def update_items(item_ids, values, initial_values=None):
+            try:
+                LiatrisSQLCore.Items.write_items(item_ids, values, initial_values)
+                __SESSION__.commit()
+            except db.exc.SQLAlchemyError:
+                __SESSION__.rollback()
+                return False
+            return True
+
+        # Writes Column -> value dictionaries to many items, initial_values only to the items where the column is
+        # still NULL. The values are copied into the loaded items, so they have to be plain values: the session
+        # expires the attributes it can not evaluate, like SQL expressions, and every loaded item would read them
+        # again one by one. Archived items are restored first. Does not commit.
+        def write_items(item_ids, values, initial_values=None):
+            for chunk in chunk_ids(item_ids):
+                LiatrisSQLCore.Archive.restore_items(chunk)
+                __SESSION__.execute(db.update(LiatrisItem).where(LiatrisItem.ItemId.in_(chunk)).values(values)
+                                    .execution_options(synchronize_session="fetch"))
+                for column, value in (initial_values or {}).items():
+                    __SESSION__.execute(db.update(LiatrisItem).where(LiatrisItem.ItemId.in_(chunk), column == None)
+                                        .values({column: value}).execution_options(synchronize_session="fetch"))
+
+        # Marks many items as done or not done, items that are done already keep their completion date
+        def mark_items(item_ids, item_is_done):
+            if item_is_done:
+                return LiatrisSQLCore.Items.update_items(item_ids, {LiatrisItem.ItemIsDone: True},
+                                                         {LiatrisItem.ItemDoneDate: datetime.now()})
+            return LiatrisSQLCore.Items.update_items(item_ids, {LiatrisItem.ItemIsDone: False,
+                                                                LiatrisItem.ItemDoneDate: None})
+
+        # Moves many items to the task with the given id
+        def move_items(item_ids, task_id):
+            return LiatrisSQLCore.Items.update_items(item_ids, {LiatrisItem.TaskId: task_id})
+
+        # Sets the deadline of many items, None removes it. The values of update_items are copied into the loaded
+        # items as they are, so days are turned into datetimes first.
+        def set_items_date(item_ids, item_date):
+            return LiatrisSQLCore.Items.update_items(item_ids, {LiatrisItem.ItemDate: normalize_item_date(item_date)})
+
+        # Deletes many items and their notes in one transaction
+        @retry_when_locked
+        def delete_items(item_ids):
+            try:
+                for chunk in chunk_ids(item_ids):
+                    stmt = db.delete(LiatrisItem).where(LiatrisItem.ItemId.in_(chunk)) \
+                        .execution_options(synchronize_session=False)
+                    __SESSION__.execute(stmt)
+                    LiatrisSQLCore.Archive.delete_items(chunk)
+                __SESSION__.commit()
+            except db.exc.SQLAlchemyError:
+                __SESSION__.rollback()
+                return False
+            LiatrisSQLCore.expunge_items(item_ids)
+            return True
+
+        # Produces (ItemId, TaskId, ItemIsDone, ItemDate) rows of all items, or of the items with the given ids,
+        # without building ORM objects
+        def get_item_states(item_ids=None):
+            query = db.select(LiatrisItem.ItemId, LiatrisItem.TaskId, LiatrisItem.ItemIsDone, LiatrisItem.ItemDate)
+            try:
+                if item_ids is None:
+                    return __SESSION__.execute(query).all()
+                item_states = []
+                for chunk in chunk_ids(item_ids):
+                    item_states += __SESSION__.execute(query.where(LiatrisItem.ItemId.in_(chunk))).all()
+            except db.exc.SQLAlchemyError:
+                return False
+            return item_states
+
+        # Produces an ItemId -> (task, item) dictionary of LiatrisTaskRow and LiatrisItemRow pairs for the given ids,
+        # archived items included. Ids of items that do not exist are left out.
+        def get_item_rows(item_ids):
+            item_rows = {}
+            try:
+                for chunk in chunk_ids(item_ids):
+                    for select_rows, items in ((select_task_item_rows(), LiatrisItem.__table__),
+                                               (select_archived_task_item_rows(), ARCHIVED_ITEMS)):
+                        for task, item in execute_task_item_rows(select_rows.where(items.c.ItemId.in_(chunk))):
+                            item_rows[item.ItemId] = (task, item)
+            except db.exc.SQLAlchemyError:
+                return False
+            return item_rows
+
+        # Retrieves an item from the database by its itemid, archived items are returned as a LiatrisItemRow
         def get_item_by_id(item_id):
             item = None
             try:
-                item = __SESSION__.query(LiatrisItem).filter(LiatrisItem.ItemId == item_id)
+                item = __SESSION__.query(LiatrisItem).filter(LiatrisItem.ItemId == item_id).first()
+                if item is None:
+                    item = LiatrisSQLCore.Archive.get_archived_item(item_id)
             except db.exc.SQLAlchemyError:
                 return False
-            if item is None:
-                return False
-            return item.first()
+            return item
 
         # Deletes an item from the database
+        @retry_when_locked
         def delete_item(item_id):
             try:
-                # Remove both the item and the item note from the database
-                __SESSION__.query(LiatrisItemNote).filter(LiatrisItemNote.ItemId == item_id).delete()
+                # The item note is removed by the foreign key
                 __SESSION__.query(LiatrisItem).filter(LiatrisItem.ItemId == item_id).delete()
+                LiatrisSQLCore.Archive.delete_items([item_id])
                 __SESSION__.commit()
             except db.exc.SQLAlchemyError:
                 __SESSION__.rollback()
                 return False
+            LiatrisSQLCore.expunge_items([item_id])
             return True
 
     class ItemNotes:
         # This updates an item notes content entry in the database we do not allow moving item notes around different
         # items
+        @retry_when_locked
         def update_item_note(item_note):
             try:
                 stmt = db.update(LiatrisItemNote).where(LiatrisItemNote.NoteId == item_note.NoteId) \
@@ -297,13 +1220,303 @@ class LiatrisSQLCore:
                 return False
             return True
 
+        # Writes the contents of many item notes, given as an ItemId -> NoteContent dictionary, in one transaction.
+        # Notes are only stored while they have content, emptied notes are deleted. Notes of items that no longer
+        # exist are skipped, archived items are restored first.
+        @retry_when_locked
+        def update_item_notes(item_notes):
+            written_notes = [{"NoteItemId": item_id, "NoteText": note_content}
+                             for item_id, note_content in item_notes.items() if note_content]
+            emptied_notes = [{"NoteItemId": item_id}
+                             for item_id, note_content in item_notes.items() if not note_content]
+            try:
+                LiatrisSQLCore.Archive.restore_items(item_notes.keys())
+                if len(written_notes) != 0:
+                    __SESSION__.execute(db.text(
+                        "INSERT INTO LiatrisItemNotes (ItemId, NoteContent) SELECT :NoteItemId, :NoteText "
+                        "WHERE EXISTS (SELECT 1 FROM LiatrisItems WHERE ItemId = :NoteItemId) "
+                        "ON CONFLICT (ItemId) DO UPDATE SET NoteContent = excluded.NoteContent"), written_notes)
+                if len(emptied_notes) != 0:
+                    __SESSION__.execute(db.text("DELETE FROM LiatrisItemNotes WHERE ItemId = :NoteItemId"),
+                                        emptied_notes)
+                __SESSION__.commit()
+            except db.exc.SQLAlchemyError:
+                __SESSION__.rollback()
+                return False
+            # Loaded notes no longer match their rows
+            LiatrisSQLCore.expunge_loaded(LiatrisItemNote, lambda state: state.get("ItemId") in item_notes)
+            return True
+
         # Gets an item note entry based on the id of its item
         def get_item_note_by_item_id(item_id):
             item_note = None
             try:
-                item_note = __SESSION__.query(LiatrisItemNote).filter(LiatrisItemNote.ItemId == item_id).first()
+                item_note = __SESSION__.query(LiatrisItemNote).options(undefer(LiatrisItemNote.NoteContent)) \
+                    .filter(LiatrisItemNote.ItemId == item_id).first()
+                if item_note is None:
+                    item_note = LiatrisSQLCore.Archive.get_archived_item_note(item_id)
             except db.exc.SQLAlchemyError:
                 return False
             if item_note is None:
                 return False
             return item_note
+
+        # Produces an ItemId -> length dictionary for the items of the list that have a note, without loading the
+        # note contents
+        def get_note_lengths(item_ids):
+            note_lengths = {}
+            try:
+                for chunk in chunk_ids(item_ids):
+                    rows = __SESSION__.execute(
+                        db.select(LiatrisItemNote.ItemId, db.func.length(LiatrisItemNote.NoteContent))
+                        .where(LiatrisItemNote.ItemId.in_(chunk), LiatrisItemNote.NoteContent != "")).all()
+                    note_lengths.update(rows)
+                    rows = __SESSION__.execute(
+                        db.select(ARCHIVED_ITEM_NOTES.c.ItemId, db.func.length(ARCHIVED_ITEM_NOTES.c.NoteContent))
+                        .where(ARCHIVED_ITEM_NOTES.c.ItemId.in_(chunk), ARCHIVED_ITEM_NOTES.c.NoteContent != "")).all()
+                    note_lengths.update(rows)
+            except db.exc.SQLAlchemyError:
+                return False
+            return note_lengths
+
+    # Items that were completed a while ago are moved into the archive database, see ARCHIVE_FILE, which keeps the
+    # tables the open items are read from small. The Logbook and the search read archived items together with the
+    # others, every change to an archived item restores it first.
+    class Archive:
+        # Moves the items completed more than the given number of days ago and their notes into the archive, in
+        # transactions of batch_size items. Returns the number of archived items.
+        # With a write-ahead log a transaction over two databases is only atomic per database, after a crash an item
+        # can be in both. The archive is written first and replaces its rows, so the next run cleans this up.
+        @retry_when_locked
+        def archive_completed(days, batch_size=ARCHIVE_BATCH_SIZE):
+            selection = "SELECT ItemId FROM LiatrisItems WHERE ItemIsDone = 1 AND ItemDoneDate < :cutoff " \
+                        "ORDER BY ItemDoneDate LIMIT :limit"
+            statements = [
+                "INSERT OR REPLACE INTO archive.LiatrisArchivedItems "
+                "(ItemId, TaskId, ItemIsDone, ItemTitle, ItemDate, ItemDoneDate) "
+                "SELECT ItemId, TaskId, ItemIsDone, ItemTitle, ItemDate, ItemDoneDate FROM LiatrisItems "
+                "WHERE ItemId IN (" + selection + ")",
+                "INSERT OR REPLACE INTO archive.LiatrisArchivedItemNotes (ItemId, NoteContent) "
+                "SELECT ItemId, NoteContent FROM LiatrisItemNotes WHERE ItemId IN (" + selection + ")"
+            ]
+            if is_search_enabled():
+                statements += [
+                    "DELETE FROM archive.LiatrisArchiveSearch WHERE rowid IN (" + selection + ")",
+                    "INSERT INTO archive.LiatrisArchiveSearch (rowid, ItemTitle, ItemDay, NoteContent) "
+                    "SELECT ItemId, ItemTitle, ItemDay, NoteContent FROM LiatrisSearch "
+                    "JOIN (" + selection + ") ON ItemId = LiatrisSearch.rowid"
+                ]
+            parameters = {"cutoff": format_datetime(datetime.now() - timedelta(days=int(days))), "limit": batch_size}
+
+            count = 0
+            try:
+                while True:
+                    for statement in statements:
+                        __SESSION__.execute(db.text(statement), parameters)
+                    # Their notes and search entries are removed by the foreign key and the triggers
+                    archived = __SESSION__.execute(db.text("DELETE FROM LiatrisItems WHERE ItemId IN (" + selection +
+                                                           ")"), parameters).rowcount
+                    __SESSION__.commit()
+                    count += archived
+                    if archived < batch_size:
+                        break
+            except db.exc.SQLAlchemyError:
+                __SESSION__.rollback()
+                return False
+            return count
+
+        # Moves archived items and their notes back, the operations that change items call this before they write.
+        # Does not commit. Returns the ids of the restored items.
+        def restore_items(item_ids):
+            items_table = LiatrisItem.__table__
+            notes_table = LiatrisItemNote.__table__
+            restored_ids = []
+            for chunk in chunk_ids(item_ids):
+                archived_ids = __SESSION__.execute(db.select(ARCHIVED_ITEMS.c.ItemId)
+                                                   .where(ARCHIVED_ITEMS.c.ItemId.in_(chunk))).scalars().all()
+                if len(archived_ids) == 0:
+                    continue
+                # The search triggers index the restored items again
+                __SESSION__.execute(items_table.insert().prefix_with("OR IGNORE").from_select(
+                    [column.name for column in ARCHIVED_ITEM_ROW_COLUMNS],
+                    db.select(*ARCHIVED_ITEM_ROW_COLUMNS).where(ARCHIVED_ITEMS.c.ItemId.in_(archived_ids))))
+                __SESSION__.execute(notes_table.insert().prefix_with("OR IGNORE").from_select(
+                    [notes_table.c.ItemId, notes_table.c.NoteContent],
+                    db.select(ARCHIVED_ITEM_NOTES.c.ItemId, ARCHIVED_ITEM_NOTES.c.NoteContent)
+                    .where(ARCHIVED_ITEM_NOTES.c.ItemId.in_(archived_ids))))
+                LiatrisSQLCore.Archive.delete_items(archived_ids)
+                restored_ids += archived_ids
+            return restored_ids
+
+        # Deletes archived items, their notes and their search entries. Does not commit.
+        def delete_items(item_ids):
+            for chunk in chunk_ids(item_ids):
+                if is_search_enabled():
+                    __SESSION__.execute(db.text("DELETE FROM archive.LiatrisArchiveSearch WHERE rowid IN :ItemIds")
+                                        .bindparams(db.bindparam("ItemIds", expanding=True)), {"ItemIds": chunk})
+                __SESSION__.execute(ARCHIVED_ITEM_NOTES.delete().where(ARCHIVED_ITEM_NOTES.c.ItemId.in_(chunk)))
+                __SESSION__.execute(ARCHIVED_ITEMS.delete().where(ARCHIVED_ITEMS.c.ItemId.in_(chunk)))
+
+        # Deletes the archived items of a task, does not commit
+        def delete_task_items(task_id):
+            archived_ids = __SESSION__.execute(db.select(ARCHIVED_ITEMS.c.ItemId)
+                                               .where(ARCHIVED_ITEMS.c.TaskId == task_id)).scalars().all()
+            LiatrisSQLCore.Archive.delete_items(archived_ids)
+
+        # Returns an archived item as a LiatrisItemRow, None if there is no archived item with the id
+        def get_archived_item(item_id):
+            row = __SESSION__.execute(db.select(*ARCHIVED_ITEM_ROW_COLUMNS)
+                                      .where(ARCHIVED_ITEMS.c.ItemId == item_id)).first()
+            if row is None:
+                return None
+            return LiatrisItemRow(*row)
+
+        # Returns the note of an archived item as a LiatrisItemNote that is not part of the session, None if it has
+        # none
+        def get_archived_item_note(item_id):
+            note_content = __SESSION__.execute(db.select(ARCHIVED_ITEM_NOTES.c.NoteContent)
+                                               .where(ARCHIVED_ITEM_NOTES.c.ItemId == item_id)).scalar()
+            if note_content is None:
+                return None
+            item_note = LiatrisItemNote()
+            item_note.ItemId = item_id
+            item_note.NoteContent = note_content
+            return item_note
+
+        # Produces (TaskId, count) rows of the archived items of every task
+        def count_archived_items():
+            try:
+                counts = __SESSION__.execute(db.select(ARCHIVED_ITEMS.c.TaskId, db.func.count(ARCHIVED_ITEMS.c.ItemId))
+                                             .group_by(ARCHIVED_ITEMS.c.TaskId)).all()
+            except db.exc.SQLAlchemyError:
+                return False
+            return counts
+
+        # Produces (ItemId, TaskId, ItemDate) rows of the archived items among the given ids
+        def get_archived_item_states(item_ids):
+            item_states = []
+            try:
+                for chunk in chunk_ids(item_ids):
+                    item_states += __SESSION__.execute(
+                        db.select(ARCHIVED_ITEMS.c.ItemId, ARCHIVED_ITEMS.c.TaskId, ARCHIVED_ITEMS.c.ItemDate)
+                        .where(ARCHIVED_ITEMS.c.ItemId.in_(chunk))).all()
+            except db.exc.SQLAlchemyError:
+                return False
+            return item_states
+
+    # Bulk import and export of tasks, items and notes. Records are dictionaries of column values with a "Type" of
+    # "Task", "Item" or "Note", exports list all tasks first, then all items and then all notes. Archived items are
+    # exported with the others and imported as regular items.
+    class Transfer:
+        # Yields all records, rows are fetched in batches so that the whole database is never held in memory
+        def export_records(batch_size=TRANSFER_BATCH_SIZE):
+            tasks_table = LiatrisTask.__table__
+            items_table = LiatrisItem.__table__
+            notes_table = LiatrisItemNote.__table__
+            # Notes that were never written to are left out
+            queries = [
+                ("Task", db.select(tasks_table.c.TaskId, tasks_table.c.TaskName).order_by(tasks_table.c.TaskId)),
+                ("Item", db.select(items_table.c.ItemId, items_table.c.TaskId, items_table.c.ItemIsDone,
+                                   items_table.c.ItemTitle, items_table.c.ItemDate, items_table.c.ItemDoneDate)
+                 .order_by(items_table.c.ItemId)),
+                ("Item", db.select(*ARCHIVED_ITEM_ROW_COLUMNS).order_by(ARCHIVED_ITEMS.c.ItemId)),
+                ("Note", db.select(notes_table.c.ItemId, notes_table.c.NoteContent)
+                 .where(notes_table.c.NoteContent != "").order_by(notes_table.c.ItemId)),
+                ("Note", db.select(ARCHIVED_ITEM_NOTES.c.ItemId, ARCHIVED_ITEM_NOTES.c.NoteContent)
+                 .where(ARCHIVED_ITEM_NOTES.c.NoteContent != "").order_by(ARCHIVED_ITEM_NOTES.c.ItemId))
+            ]
+            try:
+                for record_type, query in queries:
+                    result = __SESSION__.execute(query)
+                    keys = ["Type"] + list(result.keys())
+                    rows = result.fetchmany(batch_size)
+                    while len(rows) != 0:
+                        for row in rows:
+                            yield dict(zip(keys, (record_type,) + tuple(row)))
+                        rows = result.fetchmany(batch_size)
+            finally:
+                __SESSION__.rollback()
+
+        # Adds the records to the database in one transaction, written in batches of executemany statements.
+        # Ids are shifted past the ids already in use, so a dump can be imported next to existing projects and keeps
+        # the links between its tasks, items and notes. The imported items are added to the search index in one
+        # statement at the end and logged as one change of all tasks and items. progress is called with the number of
+        # records written so far. Returns the number of imported records. Records are only read once, so an import
+        # that failed on a lock is not retried.
+        # The import holds the write lock of the database from its start, other connections can read but wait for it
+        # to write. The insert triggers are dropped inside its transaction, so no other write ever runs without them.
+        def import_records(records, batch_size=TRANSFER_BATCH_SIZE, progress=None):
+            tasks_table = LiatrisTask.__table__
+            items_table = LiatrisItem.__table__
+            # Rows are handed to the driver as they are, binding every value through SQLAlchemy would take longer
+            # than the inserts themselves. Batches are written in this order so that items never come before their
+            # task.
+            statements = {
+                "Task": "INSERT INTO LiatrisTasks (TaskId, TaskName, TaskNameKey) VALUES (?, ?, ?)",
+                "Item": "INSERT INTO LiatrisItems (ItemId, TaskId, ItemIsDone, ItemTitle, ItemDate, ItemDoneDate) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                "Note": "INSERT INTO LiatrisItemNotes (ItemId, NoteContent) VALUES (?, ?)"
+            }
+            batches = {"Task": [], "Item": [], "Note": []}
+            count = 0
+
+            def write_batches():
+                for record_type, batch in batches.items():
+                    if len(batch) != 0:
+                        __SESSION__.connection().exec_driver_sql(statements[record_type], batch)
+                        batch.clear()
+                if progress is not None:
+                    progress(count)
+
+            try:
+                # SQLite would only take the lock with the first write, after the ids were read
+                dbapi_connection = __SESSION__.connection().connection.dbapi_connection
+                if not dbapi_connection.in_transaction:
+                    dbapi_connection.execute("BEGIN IMMEDIATE")
+                task_offset = __SESSION__.execute(db.select(db.func.coalesce(db.func.max(tasks_table.c.TaskId), 0))) \
+                    .scalar()
+                item_offset = max(
+                    __SESSION__.execute(db.select(db.func.coalesce(db.func.max(items_table.c.ItemId), 0))).scalar(),
+                    __SESSION__.execute(db.select(db.func.coalesce(db.func.max(ARCHIVED_ITEMS.c.ItemId), 0))).scalar())
+                drop_triggers = CHANGE_INSERT_TRIGGERS + (SEARCH_INSERT_TRIGGERS if is_search_enabled() else [])
+                for trigger_name in drop_triggers:
+                    __SESSION__.execute(db.text("DROP TRIGGER IF EXISTS " + trigger_name))
+
+                for record in records:
+                    record_type = record["Type"]
+                    if record_type == "Task":
+                        batches[record_type].append((record["TaskId"] + task_offset, record["TaskName"],
+                                                     normalize_task_name(record["TaskName"])))
+                    elif record_type == "Item":
+                        item_is_done = record["ItemIsDone"] is True
+                        item_done_date = record.get("ItemDoneDate")
+                        if item_is_done and item_done_date is None:
+                            item_done_date = LOGBOOK_EPOCH
+                        batches[record_type].append((record["ItemId"] + item_offset, record["TaskId"] + task_offset,
+                                                     item_is_done, record["ItemTitle"],
+                                                     format_datetime(record.get("ItemDate")),
+                                                     format_datetime(item_done_date) if item_is_done else None))
+                    elif record_type == "Note":
+                        batches[record_type].append((record["ItemId"] + item_offset, record["NoteContent"]))
+                    else:
+                        raise ValueError("Unknown record type " + repr(record_type))
+
+                    count += 1
+                    if len(batches[record_type]) >= batch_size:
+                        write_batches()
+
+                write_batches()
+                if is_search_enabled():
+                    __SESSION__.execute(db.text(SEARCH_BACKFILL), {"after": item_offset})
+                    create_search_triggers(__SESSION__)
+                __SESSION__.execute(db.text("INSERT INTO LiatrisChanges (TableName, RowId) "
+                                            "VALUES ('LiatrisTasks', NULL), ('LiatrisItems', NULL)"))
+                create_change_triggers(__SESSION__)
+                __SESSION__.commit()
+            except (db.exc.SQLAlchemyError, sqlite3.Error):
+                __SESSION__.rollback()
+                return False
+            except:
+                __SESSION__.rollback()
+                raise
+            return count
@@ -0,0 +1,17 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import os
+
+# Locations of the files of Liatris. They live in a module of their own, so clients of the daemon find its socket
+# without loading SQLAlchemy.
+
+# The LIATRIS_DB_DIR environment variable points Liatris at another directory, used by the tests and the benchmarks
+DB_DIR = os.environ.get("LIATRIS_DB_DIR")
+if DB_DIR is None:
+    DB_DIR = "/home/" + os.getlogin() + "/.liatris"
+DB_FILE = DB_DIR + "/liatrisdb"
+# Items completed long ago are moved into this database, it is attached to every connection as "archive"
+ARCHIVE_FILE = DB_DIR + "/liatrisarchive"
+# Unix socket of liatris_daemon
+SOCKET_FILE = DB_DIR + "/liatris.sock"
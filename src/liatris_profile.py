@@ -0,0 +1,186 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import collections
+import functools
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime
+
+import sqlalchemy as db
+
+import liatris_db
+
+# Setting LIATRIS_SQL_PROFILE to 1 records every statement sent to the database together with the action that sent
+# it, any other value than 0 is taken as the path of the log file. The report is appended to the log file when
+# Liatris quits and shown by the debug panel, Ctrl+Shift+D.
+PROFILE_SETTING = os.environ.get("LIATRIS_SQL_PROFILE", "0")
+ENABLED = PROFILE_SETTING not in ("", "0")
+LOG_FILE = liatris_db.DB_DIR + "/sqlprofile.log" if PROFILE_SETTING in ("", "0", "1") else PROFILE_SETTING
+
+# Statement latencies kept per action for the percentile, the oldest ones are dropped first
+LATENCY_SAMPLES = 1000
+# Slowest statements listed per action
+SLOWEST_STATEMENTS = 5
+# Length statements are cut to in the report
+STATEMENT_LENGTH = 160
+# Statements sent outside of any action are recorded under this name
+NO_ACTION = "(no action)"
+
+LOCK = threading.Lock()
+# Action name -> statistics, see get_action_stats
+ACTIONS = {}
+# The actions that are running on a thread, innermost last
+CURRENT = threading.local()
+
+
+def get_action_stats(name):
+    stats = ACTIONS.get(name)
+    if stats is None:
+        stats = {"Calls": 0, "Statements": 0, "MostStatements": 0, "Seconds": 0.0,
+                 "Latencies": collections.deque(maxlen=LATENCY_SAMPLES), "Slowest": {}}
+        ACTIONS[name] = stats
+    return stats
+
+
+# Returns the calls of actions that are running on this thread, the worker hands them to the threads that run the
+# queries of an action
+def get_current_actions():
+    return getattr(CURRENT, "actions", ())
+
+
+# Runs function on behalf of action calls started on another thread
+def run_in_actions(actions, function, *args, **kwargs):
+    previous_actions = get_current_actions()
+    CURRENT.actions = actions
+    try:
+        return function(*args, **kwargs)
+    finally:
+        CURRENT.actions = previous_actions
+
+
+# Decorator that records the statements sent while the function runs under its name. Statements of nested actions
+# count for every action around them as well. Without profiling the function is returned as it is.
+def action(function):
+    if not ENABLED:
+        return function
+
+    @functools.wraps(function)
+    def run_action(*args, **kwargs):
+        action_call = {"Name": function.__name__, "Statements": 0}
+        with LOCK:
+            get_action_stats(function.__name__)["Calls"] += 1
+        return run_in_actions(get_current_actions() + (action_call,), function, *args, **kwargs)
+
+    return run_action
+
+
+def record_statement(statement, seconds):
+    action_calls = get_current_actions()
+    if len(action_calls) == 0:
+        action_calls = ({"Name": NO_ACTION, "Statements": 0},)
+    with LOCK:
+        for action_call in action_calls:
+            action_call["Statements"] += 1
+            stats = get_action_stats(action_call["Name"])
+            stats["Statements"] += 1
+            stats["MostStatements"] = max(stats["MostStatements"], action_call["Statements"])
+            stats["Seconds"] += seconds
+            stats["Latencies"].append(seconds)
+            slowest = stats["Slowest"]
+            if seconds > slowest.get(statement, -1.0):
+                slowest[statement] = seconds
+                # Statements binding a list of ids differ in length, keep the dictionary small
+                if len(slowest) > SLOWEST_STATEMENTS * 10:
+                    stats["Slowest"] = dict(sorted(slowest.items(), key=lambda entry: entry[1],
+                                                   reverse=True)[:SLOWEST_STATEMENTS])
+
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info["LiatrisProfileStart"] = time.perf_counter()
+
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    start = connection.info.pop("LiatrisProfileStart", None)
+    if start is not None:
+        record_statement(statement, time.perf_counter() - start)
+
+
+# Starts recording the statements of the engine, returns False if profiling is not enabled
+def install(engine=None):
+    if not ENABLED:
+        return False
+    if engine is None:
+        engine = liatris_db.get_engine()
+    if not db.event.contains(engine, "before_cursor_execute", before_cursor_execute):
+        db.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        db.event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    return True
+
+
+def reset():
+    with LOCK:
+        ACTIONS.clear()
+
+
+# Returns the latency below which the given share of the latencies lie
+def get_percentile(latencies, share):
+    if len(latencies) == 0:
+        return 0.0
+    latencies = sorted(latencies)
+    return latencies[max(math.ceil(share * len(latencies)) - 1, 0)]
+
+
+def format_milliseconds(seconds):
+    return "{:.2f}".format(seconds * 1000)
+
+
+def format_statement(statement):
+    statement = re.sub(r"\s+", " ", statement).strip()
+    if len(statement) > STATEMENT_LENGTH:
+        statement = statement[:STATEMENT_LENGTH - 3] + "..."
+    return statement
+
+
+# Builds the report of all actions, the actions that spent the most time in the database come first
+def get_report():
+    with LOCK:
+        actions = sorted(((name, dict(stats, Latencies=list(stats["Latencies"]), Slowest=dict(stats["Slowest"])))
+                          for name, stats in ACTIONS.items()), key=lambda entry: entry[1]["Seconds"], reverse=True)
+    if len(actions) == 0:
+        return "No statements recorded.\n"
+
+    name_width = max(len("Action"), max(len(name) for name, _ in actions))
+    header = ["Action".ljust(name_width), "Calls".rjust(7), "Statements".rjust(11), "Per call".rjust(9),
+              "Most".rjust(6), "Total ms".rjust(10), "p95 ms".rjust(8)]
+    lines = ["  ".join(header)]
+    for name, stats in actions:
+        per_call = "-" if stats["Calls"] == 0 else "{:.1f}".format(stats["Statements"] / stats["Calls"])
+        lines.append("  ".join([name.ljust(name_width), str(stats["Calls"]).rjust(7),
+                                str(stats["Statements"]).rjust(11), per_call.rjust(9),
+                                str(stats["MostStatements"]).rjust(6),
+                                format_milliseconds(stats["Seconds"]).rjust(10),
+                                format_milliseconds(get_percentile(stats["Latencies"], 0.95)).rjust(8)]))
+
+    lines.append("")
+    lines.append("Slowest statements")
+    for name, stats in actions:
+        lines.append(name)
+        slowest = sorted(stats["Slowest"].items(), key=lambda entry: entry[1], reverse=True)[:SLOWEST_STATEMENTS]
+        for statement, seconds in slowest:
+            lines.append(format_milliseconds(seconds).rjust(10) + " ms  " + format_statement(statement))
+    return "\n".join(lines) + "\n"
+
+
+# Appends the report to the log file, returns False if it could not be written
+def write_report():
+    try:
+        with open(LOG_FILE, "a") as log_file:
+            log_file.write("SQL profile of " + datetime.now().isoformat(" ", "seconds") + "\n\n" + get_report() +
+                           "\n")
+    except OSError:
+        return False
+    return True
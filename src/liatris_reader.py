@@ -0,0 +1,156 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import os
+import sqlite3
+from datetime import date, datetime, time, timedelta
+
+import liatris_paths
+
+# Commands of liatris_cli that only read, answered with the sqlite3 module of the standard library. Loading SQLAlchemy
+# takes longer than any of these queries, so list, today, upcoming and stats start without it. The queries are the
+# ones LiatrisSQLCore sends for them and the results are the ones of liatris_commands. Databases that liatris_db has
+# not created or upgraded yet are left to liatris_commands.
+
+# liatris_db.SCHEMA_VERSION
+SCHEMA_VERSION = 1
+# liatris_commands.DEFAULT_UPCOMING_THRESHOLD
+DEFAULT_UPCOMING_THRESHOLD = 7
+
+TASK_ITEM_ROWS = 'SELECT "LiatrisTasks"."TaskId", "LiatrisTasks"."TaskName", "LiatrisItems"."ItemId", ' \
+    '"LiatrisItems"."ItemIsDone", "LiatrisItems"."ItemTitle", "LiatrisItems"."ItemDate", ' \
+    '"LiatrisItems"."ItemDoneDate" ' \
+    'FROM "LiatrisTasks" JOIN "LiatrisItems" ON "LiatrisItems"."TaskId" = "LiatrisTasks"."TaskId" '
+COUNT_ITEMS = 'SELECT count("LiatrisItems"."ItemId") FROM "LiatrisItems" ' \
+    'JOIN "LiatrisTasks" ON "LiatrisItems"."TaskId" = "LiatrisTasks"."TaskId" '
+# LiatrisSQLCore.SmartLists.today_condition and upcoming_condition
+TODAY_CONDITION = 'WHERE "LiatrisTasks"."TaskName" IS NOT NULL AND "LiatrisItems"."ItemIsDone" = 0 ' \
+    'AND "LiatrisItems"."ItemDate" < ?'
+UPCOMING_CONDITION = 'WHERE "LiatrisTasks"."TaskName" IS NOT NULL AND "LiatrisItems"."ItemIsDone" = 0 ' \
+    'AND "LiatrisItems"."ItemDate" >= ? AND "LiatrisItems"."ItemDate" < ?'
+TASK_COUNTERS = 'SELECT "LiatrisTasks"."TaskId", "LiatrisTasks"."TaskName", ' \
+    'sum(CASE WHEN ("LiatrisItems"."ItemIsDone" = 1) THEN 1 ELSE 0 END), count("LiatrisItems"."ItemId") ' \
+    'FROM "LiatrisTasks" LEFT OUTER JOIN "LiatrisItems" ON "LiatrisItems"."TaskId" = "LiatrisTasks"."TaskId" ' \
+    'GROUP BY "LiatrisTasks"."TaskId" ORDER BY "LiatrisTasks"."TaskId"'
+ARCHIVED_COUNTS = 'SELECT archive."LiatrisArchivedItems"."TaskId", count(archive."LiatrisArchivedItems"."ItemId") ' \
+    'FROM archive."LiatrisArchivedItems" GROUP BY archive."LiatrisArchivedItems"."TaskId"'
+
+
+# Opens the database like liatris_db does, returns None if liatris_db has to create or upgrade it first
+def connect(db_file, archive_file):
+    if not os.path.exists(db_file) or not os.path.exists(archive_file):
+        return None
+    connection = sqlite3.connect(db_file)
+    try:
+        if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            connection.close()
+            return None
+        connection.execute("ATTACH DATABASE ? AS archive", (archive_file,))
+    except sqlite3.Error:
+        connection.close()
+        raise
+    return connection
+
+
+# Formats a datetime the way SQLAlchemy stores DateTime columns in SQLite, liatris_db.format_datetime
+def format_datetime(value):
+    return value.isoformat(" ", "microseconds")
+
+
+def get_day_start(days):
+    return format_datetime(datetime.combine(date.today() + timedelta(days=days), time()))
+
+
+def parse_datetime(value):
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+def get_upcoming_threshold(connection):
+    setting = connection.execute("SELECT Value FROM LiatrisSettings WHERE Key = 'UPCOMINGTHRESHOLD'").fetchone()
+    if setting is None or setting[0] is None or not setting[0].isdigit():
+        return DEFAULT_UPCOMING_THRESHOLD
+    return int(setting[0])
+
+
+# Lists the items of the rows as the records of liatris_commands.get_item_records, grouped by their task in the order
+# in which the tasks first appear and sorted by liatris_commands.deadline_order within
+def get_item_records(rows):
+    task_items = {}
+    for task_id, task_name, item_id, item_is_done, item_title, item_date, item_done_date in rows:
+        task_items.setdefault(task_id, []).append({
+            "TaskId": task_id, "TaskName": task_name, "ItemId": item_id, "ItemIsDone": item_is_done == 1,
+            "ItemTitle": item_title, "ItemDate": parse_datetime(item_date),
+            "ItemDoneDate": parse_datetime(item_done_date)})
+    records = []
+    for items in task_items.values():
+        items.sort(key=lambda record: (record["ItemDate"] is None, record["ItemDate"] or datetime.min,
+                                       record["ItemId"]))
+        for record in items:
+            for key in ("ItemDate", "ItemDoneDate"):
+                if record[key] is not None:
+                    record[key] = record[key].isoformat()
+            records.append(record)
+    return records
+
+
+# (TaskId, TaskName, DoneItems, TotalItems) of every project, archived items counted as done
+def get_task_counters(connection):
+    archived_counts = dict(connection.execute(ARCHIVED_COUNTS).fetchall())
+    return [(task_id, task_name, (done_items or 0) + archived_counts.get(task_id, 0),
+             total_items + archived_counts.get(task_id, 0))
+            for task_id, task_name, done_items, total_items in connection.execute(TASK_COUNTERS)]
+
+
+# Commands, see liatris_commands
+
+def list_command(connection, params):
+    if params.get("project") is not None:
+        return None
+    return [{"TaskId": task_id, "TaskName": task_name, "DoneItems": done_items, "TotalItems": total_items}
+            for task_id, task_name, done_items, total_items in get_task_counters(connection) if task_name is not None]
+
+
+def today_command(connection, params):
+    return get_item_records(connection.execute(TASK_ITEM_ROWS + TODAY_CONDITION, (get_day_start(1),)))
+
+
+def upcoming_command(connection, params):
+    days = params.get("days")
+    if days is None:
+        days = get_upcoming_threshold(connection)
+    return get_item_records(connection.execute(TASK_ITEM_ROWS + UPCOMING_CONDITION,
+                                               (get_day_start(1), get_day_start(int(days)))))
+
+
+def stats_command(connection, params):
+    archived = sum(count for task_id, count in connection.execute(ARCHIVED_COUNTS))
+    counters = [(done_items or 0, total_items) for task_id, task_name, done_items, total_items
+                in connection.execute(TASK_COUNTERS) if task_name is not None]
+    project_count = len(counters)
+    done_items = sum(done for done, total in counters) + archived
+    total_items = sum(total for done, total in counters) + archived
+    today_count = connection.execute(COUNT_ITEMS + TODAY_CONDITION, (get_day_start(1),)).fetchone()[0]
+    upcoming_count = connection.execute(COUNT_ITEMS + UPCOMING_CONDITION, (
+        get_day_start(1), get_day_start(get_upcoming_threshold(connection)))).fetchone()[0]
+    return {"Projects": project_count, "Tasks": total_items, "Done": done_items, "Open": total_items - done_items,
+            "Today": today_count, "Upcoming": upcoming_count}
+
+
+COMMANDS = {"list": list_command, "today": today_command, "upcoming": upcoming_command, "stats": stats_command}
+
+
+# Runs a command and returns its result, None if it has to run through liatris_commands
+def run_command(command, params, db_file=liatris_paths.DB_FILE, archive_file=liatris_paths.ARCHIVE_FILE):
+    if command not in COMMANDS:
+        return None
+    try:
+        connection = connect(db_file, archive_file)
+        if connection is None:
+            return None
+        try:
+            return COMMANDS[command](connection, params)
+        finally:
+            connection.close()
+    except sqlite3.Error:
+        # A database of an older version that lacks a column, or one that is being upgraded
+        return None
@@ -0,0 +1,359 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+from datetime import date, datetime, timedelta
+
+import liatris_db
+from models.liatris_model_tasks import LiatrisTask
+from models.liatris_model_items import LiatrisItem
+
+
+# Events of the store and the arguments their callbacks receive
+TASK_ADDED = "task-added"  # task
+TASK_RENAMED = "task-renamed"  # task
+TASK_DELETED = "task-deleted"  # task_id
+ITEM_ADDED = "item-added"  # item
+ITEM_CHANGED = "item-changed"  # item, previous TaskId
+ITEM_TOGGLED = "item-toggled"  # item
+ITEM_DELETED = "item-deleted"  # item_id, task_id
+ITEMS_CHANGED = "items-changed"  # ItemIds of items changed or deleted by one bulk operation
+COUNTERS_CHANGED = "counters-changed"  # task_id, done, total
+BADGES_CHANGED = "badges-changed"  # today count, upcoming count
+
+
+# Returns the day of a deadline, deadlines may be dates or datetimes
+def get_deadline_day(item_date):
+    if isinstance(item_date, datetime):
+        return item_date.date()
+    return item_date
+
+
+# Holds the tasks and the state of all items in memory. Changes are written through LiatrisSQLCore and then announced
+# as fine-grained events, so views can update the affected rows and counters instead of reloading everything.
+class LiatrisStore:
+    def __init__(self, upcoming_threshold=7):
+        # TaskId -> task
+        self.tasks = {}
+        # TaskId -> [done, total]
+        self.counters = {}
+        # ItemId -> (TaskId, ItemIsDone, deadline day), archived items are only counted
+        self.items = {}
+        self.upcoming_threshold = int(upcoming_threshold)
+        self.today = date.today()
+        self.today_count = 0
+        self.upcoming_count = 0
+        self.subscribers = {}
+        # Until the first load the store only writes through, it holds nothing and announces changes without counters
+        self.loaded = False
+
+    # Registers a callback for an event
+    def subscribe(self, event, callback):
+        self.subscribers.setdefault(event, []).append(callback)
+
+    def emit(self, event, *args):
+        for callback in self.subscribers.get(event, []):
+            callback(*args)
+
+    # Loads all tasks and item states from the database, objects loaded before are read again
+    def load(self):
+        liatris_db.LiatrisSQLCore.invalidate()
+        tasks = liatris_db.LiatrisSQLCore.Tasks.get_all_tasks()
+        item_states = liatris_db.LiatrisSQLCore.Items.get_item_states()
+        archived_counts = liatris_db.LiatrisSQLCore.Archive.count_archived_items()
+        if tasks is False or item_states is False or archived_counts is False:
+            return False
+
+        self.tasks = {}
+        self.counters = {}
+        for task in tasks:
+            if task.TaskName is not None and task.TaskId is not None:
+                self.tasks[task.TaskId] = task
+                self.counters[task.TaskId] = [0, 0]
+
+        self.items = {}
+        for item_id, task_id, item_is_done, item_date in item_states:
+            self.items[item_id] = (task_id, item_is_done is True, get_deadline_day(item_date))
+            if task_id in self.counters:
+                self.counters[task_id][1] += 1
+                if item_is_done is True:
+                    self.counters[task_id][0] += 1
+        for task_id, count in archived_counts:
+            if task_id in self.counters:
+                self.counters[task_id][0] += count
+                self.counters[task_id][1] += count
+
+        self.loaded = True
+        self.count_badges()
+        return True
+
+    def get_tasks(self):
+        return list(self.tasks.values())
+
+    def get_counters(self, task_id):
+        return self.counters.get(task_id, [0, 0])
+
+    # Badges
+
+    def is_today(self, item_state):
+        task_id, item_is_done, deadline_day = item_state
+        return task_id in self.tasks and not item_is_done and deadline_day is not None and deadline_day <= self.today
+
+    def is_upcoming(self, item_state):
+        task_id, item_is_done, deadline_day = item_state
+        return (task_id in self.tasks and not item_is_done and deadline_day is not None and
+                self.today < deadline_day < self.today + timedelta(days=self.upcoming_threshold))
+
+    def count_badges(self):
+        self.today = date.today()
+        self.today_count = len(list(filter(self.is_today, self.items.values())))
+        self.upcoming_count = len(list(filter(self.is_upcoming, self.items.values())))
+        self.emit(BADGES_CHANGED, self.today_count, self.upcoming_count)
+
+    # Returns the Today and Upcoming counts, they are counted again once a day has passed
+    def get_badges(self):
+        if self.today != date.today():
+            self.count_badges()
+        return self.today_count, self.upcoming_count
+
+    def set_upcoming_threshold(self, upcoming_threshold):
+        self.upcoming_threshold = int(upcoming_threshold)
+        self.count_badges()
+
+    # Archived items are counted as done but their states are not held. Changing one restores it, so its state is read
+    # before the change and is replaced like any other, this does not change any counter.
+    def load_archived_item_states(self, item_ids):
+        archived_ids = [item_id for item_id in item_ids if item_id not in self.items]
+        if len(archived_ids) == 0:
+            return
+        item_states = liatris_db.LiatrisSQLCore.Archive.get_archived_item_states(archived_ids)
+        if item_states is False:
+            return
+        for item_id, task_id, item_date in item_states:
+            self.items[item_id] = (task_id, True, get_deadline_day(item_date))
+
+    # Applies the change of an item state to the counters and badges
+    def change_item_state(self, item_id, new_state):
+        self.change_item_states({item_id: new_state})
+
+    # Applies the changes of many item states, given as an ItemId -> new state dictionary, and announces every changed
+    # counter once. A new state of None removes the item.
+    def change_item_states(self, new_states):
+        changed_task_ids = []
+        for item_id, new_state in new_states.items():
+            old_state = self.items.pop(item_id, None)
+            if new_state is not None:
+                self.items[item_id] = new_state
+
+            for state, sign in ((old_state, -1), (new_state, 1)):
+                if state is None:
+                    continue
+                task_id, item_is_done, deadline_day = state
+                if task_id in self.counters:
+                    self.counters[task_id][1] += sign
+                    if item_is_done:
+                        self.counters[task_id][0] += sign
+                    if task_id not in changed_task_ids:
+                        changed_task_ids.append(task_id)
+                if self.is_today(state):
+                    self.today_count += sign
+                if self.is_upcoming(state):
+                    self.upcoming_count += sign
+
+        for task_id in changed_task_ids:
+            done, total = self.counters[task_id]
+            self.emit(COUNTERS_CHANGED, task_id, done, total)
+        self.emit(BADGES_CHANGED, self.today_count, self.upcoming_count)
+
+    # Tasks
+
+    def add_task(self, task_name):
+        task = LiatrisTask()
+        task.TaskName = task_name
+        if not liatris_db.LiatrisSQLCore.insert(task):
+            return False
+
+        self.tasks[task.TaskId] = task
+        self.counters[task.TaskId] = [0, 0]
+        self.emit(TASK_ADDED, task)
+        return task
+
+    def rename_task(self, task):
+        if not liatris_db.LiatrisSQLCore.Tasks.update_task(task):
+            return False
+
+        self.tasks[task.TaskId] = task
+        self.emit(TASK_RENAMED, task)
+        return True
+
+    def delete_task(self, task_id):
+        if not liatris_db.LiatrisSQLCore.Tasks.delete_task(task_id):
+            return False
+
+        self.forget_task(task_id)
+        self.count_badges()
+        return True
+
+    # Drops a deleted task and the states of its items
+    def forget_task(self, task_id):
+        self.tasks.pop(task_id, None)
+        self.counters.pop(task_id, None)
+        for item_id in [item_id for item_id, state in self.items.items() if state[0] == task_id]:
+            del self.items[item_id]
+        self.emit(TASK_DELETED, task_id)
+
+    # Items
+
+    def add_item(self, task_id, item_title, item_date=None):
+        item = LiatrisItem()
+        item.TaskId = task_id
+        item.ItemIsDone = False
+        item.ItemTitle = item_title
+        item.ItemDate = item_date
+        if not liatris_db.LiatrisSQLCore.insert(item):
+            return False
+
+        self.emit(ITEM_ADDED, item)
+        self.change_item_state(item.ItemId, (task_id, False, get_deadline_day(item_date)))
+        return item
+
+    # Writes a changed item, this covers marking it as done, renaming, moving and changing the deadline
+    def update_item(self, item):
+        self.load_archived_item_states([item.ItemId])
+        if not liatris_db.LiatrisSQLCore.Items.update_item(item):
+            return False
+
+        old_state = self.items.get(item.ItemId)
+        new_state = (item.TaskId, item.ItemIsDone is True, get_deadline_day(item.ItemDate))
+        if old_state is not None and old_state[1] != new_state[1]:
+            self.emit(ITEM_TOGGLED, item)
+        else:
+            self.emit(ITEM_CHANGED, item, None if old_state is None else old_state[0])
+
+        if old_state != new_state:
+            self.change_item_state(item.ItemId, new_state)
+        return True
+
+    def delete_item(self, item_id):
+        self.load_archived_item_states([item_id])
+        if not liatris_db.LiatrisSQLCore.Items.delete_item(item_id):
+            return False
+
+        old_state = self.items.get(item_id)
+        self.emit(ITEM_DELETED, item_id, None if old_state is None else old_state[0])
+        self.change_item_state(item_id, None)
+        return True
+
+    # Bulk operations, each one is written in one transaction
+
+    # Adds an item for every title to the task with the given id
+    def add_items(self, task_id, item_titles, item_date=None):
+        items = []
+        for item_title in item_titles:
+            item = LiatrisItem()
+            item.TaskId = task_id
+            item.ItemIsDone = False
+            item.ItemTitle = item_title
+            item.ItemDate = item_date
+            items.append(item)
+        if not liatris_db.LiatrisSQLCore.insert_many(items):
+            return False
+
+        new_states = {}
+        for item in items:
+            self.emit(ITEM_ADDED, item)
+            new_states[item.ItemId] = (task_id, False, get_deadline_day(item_date))
+        self.change_item_states(new_states)
+        return items
+
+    # Replaces one field of the states of the items, 0 is the TaskId, 1 the done state and 2 the deadline day
+    def replace_item_states(self, item_ids, field, value):
+        new_states = {}
+        for item_id in item_ids:
+            if item_id in self.items:
+                state = list(self.items[item_id])
+                state[field] = value
+                new_states[item_id] = tuple(state)
+        self.emit(ITEMS_CHANGED, list(item_ids))
+        self.change_item_states(new_states)
+
+    def mark_items(self, item_ids, item_is_done):
+        self.load_archived_item_states(item_ids)
+        if not liatris_db.LiatrisSQLCore.Items.mark_items(item_ids, item_is_done):
+            return False
+        self.replace_item_states(item_ids, 1, item_is_done is True)
+        return True
+
+    def move_items(self, item_ids, task_id):
+        self.load_archived_item_states(item_ids)
+        if not liatris_db.LiatrisSQLCore.Items.move_items(item_ids, task_id):
+            return False
+        self.replace_item_states(item_ids, 0, task_id)
+        return True
+
+    def set_items_date(self, item_ids, item_date):
+        self.load_archived_item_states(item_ids)
+        if not liatris_db.LiatrisSQLCore.Items.set_items_date(item_ids, item_date):
+            return False
+        self.replace_item_states(item_ids, 2, get_deadline_day(item_date))
+        return True
+
+    def delete_items(self, item_ids):
+        self.load_archived_item_states(item_ids)
+        if not liatris_db.LiatrisSQLCore.Items.delete_items(item_ids):
+            return False
+        self.emit(ITEMS_CHANGED, list(item_ids))
+        self.change_item_states({item_id: None for item_id in item_ids})
+        return True
+
+    # Changes written by other connections, see liatris_changes
+
+    # Reads the tasks and item states of a LiatrisChangeSet again and announces how they differ from the ones held.
+    # Changes that were written through this store are held already and announce nothing. Returns False if the rows
+    # could not be read.
+    def apply_changes(self, change_set):
+        if change_set.reload:
+            return self.load()
+        # Loaded objects of the changed rows leave the session, the next query reads them again. Views keep the
+        # objects they show as they were.
+        liatris_db.LiatrisSQLCore.expunge_items(change_set.item_ids | change_set.note_item_ids)
+        liatris_db.LiatrisSQLCore.expunge_loaded(LiatrisTask, lambda state: state.get("TaskId") in change_set.task_ids)
+
+        if len(change_set.task_ids) != 0:
+            tasks = liatris_db.LiatrisSQLCore.Tasks.get_tasks_by_ids(change_set.task_ids)
+            if tasks is False:
+                return False
+            tasks = {task.TaskId: task for task in tasks if task.TaskName is not None}
+            for task_id in change_set.task_ids:
+                task = tasks.get(task_id)
+                if task is None:
+                    if task_id in self.tasks:
+                        self.forget_task(task_id)
+                        self.count_badges()
+                elif task_id not in self.tasks:
+                    self.tasks[task_id] = task
+                    self.counters[task_id] = [0, 0]
+                    self.emit(TASK_ADDED, task)
+                elif self.tasks[task_id].TaskName != task.TaskName:
+                    self.tasks[task_id] = task
+                    self.emit(TASK_RENAMED, task)
+
+        if len(change_set.item_ids) != 0:
+            item_states = liatris_db.LiatrisSQLCore.Items.get_item_states(change_set.item_ids)
+            if item_states is False:
+                return False
+            fresh_states = {item_id: (task_id, item_is_done is True, get_deadline_day(item_date))
+                            for item_id, task_id, item_is_done, item_date in item_states}
+            # Items that are gone may have been archived, these are counted as done
+            missing_ids = [item_id for item_id in change_set.item_ids if item_id not in fresh_states]
+            archived_states = liatris_db.LiatrisSQLCore.Archive.get_archived_item_states(missing_ids)
+            if archived_states is False:
+                return False
+            for item_id, task_id, item_date in archived_states:
+                fresh_states[item_id] = (task_id, True, get_deadline_day(item_date))
+
+            new_states = {item_id: fresh_states.get(item_id) for item_id in change_set.item_ids
+                          if self.items.get(item_id) != fresh_states.get(item_id)}
+            if len(new_states) != 0:
+                self.emit(ITEMS_CHANGED, list(new_states))
+                self.change_item_states(new_states)
+        return True
@@ -0,0 +1,173 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import argparse
+import csv
+import json
+import sys
+import time
+from datetime import datetime
+
+import liatris_db
+
+FORMATS = ["jsonl", "csv"]
+
+# Columns of CSV files, every row holds one record and leaves the columns of the other types empty
+CSV_FIELDS = ["Type", "TaskId", "TaskName", "ItemId", "ItemIsDone", "ItemTitle", "ItemDate", "ItemDoneDate",
+              "NoteContent"]
+ID_FIELDS = ["TaskId", "ItemId"]
+DATE_FIELDS = ["ItemDate", "ItemDoneDate"]
+
+
+# Guesses the format of a file from its extension, JSON Lines is the default
+def get_format(file_name):
+    if file_name.lower().endswith(".csv"):
+        return "csv"
+    return "jsonl"
+
+
+# Converts a record of the database to values that can be written to a file
+def encode_record(record):
+    encoded_record = dict(record)
+    for key in DATE_FIELDS:
+        if encoded_record.get(key) is not None:
+            encoded_record[key] = encoded_record[key].isoformat()
+    return encoded_record
+
+
+# Converts the values of a record read from a file back to the types of the database
+def decode_record(record, from_csv=False):
+    decoded_record = {}
+    for key, value in record.items():
+        if from_csv and value == "" and key != "Type":
+            continue
+        if key in ID_FIELDS and value is not None:
+            value = int(value)
+        elif key in DATE_FIELDS and value is not None:
+            value = datetime.fromisoformat(value)
+        elif key == "ItemIsDone" and from_csv:
+            value = value.lower() in ("1", "true")
+        decoded_record[key] = value
+    return decoded_record
+
+
+def write_jsonl(records, file):
+    for record in records:
+        file.write(json.dumps(encode_record(record), ensure_ascii=False) + "\n")
+
+
+def write_csv(records, file):
+    writer = csv.DictWriter(file, fieldnames=CSV_FIELDS)
+    writer.writeheader()
+    for record in records:
+        record = encode_record(record)
+        if "ItemIsDone" in record:
+            record["ItemIsDone"] = 1 if record["ItemIsDone"] else 0
+        writer.writerow(record)
+
+
+def read_jsonl(file):
+    for line_number, line in enumerate(file, 1):
+        if line.strip() == "":
+            continue
+        try:
+            yield decode_record(json.loads(line))
+        except (ValueError, TypeError) as error:
+            raise ValueError("Line " + str(line_number) + ": " + str(error))
+
+
+def read_csv(file):
+    reader = csv.DictReader(file)
+    for record in reader:
+        try:
+            yield decode_record(record, from_csv=True)
+        except (ValueError, TypeError) as error:
+            raise ValueError("Line " + str(reader.line_num) + ": " + str(error))
+
+
+# Calls progress with the running count after every batch of records passed through
+def count_records(records, progress, batch_size=liatris_db.TRANSFER_BATCH_SIZE):
+    count = 0
+    for record in records:
+        yield record
+        count += 1
+        if count % batch_size == 0:
+            progress(count)
+    progress(count)
+
+
+def open_file(file_name, mode):
+    if file_name == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    return open(file_name, mode, encoding="utf-8", newline="")
+
+
+def export_records(file_name, file_format, progress=None):
+    records = liatris_db.LiatrisSQLCore.Transfer.export_records()
+    if progress is not None:
+        records = count_records(records, progress)
+
+    file = open_file(file_name, "w")
+    try:
+        if file_format == "csv":
+            write_csv(records, file)
+        else:
+            write_jsonl(records, file)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+# Returns the number of imported records or False if the database refused them
+def import_records(file_name, file_format, progress=None):
+    file = open_file(file_name, "r")
+    try:
+        if file_format == "csv":
+            records = read_csv(file)
+        else:
+            records = read_jsonl(file)
+        return liatris_db.LiatrisSQLCore.Transfer.import_records(records, progress=progress)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Imports and exports the projects, tasks and notes of Liatris.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("file", help="file to read or write, - for standard input or output")
+    parser.add_argument("--format", choices=FORMATS, help="defaults to csv for .csv files and to jsonl otherwise")
+    parser.add_argument("--quiet", action="store_true", help="do not report progress")
+    args = parser.parse_args()
+
+    file_format = args.format if args.format is not None else get_format(args.file)
+    verb = "Imported" if args.command == "import" else "Exported"
+    start = time.perf_counter()
+
+    def progress(count):
+        if not args.quiet:
+            sys.stderr.write("\r" + verb + " " + str(count) + " records")
+            sys.stderr.flush()
+
+    try:
+        if args.command == "import":
+            count = import_records(args.file, file_format, progress)
+        else:
+            count = export_records(args.file, file_format, progress)
+    except (OSError, ValueError) as error:
+        sys.stderr.write("\nError: " + str(error) + "\n")
+        return 1
+    except KeyError as error:
+        sys.stderr.write("\nError: a record is missing the field " + str(error) + "\n")
+        return 1
+
+    if count is False:
+        sys.stderr.write("\nError: the database rejected the records, nothing was imported\n")
+        return 1
+    if not args.quiet:
+        sys.stderr.write(" in " + "{:.2f}".format(time.perf_counter() - start) + " seconds\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
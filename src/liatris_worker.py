@@ -0,0 +1,71 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import liatris_db
+import liatris_profile
+
+
+# Runs LiatrisSQLCore calls on worker threads and hands their results to a callback through a dispatch function. The
+# GUI passes GLib.idle_add, so callbacks run on the GTK main loop. Every worker thread uses its own session of the
+# scoped liatris_db.__SESSION__, which is closed after each call, the returned objects are detached but loaded.
+class LiatrisDbWorker:
+    def __init__(self, dispatch, max_workers=2):
+        self.dispatch = dispatch
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="LiatrisDbWorker")
+        # Number of the latest request per channel, results of older requests on the same channel are dropped
+        self.generations = {}
+        self.lock = threading.Lock()
+
+    # Runs function(*args) on a worker thread and calls callback(result) through the dispatch function. If the call
+    # raises, the error and its traceback go to stderr and the callback receives False like the LiatrisSQLCore
+    # functions do on errors. The statements of both count for the profiled actions that submitted the call.
+    def submit(self, function, args=(), callback=None, channel=None):
+        generation = self.cancel(channel)
+        actions = liatris_profile.get_current_actions()
+        future = self.executor.submit(liatris_profile.run_in_actions, actions, self.run, function, args)
+        future.add_done_callback(lambda done: self.deliver(done, function, callback, channel, generation, actions))
+
+    # Drops the results of all outstanding requests of a channel and returns the new request number
+    def cancel(self, channel):
+        with self.lock:
+            generation = self.generations.get(channel, 0) + 1
+            self.generations[channel] = generation
+        return generation
+
+    def is_current(self, channel, generation):
+        return channel is None or self.generations.get(channel) == generation
+
+    def run(self, function, args):
+        try:
+            return function(*args)
+        finally:
+            liatris_db.__SESSION__.remove()
+
+    def deliver(self, future, function, callback, channel, generation, actions):
+        if future.cancelled():
+            return
+        exception = future.exception()
+        # Errors are reported even if nobody waits for the result anymore
+        if exception is not None:
+            sys.stderr.write("Error: " + getattr(function, "__qualname__", str(function)) + " failed\n")
+            traceback.print_exception(type(exception), exception, exception.__traceback__, file=sys.stderr)
+        if callback is None or not self.is_current(channel, generation):
+            return
+        result = False
+        if exception is None:
+            result = future.result()
+        self.dispatch(self.run_callback, callback, channel, generation, result, actions)
+
+    def run_callback(self, callback, channel, generation, result, actions):
+        # A newer request may have been submitted while this result waited for the main loop
+        if self.is_current(channel, generation):
+            liatris_profile.run_in_actions(actions, callback, result)
+        return False
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
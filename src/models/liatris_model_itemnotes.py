@@ -3,6 +3,7 @@
 
 import sqlalchemy as db
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import deferred
 
 BASE = declarative_base()
 
@@ -12,4 +13,5 @@ class LiatrisItemNote(BASE):
 
     NoteId = db.Column("NoteId", db.Integer, primary_key=True)
     ItemId = db.Column("ItemId", db.Integer, unique=True)
-    NoteContent = db.Column("NoteContent", db.Text)
+    # Note contents are only loaded when they are accessed
+    NoteContent = deferred(db.Column("NoteContent", db.Text))
@@ -1,12 +1,23 @@
 # SPDX-FileCopyrightText: Copyright © 2023 nixcapra
 # SPDX-License-Identifier: MIT
 
+from datetime import date, datetime, time
+
 import sqlalchemy as db
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import validates
 
 BASE = declarative_base()
 
 
+# Deadlines are picked as days but stored as datetimes, a day becomes midnight of that day. Loaded items always hold
+# datetimes, which the views compare and format.
+def normalize_item_date(item_date):
+    if isinstance(item_date, date) and not isinstance(item_date, datetime):
+        return datetime.combine(item_date, time())
+    return item_date
+
+
 class LiatrisItem(BASE):
     __tablename__ = "LiatrisItems"
 
@@ -15,3 +26,8 @@ class LiatrisItem(BASE):
     ItemIsDone = db.Column("ItemIsDone", db.Boolean)
     ItemTitle = db.Column("ItemTitle", db.String)
     ItemDate = db.Column("ItemDate", db.DateTime)
+    ItemDoneDate = db.Column("ItemDoneDate", db.DateTime)
+
+    @validates("ItemDate", "ItemDoneDate")
+    def validate_date(self, key, value):
+        return normalize_item_date(value)
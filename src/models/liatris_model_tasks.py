@@ -7,8 +7,20 @@ from sqlalchemy.ext.declarative import declarative_base
 BASE = declarative_base()
 
 
+# The lowercased task name, stored next to the name so that searches can use an index
+def normalize_task_name(task_name):
+    if task_name is None:
+        return None
+    return str(task_name).lower()
+
+
+def task_name_key_default(context):
+    return normalize_task_name(context.get_current_parameters().get("TaskName"))
+
+
 class LiatrisTask(BASE):
     __tablename__ = "LiatrisTasks"
 
     TaskId = db.Column("TaskId", db.Integer, primary_key=True)
     TaskName = db.Column("TaskName", db.String)
+    TaskNameKey = db.Column("TaskNameKey", db.String, default=task_name_key_default)
@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# liatris_paths reads this on import, so the tests never touch the databases in the home directory. Every test gets a
+# directory of its own through the database_dir fixture.
+os.environ["LIATRIS_DB_DIR"] = tempfile.mkdtemp(prefix="liatris-tests-")
+os.environ.pop("LIATRIS_STORAGE_PROFILE", None)
+
+import liatris_db  # noqa: E402
+from liatris_db import LiatrisSQLCore  # noqa: E402
+
+
+# Points liatris_db at an empty directory, the engine is created on first use like in the app
+@pytest.fixture
+def database_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(liatris_db, "DB_DIR", str(tmp_path))
+    monkeypatch.setattr(liatris_db, "DB_FILE", str(tmp_path / "liatrisdb"))
+    monkeypatch.setattr(liatris_db, "ARCHIVE_FILE", str(tmp_path / "liatrisarchive"))
+    monkeypatch.setattr(liatris_db, "ENGINE", None)
+    monkeypatch.setattr(liatris_db, "SEARCH_ENABLED", False)
+    monkeypatch.setattr(LiatrisSQLCore.Settings, "CACHE", None)
+    yield tmp_path
+    liatris_db.__SESSION__.remove()
+    if liatris_db.ENGINE is not None:
+        liatris_db.ENGINE.dispose()
+
+
+@pytest.fixture
+def engine(database_dir):
+    return liatris_db.get_engine()
+
+
+# Collects the (statement, parameters) pairs sent to the database, clear it before the calls of interest
+@pytest.fixture
+def statements(engine):
+    executed = []
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters[0] if executemany and len(parameters) != 0 else parameters))
+
+    liatris_db.db.event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    liatris_db.db.event.remove(engine, "before_cursor_execute", record)
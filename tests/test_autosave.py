@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import json
+import os
+
+import liatris_autosave
+import liatris_bench
+from liatris_db import LiatrisSQLCore
+
+
+def read_journal(journal_file):
+    with open(journal_file, "r", encoding="utf-8") as journal:
+        return [json.loads(line) for line in journal]
+
+
+# Typing only stages edits, the journal is synced once per write_journal() and flushes to the database do not sync it
+def test_journal_is_synced_once_per_write(engine, database_dir, monkeypatch):
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(1, 2, note_ratio=0)) is not False
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: (synced.append(fd), fsync(fd)))
+    journal_file = str(database_dir / "liatrisnotes.journal")
+    autosave = liatris_autosave.LiatrisNoteAutosave(journal_file)
+
+    note = ""
+    for character in "Buy oat milk":
+        note += character
+        autosave.stage(1, note)
+    autosave.stage(2, "Call first")
+    assert synced == []
+    assert not os.path.exists(journal_file)
+
+    # The journal and the directory of its new name
+    autosave.write_journal()
+    assert len(synced) == 2
+    assert read_journal(journal_file) == [{"ItemId": 1, "NoteContent": "Buy oat milk"},
+                                          {"ItemId": 2, "NoteContent": "Call first"}]
+    assert not os.path.exists(journal_file + ".tmp")
+    autosave.write_journal()
+    assert len(synced) == 2
+
+    autosave.stage(2, "Call first thing")
+    assert autosave.flush()
+    assert len(synced) == 2
+    assert not os.path.exists(journal_file)
+    assert LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(2).NoteContent == "Call first thing"
+
+    # A failed flush keeps the edit in the journal
+    monkeypatch.setattr(LiatrisSQLCore.ItemNotes, "update_item_notes", lambda notes: False)
+    autosave.stage(1, "Buy soy milk")
+    assert not autosave.flush()
+    assert len(synced) == 4
+    assert read_journal(journal_file) == [{"ItemId": 1, "NoteContent": "Buy soy milk"}]
+
+
+def test_recover_writes_the_journal_of_a_crashed_session(engine, database_dir):
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(1, 2, note_ratio=0)) is not False
+    journal_file = str(database_dir / "liatrisnotes.journal")
+    crashed_autosave = liatris_autosave.LiatrisNoteAutosave(journal_file)
+    crashed_autosave.stage(1, "Written before the crash")
+    crashed_autosave.write_journal()
+
+    autosave = liatris_autosave.LiatrisNoteAutosave(journal_file)
+    assert autosave.recover()
+    assert not autosave.has_pending()
+    assert not os.path.exists(journal_file)
+    assert LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(1).NoteContent == "Written before the crash"
+    assert LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(2) is False
+
+
+def test_recover_reads_appended_journals(engine, database_dir):
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(1, 1, note_ratio=0)) is not False
+    journal_file = str(database_dir / "liatrisnotes.journal")
+    with open(journal_file, "w", encoding="utf-8") as journal:
+        journal.write('{"ItemId": 1, "NoteContent": "Fir"}\n{"ItemId": 1, "NoteContent": "First"}\n{"ItemId": 1, "No')
+
+    assert liatris_autosave.LiatrisNoteAutosave(journal_file).recover()
+    assert LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(1).NoteContent == "First"
@@ -0,0 +1,110 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import sqlite3
+
+import liatris_bench
+import liatris_db
+import liatris_store
+from liatris_changes import LiatrisChangeMonitor
+from liatris_db import LiatrisSQLCore
+
+# Schema of the versions with foreign keys but without AUTOINCREMENT on LiatrisItems, which is added by recreating the
+# table
+FOREIGN_KEY_SCHEMA = [
+    'CREATE TABLE "LiatrisSettings" ("Key" VARCHAR NOT NULL, "Value" VARCHAR, PRIMARY KEY ("Key"))',
+    'CREATE TABLE "LiatrisTasks" ("TaskId" INTEGER NOT NULL, "TaskName" VARCHAR, "TaskNameKey" VARCHAR, '
+    'PRIMARY KEY ("TaskId"))',
+    'CREATE INDEX "LiatrisTasksNameKeyIndex" ON "LiatrisTasks" ("TaskNameKey")',
+    'CREATE TABLE "LiatrisItems" ("ItemId" INTEGER NOT NULL, "TaskId" INTEGER, "ItemIsDone" BOOLEAN, '
+    '"ItemTitle" VARCHAR, "ItemDate" DATETIME, "ItemDoneDate" DATETIME, PRIMARY KEY ("ItemId"), '
+    'FOREIGN KEY("TaskId") REFERENCES "LiatrisTasks" ("TaskId") ON DELETE CASCADE)',
+    'CREATE INDEX "LiatrisItemsTaskIdIndex" ON "LiatrisItems" ("TaskId")',
+    'CREATE INDEX "LiatrisItemsDoneDateIndex" ON "LiatrisItems" ("ItemIsDone", "ItemDate")',
+    'CREATE INDEX "LiatrisItemsLogbookIndex" ON "LiatrisItems" ("ItemIsDone", "ItemDoneDate")',
+    'CREATE TABLE "LiatrisItemNotes" ("NoteId" INTEGER NOT NULL, "ItemId" INTEGER, "NoteContent" TEXT, '
+    'PRIMARY KEY ("NoteId"), UNIQUE ("ItemId"), '
+    'FOREIGN KEY("ItemId") REFERENCES "LiatrisItems" ("ItemId") ON DELETE CASCADE)',
+    "PRAGMA user_version = 1",
+    "INSERT INTO LiatrisTasks VALUES (1, 'Groceries', 'groceries')",
+    "INSERT INTO LiatrisItems VALUES (1, 1, 0, 'Buy milk', NULL, NULL)",
+    "INSERT INTO LiatrisItems VALUES (2, 1, 0, 'Buy bread', NULL, NULL)",
+    "INSERT INTO LiatrisItemNotes VALUES (1, 1, 'Oat milk')"
+]
+
+
+def get_trigger_names(connection):
+    return {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+
+# Writes another process commits are reported from the first start of a database that had its tables recreated
+def test_changes_are_detected_after_the_upgrade(database_dir):
+    connection = sqlite3.connect(liatris_db.DB_FILE)
+    for statement in FOREIGN_KEY_SCHEMA:
+        connection.execute(statement)
+    connection.commit()
+    connection.close()
+
+    monitor = LiatrisChangeMonitor()
+    monitor.start()
+    try:
+        assert "AUTOINCREMENT" in monitor.connection.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'LiatrisItems'").fetchone()[0]
+        assert set(liatris_db.CHANGE_INSERT_TRIGGERS) | {"LiatrisChangesItemsUpdate", "LiatrisChangesItemsDelete"} \
+            <= get_trigger_names(monitor.connection)
+
+        connection = sqlite3.connect(liatris_db.DB_FILE)
+        try:
+            connection.execute("UPDATE LiatrisItems SET ItemIsDone = 1 WHERE ItemId = 2")
+            connection.execute("UPDATE LiatrisItemNotes SET NoteContent = 'Soy milk' WHERE ItemId = 1")
+            connection.commit()
+        finally:
+            connection.close()
+
+        change_set = monitor.poll()
+        assert change_set is not None
+        assert not change_set.reload
+        assert change_set.item_ids == {2}
+        assert change_set.note_item_ids == {1}
+    finally:
+        monitor.stop()
+
+
+# Writes through the store of this process are not reported back to it, writes of other processes still are
+def test_own_changes_are_not_read_again(engine, statements):
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(2, 20, note_ratio=0)) is not False
+    store = liatris_store.LiatrisStore()
+    assert store.load()
+    monitor = LiatrisChangeMonitor()
+    monitor.start()
+    try:
+        task = store.add_task("Added project")
+        assert task
+        item = store.add_item(task.TaskId, "Added item")
+        assert item
+        task.TaskName = "Renamed project"
+        assert store.rename_task(task)
+        assert store.mark_items([1, 2, 3], True)
+        assert store.move_items([4, 5], task.TaskId)
+        assert LiatrisSQLCore.ItemNotes.update_item_notes({item.ItemId: "Note"})
+        assert store.delete_item(6)
+
+        statements.clear()
+        change_set = monitor.poll()
+        assert change_set is None
+        assert statements == []
+
+        connection = sqlite3.connect(liatris_db.DB_FILE)
+        try:
+            connection.execute("UPDATE LiatrisItems SET ItemIsDone = 1 WHERE ItemId = 7")
+            connection.commit()
+        finally:
+            connection.close()
+        assert store.mark_items([8], True)
+
+        change_set = monitor.poll()
+        assert change_set is not None
+        assert change_set.item_ids == {7}
+        assert change_set.task_ids == set() and change_set.note_item_ids == set()
+    finally:
+        monitor.stop()
@@ -0,0 +1,60 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import os
+import subprocess
+import sys
+import time
+
+import liatris_bench
+import liatris_commands
+import liatris_db
+import liatris_reader
+import liatris_store
+from liatris_db import LiatrisSQLCore
+from models.liatris_model_settings import LiatrisSetting
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+# Time a read command of the command line may take from the start of the interpreter until it exits
+READ_COMMAND_SECONDS = 0.1
+
+
+def fill():
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(5, 300)) is not False
+    assert LiatrisSQLCore.Archive.archive_completed(30) is not False
+    setting = LiatrisSetting()
+    setting.Key = "UPCOMINGTHRESHOLD"
+    setting.Value = "10"
+    assert LiatrisSQLCore.insert(setting)
+
+
+# liatris_reader answers the read commands like liatris_commands does
+def test_reader_matches_the_commands(engine):
+    fill()
+    for command, params in [("list", {}), ("today", {}), ("upcoming", {}), ("upcoming", {"days": 3}), ("stats", {})]:
+        result = liatris_reader.run_command(command, params, liatris_db.DB_FILE, liatris_db.ARCHIVE_FILE)
+        assert result == liatris_commands.run_command(command, params, liatris_store.LiatrisStore()), command
+    assert liatris_reader.run_command("list", {"project": "1"}, liatris_db.DB_FILE, liatris_db.ARCHIVE_FILE) is None
+
+
+# New databases are created by liatris_db
+def test_reader_leaves_new_databases_to_the_commands(database_dir):
+    assert liatris_reader.run_command("stats", {}, liatris_db.DB_FILE, liatris_db.ARCHIVE_FILE) is None
+    assert not os.path.exists(liatris_db.DB_FILE)
+
+
+# The read commands never load SQLAlchemy and finish within READ_COMMAND_SECONDS
+def test_read_commands_start_quickly(engine, database_dir):
+    fill()
+    environment = dict(os.environ, LIATRIS_DB_DIR=str(database_dir))
+    code = "import sys, liatris_cli; sys.argv = ['liatris_cli.py'] + sys.argv[1:]; status = liatris_cli.main(); " \
+        "sys.exit(3 if 'sqlalchemy' in sys.modules else status)"
+    for command in ("list", "today", "upcoming", "stats"):
+        seconds = []
+        for _ in range(3):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, "-c", code, command], cwd=SRC_DIR, env=environment,
+                                     stdout=subprocess.PIPE)
+            seconds.append(time.perf_counter() - start)
+            assert process.returncode == 0, command
+        assert min(seconds) < READ_COMMAND_SECONDS, command
@@ -0,0 +1,43 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+from copy import copy
+from datetime import date, datetime, timedelta
+
+import liatris_bench
+from liatris_db import LiatrisSQLCore
+from models.liatris_model_items import LiatrisItem
+
+
+def get_today_item_ids():
+    return {item.ItemId for task_item in LiatrisSQLCore.SmartLists.produce_today() for item in task_item.ITEMS}
+
+
+# The deadline menu and the calendar pick days, loaded items have to hold datetimes afterwards
+def test_days_are_stored_as_datetimes(engine):
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(1, 3, deadline_ratio=0,
+                                                                                 done_ratio=0)) is not False
+    items = [LiatrisSQLCore.Items.get_item_by_id(item_id) for item_id in (1, 2, 3)]
+    today = date.today()
+
+    assert LiatrisSQLCore.Items.set_items_date([1], today)
+    assert LiatrisSQLCore.Items.get_item_by_id(1) is items[0]
+    assert items[0].ItemDate == datetime.combine(today, datetime.min.time())
+
+    item_to_edit = copy(items[1])
+    item_to_edit.ItemDate = today - timedelta(days=1)
+    assert LiatrisSQLCore.Items.update_item(item_to_edit)
+    assert isinstance(items[1].ItemDate, datetime)
+
+    new_item = LiatrisItem()
+    new_item.TaskId = 1
+    new_item.ItemIsDone = False
+    new_item.ItemTitle = "Added from the command line"
+    new_item.ItemDate = today
+    assert LiatrisSQLCore.insert(new_item)
+    assert isinstance(new_item.ItemDate, datetime)
+
+    assert get_today_item_ids() == {1, 2, new_item.ItemId}
+    assert LiatrisSQLCore.Items.set_items_date([1, 2], None)
+    assert items[0].ItemDate is None
+    assert get_today_item_ids() == {new_item.ItemId}
@@ -0,0 +1,198 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import sqlite3
+from datetime import datetime
+
+import liatris_bench
+import liatris_db
+from liatris_db import LiatrisSQLCore
+from models.liatris_model_items import LiatrisItem
+from models.liatris_model_settings import LiatrisSetting
+from models.liatris_model_tasks import LiatrisTask
+
+PROJECTS = 20
+ITEMS = 500
+
+
+def new_item(task_id, title):
+    item = LiatrisItem()
+    item.TaskId = task_id
+    item.ItemIsDone = False
+    item.ItemTitle = title
+    return item
+
+
+def new_setting(key, value):
+    setting = LiatrisSetting()
+    setting.Key = key
+    setting.Value = value
+    return setting
+
+
+def renamed_task(task_id):
+    task = LiatrisTask()
+    task.TaskId = task_id
+    task.TaskName = "Renamed project"
+    return task
+
+
+def changed_item(item_id):
+    item = LiatrisSQLCore.Items.get_item_by_id(item_id)
+    return liatris_db.LiatrisItemRow(item.ItemId, item.TaskId, not item.ItemIsDone, item.ItemTitle, item.ItemDate,
+                                     item.ItemDoneDate)
+
+
+def consume(records):
+    for _ in records:
+        pass
+
+
+# Name, call and the tables the call reads completely by design, every other table has to be read through an index.
+# Calls run in this order on the same database.
+CASES = [
+    # Every setting is read into the cache at once
+    ("Settings.load_cache", LiatrisSQLCore.Settings.load_cache, {"LiatrisSettings"}),
+    ("Settings.update_setting", lambda: LiatrisSQLCore.Settings.update_setting(new_setting("TEST", "2")), set()),
+    ("insert", lambda: LiatrisSQLCore.insert(new_item(1, "Inserted item")), set()),
+    ("insert_many", lambda: LiatrisSQLCore.insert_many([new_item(2, "Inserted item " + str(index))
+                                                        for index in range(3)]), set()),
+    # get_all_tasks, get_task_counters and produce_all_task_items list every project
+    ("Tasks.get_all_tasks", LiatrisSQLCore.Tasks.get_all_tasks, {"LiatrisTasks"}),
+    ("Tasks.get_tasks_by_ids", lambda: LiatrisSQLCore.Tasks.get_tasks_by_ids([1, 2, 3]), set()),
+    ("Tasks.get_task_counters", LiatrisSQLCore.Tasks.get_task_counters, {"LiatrisTasks"}),
+    ("Tasks.update_task", lambda: LiatrisSQLCore.Tasks.update_task(renamed_task(3)), set()),
+    ("Tasks.produce_all_task_items", LiatrisSQLCore.Tasks.produce_all_task_items, {"LiatrisTasks"}),
+    ("Tasks.produce_task_item_by_task_id", lambda: LiatrisSQLCore.Tasks.produce_task_item_by_task_id(4), set()),
+    ("Tasks.search_tasks prefix", lambda: LiatrisSQLCore.Tasks.search_tasks("project 1", 5), set()),
+    # Names that only contain the search key can not be found through an index
+    ("Tasks.search_tasks", lambda: LiatrisSQLCore.Tasks.search_tasks("ject"), {"LiatrisTasks"}),
+    ("Tasks.search_tasks empty", lambda: LiatrisSQLCore.Tasks.search_tasks("", 5), set()),
+    ("Tasks.search_task_items", lambda: LiatrisSQLCore.Tasks.search_task_items("call report"), set()),
+    # The fallback for SQLite builds without FTS5 matches with LIKE
+    ("Tasks.search_task_items_without_index",
+     lambda: LiatrisSQLCore.Tasks.search_task_items_without_index("call report"), {"LiatrisTasks"}),
+    ("SmartLists.produce_today", LiatrisSQLCore.SmartLists.produce_today, set()),
+    ("SmartLists.count_today", LiatrisSQLCore.SmartLists.count_today, set()),
+    ("SmartLists.produce_upcoming", lambda: LiatrisSQLCore.SmartLists.produce_upcoming(7), set()),
+    ("SmartLists.count_upcoming", lambda: LiatrisSQLCore.SmartLists.count_upcoming(7), set()),
+    ("SmartLists.produce_someday", LiatrisSQLCore.SmartLists.produce_someday, set()),
+    # Lists all archived items
+    ("SmartLists.produce_logbook", LiatrisSQLCore.SmartLists.produce_logbook, {"LiatrisArchivedItems"}),
+    ("SmartLists.produce_logbook_page", LiatrisSQLCore.SmartLists.produce_logbook_page, set()),
+    ("SmartLists.produce_logbook_page next",
+     lambda: LiatrisSQLCore.SmartLists.produce_logbook_page((datetime.now(), 10 ** 6)), set()),
+    ("SmartLists.produce_logbook_page task",
+     lambda: LiatrisSQLCore.SmartLists.produce_logbook_page(task_id=5), set()),
+    ("Items.get_item_states", lambda: LiatrisSQLCore.Items.get_item_states([1, 2, 3]), set()),
+    # The store loads the state of every item
+    ("Items.get_item_states all", LiatrisSQLCore.Items.get_item_states, {"LiatrisItems"}),
+    ("Items.get_item_rows", lambda: LiatrisSQLCore.Items.get_item_rows([1, 2, 3]), set()),
+    ("Items.get_item_by_id", lambda: LiatrisSQLCore.Items.get_item_by_id(4), set()),
+    ("Items.update_item", lambda: LiatrisSQLCore.Items.update_item(changed_item(5)), set()),
+    ("Items.mark_items", lambda: LiatrisSQLCore.Items.mark_items([6, 7, 8], True), set()),
+    ("Items.move_items", lambda: LiatrisSQLCore.Items.move_items([9, 10], 1), set()),
+    ("Items.set_items_date", lambda: LiatrisSQLCore.Items.set_items_date([11, 12], datetime.now()), set()),
+    ("Items.delete_items", lambda: LiatrisSQLCore.Items.delete_items([13, 14]), set()),
+    ("Items.delete_item", lambda: LiatrisSQLCore.Items.delete_item(15), set()),
+    ("ItemNotes.update_item_notes", lambda: LiatrisSQLCore.ItemNotes.update_item_notes({16: "Note", 17: ""}), set()),
+    ("ItemNotes.get_item_note_by_item_id", lambda: LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(16), set()),
+    ("ItemNotes.update_item_note", lambda: LiatrisSQLCore.ItemNotes.update_item_note(
+        LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(16)), set()),
+    ("ItemNotes.get_note_lengths", lambda: LiatrisSQLCore.ItemNotes.get_note_lengths(list(range(1, 50))), set()),
+    ("Archive.archive_completed", lambda: LiatrisSQLCore.Archive.archive_completed(30), set()),
+    # Counts all archived items
+    ("Archive.count_archived_items", LiatrisSQLCore.Archive.count_archived_items, {"LiatrisArchivedItems"}),
+    ("Archive.get_archived_item_states",
+     lambda: LiatrisSQLCore.Archive.get_archived_item_states(list(range(1, 50))), set()),
+    ("Archive.restore_items", lambda: LiatrisSQLCore.Items.mark_items(list(range(1, 50)), False), set()),
+    ("Archive.get_archived_item", lambda: LiatrisSQLCore.Archive.get_archived_item(1), set()),
+    ("Archive.get_archived_item_note", lambda: LiatrisSQLCore.Archive.get_archived_item_note(1), set()),
+    ("Tasks.delete_task", lambda: LiatrisSQLCore.Tasks.delete_task(6), set()),
+    # Exports every row
+    ("Transfer.export_records", lambda: consume(LiatrisSQLCore.Transfer.export_records()),
+     {"LiatrisTasks", "LiatrisItems", "LiatrisArchivedItems", "LiatrisItemNotes", "LiatrisArchivedItemNotes"}),
+    ("Transfer.import_records",
+     lambda: LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(2, 10)), set()),
+]
+
+
+# Returns the names of the tables the plan of a statement reads completely. Walking a table or an index in order
+# counts as well unless the statement has a LIMIT that stops it after one page, which it can not if the rows have to
+# be sorted first.
+def get_scanned_tables(connection, statement, parameters):
+    details = [detail for _, _, _, detail in connection.execute("EXPLAIN QUERY PLAN " + statement, parameters)]
+    paged = " LIMIT " in statement and not any("TEMP B-TREE FOR ORDER BY" in detail for detail in details)
+    scanned_tables = set()
+    for detail in details:
+        words = detail.split()
+        # Virtual tables are the full text indexes, which answer MATCH themselves
+        if words[0] != "SCAN" or "VIRTUAL" in words or words[1] == "CONSTANT" or words[1].startswith("(") or paged:
+            continue
+        scanned_tables.add(words[1].split(".")[-1])
+    return scanned_tables
+
+
+def test_queries_do_not_scan(engine, statements):
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(PROJECTS, ITEMS)) is not False
+    assert LiatrisSQLCore.insert(new_setting("TEST", "1"))
+    assert liatris_db.is_search_enabled()
+
+    connection = engine.raw_connection()
+    failures = []
+    try:
+        for name, call, scanned_by_design in CASES:
+            statements.clear()
+            assert call() is not False, name
+            assert len(statements) != 0, name
+            for statement, parameters in statements:
+                # Statements that only write values read nothing
+                if statement.split()[0].upper() not in ("SELECT", "INSERT", "UPDATE", "DELETE") or \
+                        statement.startswith("INSERT") and "SELECT" not in statement:
+                    continue
+                scanned_tables = get_scanned_tables(connection, statement, parameters) - scanned_by_design
+                if len(scanned_tables) != 0:
+                    failures.append(name + " scans " + ", ".join(sorted(scanned_tables)) + ": " + statement)
+    finally:
+        connection.close()
+    assert failures == []
+
+
+# Schema of the first version of Liatris, which had no indexes besides the primary keys
+FIRST_SCHEMA = [
+    'CREATE TABLE "LiatrisSettings" ("Key" VARCHAR NOT NULL, "Value" VARCHAR, PRIMARY KEY ("Key"))',
+    'CREATE TABLE "LiatrisTasks" ("TaskId" INTEGER NOT NULL, "TaskName" VARCHAR, PRIMARY KEY ("TaskId"))',
+    'CREATE TABLE "LiatrisItems" ("ItemId" INTEGER NOT NULL, "TaskId" INTEGER, "ItemIsDone" BOOLEAN, '
+    '"ItemTitle" VARCHAR, "ItemDate" DATETIME, PRIMARY KEY ("ItemId"))',
+    'CREATE TABLE "LiatrisItemNotes" ("NoteId" INTEGER NOT NULL, "ItemId" INTEGER, "NoteContent" TEXT, '
+    'PRIMARY KEY ("NoteId"), UNIQUE ("ItemId"))',
+    "INSERT INTO LiatrisTasks VALUES (1, 'Groceries')",
+    "INSERT INTO LiatrisItems VALUES (1, 1, 0, 'Buy milk', '2023-05-01 00:00:00.000000')",
+    "INSERT INTO LiatrisItems VALUES (2, 1, 1, 'Buy bread', NULL)",
+    "INSERT INTO LiatrisItemNotes VALUES (1, 1, 'Oat milk')"
+]
+
+
+def get_index_names(connection, table_name):
+    return {row[1] for row in connection.execute("PRAGMA index_list(" + table_name + ")")}
+
+
+def test_indexes_are_added_to_old_databases(database_dir):
+    connection = sqlite3.connect(liatris_db.DB_FILE)
+    for statement in FIRST_SCHEMA:
+        connection.execute(statement)
+    connection.commit()
+    connection.close()
+
+    engine = liatris_db.get_engine()
+    connection = engine.raw_connection()
+    try:
+        assert {"LiatrisItemsTaskIdIndex", "LiatrisItemsDoneDateIndex", "LiatrisItemsLogbookIndex"} <= \
+            get_index_names(connection, "LiatrisItems")
+        assert "LiatrisTasksNameKeyIndex" in get_index_names(connection, "LiatrisTasks")
+    finally:
+        connection.close()
+
+    assert [(item.ItemId, item.ItemIsDone) for item in LiatrisSQLCore.Tasks.produce_task_item_by_task_id(1).ITEMS] \
+        == [(1, False), (2, True)]
+    assert LiatrisSQLCore.ItemNotes.get_item_note_by_item_id(1).NoteContent == "Oat milk"
@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+from datetime import date, datetime
+
+import liatris_bench
+from liatris_db import LiatrisSQLCore
+from models.liatris_model_settings import LiatrisSetting
+
+ITEM_IDS = list(range(1, 51))
+
+
+# Reads every attribute a view shows
+def render(tasks, items):
+    return [(task.TaskId, task.TaskName) for task in tasks] + \
+        [(item.ItemId, item.TaskId, item.ItemIsDone, item.ItemTitle, item.ItemDate, item.ItemDoneDate)
+         for item in items]
+
+
+def check_types(items):
+    for item in items:
+        assert isinstance(item.TaskId, int)
+        assert isinstance(item.ItemIsDone, bool)
+        assert item.ItemDate is None or isinstance(item.ItemDate, datetime)
+        assert item.ItemDoneDate is None or isinstance(item.ItemDoneDate, datetime)
+
+
+# Loaded objects stay loaded across commits, and writes through LiatrisSQLCore update them in place. Rendering them
+# again must not read them one by one.
+def test_loaded_objects_are_not_read_again_after_commits(engine, statements):
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(5, len(ITEM_IDS))) is not False
+    tasks = LiatrisSQLCore.Tasks.search_tasks("")
+    items = [LiatrisSQLCore.Items.get_item_by_id(item_id) for item_id in ITEM_IDS]
+    render(tasks, items)
+
+    setting = LiatrisSetting()
+    setting.Key = "TEST"
+    setting.Value = "1"
+    renamed_task = tasks[0]
+    renamed_task.TaskName = "Renamed project"
+    toggled_item = items[0]
+    toggled_item.ItemIsDone = not toggled_item.ItemIsDone
+    writes = [
+        ("insert", lambda: LiatrisSQLCore.insert(setting)),
+        ("Tasks.update_task", lambda: LiatrisSQLCore.Tasks.update_task(renamed_task)),
+        ("Items.update_item", lambda: LiatrisSQLCore.Items.update_item(toggled_item)),
+        ("Items.mark_items", lambda: LiatrisSQLCore.Items.mark_items(ITEM_IDS, True)),
+        ("Items.move_items", lambda: LiatrisSQLCore.Items.move_items(ITEM_IDS, 2)),
+        ("Items.set_items_date", lambda: LiatrisSQLCore.Items.set_items_date(ITEM_IDS, date.today())),
+        ("ItemNotes.update_item_notes", lambda: LiatrisSQLCore.ItemNotes.update_item_notes({1: "Note"})),
+        ("Items.mark_items undone", lambda: LiatrisSQLCore.Items.mark_items(ITEM_IDS[:10], False)),
+    ]
+    for name, write in writes:
+        assert write(), name
+        statements.clear()
+        render(tasks, items)
+        assert statements == [], name
+        check_types(items)
+
+    assert tasks[0].TaskName == "Renamed project"
+    assert all(item.TaskId == 2 for item in items)
+    assert all(item.ItemDate == datetime.combine(date.today(), datetime.min.time()) for item in items)
+    assert [item.ItemIsDone for item in items] == [False] * 10 + [True] * 40
+    assert all(item.ItemDoneDate is None for item in items[:10])
+    assert all(item.ItemDoneDate is not None for item in items[10:])
+
+
+# Marking items done again keeps the date on which they were completed
+def test_mark_items_keeps_completion_dates(engine):
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(1, 2, done_ratio=0)) is not False
+    item = LiatrisSQLCore.Items.get_item_by_id(1)
+    assert LiatrisSQLCore.Items.mark_items([1], True)
+    item_done_date = item.ItemDoneDate
+    assert isinstance(item_done_date, datetime)
+
+    assert LiatrisSQLCore.Items.mark_items([1, 2], True)
+    assert LiatrisSQLCore.Items.update_item(item)
+    assert item.ItemDoneDate == item_done_date
+    assert LiatrisSQLCore.Items.get_item_by_id(2).ItemDoneDate >= item_done_date
@@ -0,0 +1,38 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import liatris_bench
+from liatris_db import LiatrisSQLCore
+from models.liatris_model_tasks import LiatrisTask
+
+
+# The statement count of produce_all_task_items must not grow with the number of projects
+def test_produce_all_task_items_runs_one_statement(engine, statements):
+    project_count = 0
+    for projects in (1, 10, 100, 1000):
+        assert LiatrisSQLCore.Transfer.import_records(
+            liatris_bench.generate_records(projects, projects * 3, seed=projects)) is not False
+        project_count += projects
+
+        statements.clear()
+        task_items = LiatrisSQLCore.Tasks.produce_all_task_items()
+        assert len(statements) == 1
+        assert len(task_items) == project_count
+        assert sum(len(task_item.ITEMS) for task_item in task_items) == project_count * 3
+
+
+def test_search_tasks_returns_tasks_for_every_key(engine):
+    assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(12, 0)) is not False
+
+    for search_key, limit, task_ids in (("", None, list(range(1, 13))), ("", 3, [1, 2, 3]),
+                                        ("PROJECT 1", None, [1, 10, 11, 12]), ("ject 2", None, [2])):
+        tasks = LiatrisSQLCore.Tasks.search_tasks(search_key, limit)
+        assert all(isinstance(task, LiatrisTask) for task in tasks)
+        assert [task.TaskId for task in tasks] == task_ids
+
+
+def test_search_tasks_fails_without_raising(engine):
+    with engine.begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE LiatrisTasks RENAME TO LiatrisTasksMoved")
+    assert LiatrisSQLCore.Tasks.search_tasks("") is False
+    assert LiatrisSQLCore.Tasks.search_tasks("project") is False
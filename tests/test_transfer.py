@@ -0,0 +1,73 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import sqlite3
+
+import pytest
+
+import liatris_bench
+import liatris_db
+from liatris_db import LiatrisSQLCore
+
+
+def get_trigger_names(connection):
+    return {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+
+# Yields the records and checks from another connection, like another process would, what it sees halfway through
+def records_checked_halfway(records, checks):
+    records = list(records)
+    yield from records[:len(records) // 2]
+    connection = sqlite3.connect(liatris_db.DB_FILE, timeout=0)
+    try:
+        checks["Triggers"] = get_trigger_names(connection)
+        try:
+            connection.execute("INSERT INTO LiatrisTasks (TaskName) VALUES ('Written during the import')")
+            connection.commit()
+        except sqlite3.OperationalError as error:
+            checks["WriteError"] = str(error)
+    finally:
+        connection.close()
+    yield from records[len(records) // 2:]
+
+
+def test_import_keeps_the_triggers_for_other_connections(engine):
+    with engine.connect() as connection:
+        triggers = get_trigger_names(connection.connection.dbapi_connection)
+    assert set(liatris_db.CHANGE_INSERT_TRIGGERS + liatris_db.SEARCH_INSERT_TRIGGERS) <= triggers
+
+    checks = {}
+    records = records_checked_halfway(liatris_bench.generate_records(10, 100), checks)
+    assert LiatrisSQLCore.Transfer.import_records(records, batch_size=10) is not False
+    # The triggers were only dropped inside the transaction of the import, which other connections had to wait for
+    assert checks["Triggers"] == triggers
+    assert "locked" in checks["WriteError"]
+
+    with engine.connect() as connection:
+        assert get_trigger_names(connection.connection.dbapi_connection) == triggers
+        assert connection.exec_driver_sql("SELECT count(*) FROM LiatrisSearch").scalar() == 100
+
+
+def test_failed_import_keeps_the_triggers(engine):
+    with engine.connect() as connection:
+        triggers = get_trigger_names(connection.connection.dbapi_connection)
+
+    def records():
+        yield from liatris_bench.generate_records(2, 10)
+        raise ValueError("Broken dump")
+
+    with pytest.raises(ValueError):
+        LiatrisSQLCore.Transfer.import_records(records(), batch_size=5)
+
+    # Another connection holds the write lock
+    connection = sqlite3.connect(liatris_db.DB_FILE)
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        assert LiatrisSQLCore.Transfer.import_records(liatris_bench.generate_records(2, 10)) is False
+    finally:
+        connection.rollback()
+        connection.close()
+
+    with engine.connect() as connection:
+        assert get_trigger_names(connection.connection.dbapi_connection) == triggers
+        assert connection.exec_driver_sql("SELECT count(*) FROM LiatrisItems").scalar() == 0
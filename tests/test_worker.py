@@ -0,0 +1,42 @@
+# SPDX-FileCopyrightText: Copyright © 2023 nixcapra
+# SPDX-License-Identifier: MIT
+
+import liatris_worker
+
+
+def fail_to_load():
+    raise RuntimeError("database is locked")
+
+
+def dispatch(function, *args):
+    function(*args)
+
+
+# A call that raises reaches the callback as False and its error and traceback are written to stderr
+def test_errors_are_reported(capsys):
+    results = []
+    worker = liatris_worker.LiatrisDbWorker(dispatch)
+    try:
+        worker.submit(fail_to_load, (), results.append)
+        worker.submit(fail_to_load)
+    finally:
+        # LiatrisDbWorker.shutdown would cancel a call that has not started yet
+        worker.executor.shutdown(wait=True)
+
+    assert results == [False]
+    stderr = capsys.readouterr().err
+    assert stderr.count("Error: fail_to_load failed") == 2
+    assert stderr.count("Traceback (most recent call last):") == 2
+    assert stderr.count("RuntimeError: database is locked") == 2
+
+
+def test_results_reach_the_callback(capsys):
+    results = []
+    worker = liatris_worker.LiatrisDbWorker(dispatch)
+    try:
+        worker.submit(len, ([1, 2, 3],), results.append)
+    finally:
+        worker.executor.shutdown(wait=True)
+
+    assert results == [3]
+    assert capsys.readouterr().err == ""